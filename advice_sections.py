@@ -0,0 +1,174 @@
+"""
+Section-level caching for the general nursing advice
+
+The nursing advice has six sections, and each one only depends on some of the
+patient details: the caring guidance doesn't change when the treatment start
+date moves, for instance. Each section is cached on its own, keyed on the fields
+and recovery phases it declares in `depends_on`, so after an edit only the
+affected sections are asked for again and stitched back in with the rest.
+"""
+
+import re
+import threading
+import time
+from collections import namedtuple
+
+import response_cache
+
+Section = namedtuple("Section", "key heading guidance depends_on")
+
+# The sections in reply order, with the patient details (prompts.CONTEXT_FIELDS) each depends on
+SECTIONS = (
+    Section("patient_stage_assessment", "PATIENT STAGE ASSESSMENT",
+            "What stage of recovery/treatment is this patient currently in? Consider whether treatment has started yet.",
+            ("age", "diagnosis", "operation_description", "operation_phase", "treatment_details", "treatment_status")),
+    Section("carer_expectations", "CARER EXPECTATIONS",
+            "What should the carer expect during this stage? Focus on the current situation (pre-treatment, starting treatment, or ongoing treatment).",
+            ("diagnosis", "operation_description", "operation_phase", "treatment_details", "treatment_status")),
+    Section("caring_guidance", "CARING GUIDANCE",
+            "Specific ways the carer can help the patient, including daily care activities appropriate for current stage, monitoring signs to watch for, comfort measures, medication management (if applicable) and mobility and activity recommendations.",
+            ("gender", "age", "diagnosis", "operation_description", "operation_phase", "treatment_details")),
+    Section("warning_signs", "WARNING SIGNS",
+            "Red flags or symptoms that require immediate medical attention.",
+            ("age", "diagnosis", "operation_description", "operation_phase", "treatment_details", "treatment_status")),
+    Section("recovery_timeline", "RECOVERY TIMELINE",
+            "Expected progression and milestones, considering treatment timing.",
+            ("diagnosis", "operation_description", "operation_phase", "treatment_status")),
+    Section("emotional_support", "EMOTIONAL SUPPORT",
+            "How to provide psychological support to the patient.",
+            ("gender", "age", "diagnosis", "operation_phase", "treatment_status")),
+)
+
+# Sections that are never served stale: in stale-while-revalidate mode they are
+# regenerated before the advice is shown
+ALWAYS_REFRESH = ("warning_signs",)
+
+_HEADING = re.compile(
+    r"^[ \t]*(?:#+[ \t]*)?(?:\d+\.[ \t]*)?\*\*(" + "|".join(re.escape(section.heading) for section in SECTIONS) + r")\*\*:?[ \t]*",
+    re.MULTILINE,
+)
+_KEY_BY_HEADING = {section.heading: section.key for section in SECTIONS}
+
+def context(record):
+    """The values sections can depend on, from a PatientRecord"""
+    timeline = record.timeline or {}
+    return {
+        "gender": record.gender,
+        "age": record.age,
+        "diagnosis": record.diagnosis,
+        "operation_description": record.operation_description,
+        "operation_phase": timeline.get("operation_phase"),
+        "treatment_details": record.treatment_details,
+        "treatment_status": timeline.get("treatment_status"),
+    }
+
+def section_keys(record, model, temperature, prompt_version=None):
+    """Cache key of every section for a patient: only the details a section depends on go into its key"""
+    values = context(record)
+    keys = {}
+    for section in SECTIONS:
+        depends = {name: response_cache.normalize_text(values[name]) for name in section.depends_on}
+        keys[section.key] = response_cache.make_key(f"section:{section.key}", depends, None, model, None, temperature, prompt_version)
+    return keys
+
+def parse_windows(text):
+    """Parse per-section staleness windows such as "recovery_timeline=3600,emotional_support=604800" """
+    windows = {}
+    known = {section.key for section in SECTIONS}
+    for part in (text or "").split(","):
+        if not part.strip():
+            continue
+        key, _, seconds = part.partition("=")
+        key = key.strip()
+        if key not in known:
+            raise ValueError(f"Unknown advice section in STALE_AFTER_SECTION: {key}")
+        if key in ALWAYS_REFRESH:
+            raise ValueError(f"{key} is always regenerated and can't be given a staleness window")
+        windows[key] = float(seconds)
+    return windows
+
+def stale_windows(default_seconds, overrides=None):
+    """
+    How old each section may get before it is refreshed: overrides by section key and
+    the default for the rest. Sections in ALWAYS_REFRESH have no window.
+    """
+    overrides = overrides or {}
+    return {
+        section.key: overrides.get(section.key, default_seconds)
+        for section in SECTIONS if section.key not in ALWAYS_REFRESH
+    }
+
+def instructions(keys):
+    """The numbered list of sections to write, for the section prompt"""
+    return "\n\n".join(
+        f"{number}. **{section.heading}**: {section.guidance}"
+        for number, section in enumerate(SECTIONS, 1) if section.key in keys
+    )
+
+def split(text):
+    """
+    Pull the sections out of a reply (complete or still streaming), by their headings
+
+    Returns {section key: text}; anything before the first heading is ignored.
+    """
+    matches = list(_HEADING.finditer(text or ""))
+    sections = {}
+    for match, following in zip(matches, matches[1:] + [None]):
+        end = following.start() if following else len(text)
+        body = text[match.end():end].strip()
+        if body:
+            sections[_KEY_BY_HEADING[match.group(1)]] = body
+    return sections
+
+def stitch(sections):
+    """Put sections back together in order, numbered and headed like a full reply"""
+    return "\n\n".join(
+        f"{number}. **{section.heading}**: {sections[section.key]}"
+        for number, section in enumerate(SECTIONS, 1) if section.key in sections
+    )
+
+class SectionCache:
+    """
+    Advice sections stored one per entry in a response cache
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, keys, stale_after=None):
+        """
+        Return ({section key: cached text}, [section keys to generate], {stale section key: age})
+
+        With stale_after (seconds by section key), cached sections older than that are
+        returned and also listed as stale, with their age in seconds. Sections without
+        a window in it are never served stale, so they are always listed to generate.
+        """
+        cached = {}
+        stale = {}
+        now = time.time()
+        for section in SECTIONS:
+            if stale_after is not None and section.key not in stale_after:
+                continue
+            # Counted once, as a section lookup, rather than also as a response cache lookup
+            entry = self.cache.get_entry(keys[section.key], count=False)
+            if entry is None:
+                continue
+            cached[section.key], stored_at = entry
+            if stale_after is not None and now - stored_at > stale_after[section.key]:
+                stale[section.key] = now - stored_at
+        missing = [section.key for section in SECTIONS if section.key not in cached]
+        with self._lock:
+            self.hits += len(cached)
+            self.misses += len(missing)
+        return cached, missing, stale
+
+    def store(self, keys, sections):
+        for name, text in sections.items():
+            self.cache.set(keys[name], text)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
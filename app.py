@@ -1,787 +1,1390 @@
-import gradio as gr
-from datetime import datetime, date
+"""
+Advice, caching and persistence for the patient care system
+
+Importing this module is quick: the OpenAI clients are created on first use
+and the Gradio interface lives in ui.py, built only when the app is launched
+or app.app is first used. Run `python app.py` to start the interface.
+"""
+
+import asyncio
 import json
+import logging
 import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
 from dotenv import load_dotenv
-from openai import OpenAI
-import glob
+import prompts
+import combined_advice
+import advice_sections
+from patient_record import PatientRecord
+import response_cache
+import patient_store
+import semantic_cache
+import single_flight
+import fan_out
+import token_budget
+import resilience
+import rate_limiter
+import metrics
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+logger = logging.getLogger("carer.advice")
+
+# Point the clients at another OpenAI-compatible server, e.g. the local mock_openai_server.py
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
+# Stream replies into the UI token by token (set STREAM_RESPONSES=false to wait for the full reply)
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() not in ("0", "false", "no", "off")
+
+# Run the advice handlers on the event loop instead of one worker thread per request
+ASYNC_HANDLERS = os.getenv("ASYNC_HANDLERS", "true").lower() not in ("0", "false", "no", "off")
 
-def get_nursing_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date):
+# Shared HTTP connection pool for the async client
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "200"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "50"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))
+
+# OpenAI clients, created on first use by get_client() / get_async_client() (tests swap in fakes here)
+client = None
+async_client = None
+_client_lock = threading.Lock()
+
+def get_client():
     """
-    Get AI-powered nursing advice based on patient information
+    The sync OpenAI client (retries are handled by the resilience layer below)
     """
-    try:
-        # Calculate days since operation and treatment start
-        op_date = datetime.strptime(operation_date, "%Y-%m-%d").date()
-        treat_date = datetime.strptime(treatment_start_date, "%Y-%m-%d").date()
-        today = date.today()
-        
-        days_since_op = (today - op_date).days
-        
-        # Determine treatment status
-        if treat_date > today:
-            days_until_treatment = (treat_date - today).days
-            treatment_status = f"Treatment starts in {days_until_treatment} days (future)"
-        elif treat_date == today:
-            treatment_status = "Treatment starts today"
-        else:
-            days_since_treatment = (today - treat_date).days
-            treatment_status = f"Treatment started {days_since_treatment} days ago (ongoing)"
-        
-        # Create comprehensive prompt for AI nurse
-        prompt = f"""
-You are an experienced senior nurse with the knowledge of a senior consultant. Based on the following patient information, provide comprehensive nursing advice for the carer.
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                from openai import OpenAI
+                client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=OPENAI_BASE_URL, max_retries=0)
+    return client
 
-PATIENT INFORMATION:
-- Gender: {gender}
-- Age: {age} years
-- Primary Diagnosis: {diagnosis}
-- Operation: {operation_description}
-- Operation Date: {operation_date} ({days_since_op} days ago)
-- Treatment Details: {treatment_details}
-- Treatment Start Date: {treatment_start_date} - {treatment_status}
+def get_async_client():
+    """
+    The async OpenAI client with its shared HTTP connection pool
+    """
+    global async_client
+    if async_client is None:
+        with _client_lock:
+            if async_client is None:
+                import httpx
+                from openai import AsyncOpenAI
+                async_client = AsyncOpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    base_url=OPENAI_BASE_URL,
+                    max_retries=0,
+                    timeout=OPENAI_TIMEOUT,
+                    http_client=httpx.AsyncClient(
+                        limits=httpx.Limits(
+                            max_connections=OPENAI_MAX_CONNECTIONS,
+                            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS
+                        ),
+                        timeout=OPENAI_TIMEOUT
+                    )
+                )
+    return async_client
 
-Please provide advice in the following structure:
+# Deadlines, retries with jittered backoff, a circuit breaker and optional hedging for every AI call
+upstream = resilience.Resilience(
+    max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "3")),
+    deadline=float(os.getenv("OPENAI_DEADLINE", "90")),
+    breaker=resilience.CircuitBreaker(
+        failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+        reset_seconds=float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+    ),
+    hedge=os.getenv("HEDGE_REQUESTS", "false").lower() not in ("0", "false", "no", "off"),
+    hedge_percentile=float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+)
 
-1. **PATIENT STAGE ASSESSMENT**: What stage of recovery/treatment is this patient currently in? Consider whether treatment has started yet.
+# Requests and tokens per minute, shared by every thread and process that calls the API
+rate_limit = rate_limiter.from_env()
 
-2. **CARER EXPECTATIONS**: What should the carer expect during this stage? Focus on the current situation (pre-treatment, starting treatment, or ongoing treatment).
+# Model settings shared by every advice request
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4")
+TEMPERATURE = 0.7
 
-3. **CARING GUIDANCE**: Specific ways the carer can help the patient, including:
-   - Daily care activities appropriate for current stage
-   - Monitoring signs to watch for
-   - Comfort measures
-   - Medication management (if applicable)
-   - Mobility and activity recommendations
+# Reply length per call type (full assessments vs answers to questions); prompt fields are
+# trimmed to their token budgets and every call's token counts are logged
+ASSESSMENT_MAX_TOKENS = token_budget.COMPLETION_TOKENS["assessment"]
+ANSWER_MAX_TOKENS = token_budget.COMPLETION_TOKENS["answer"]
+COMBINED_MAX_TOKENS = token_budget.COMPLETION_TOKENS["combined"]
 
-4. **WARNING SIGNS**: Red flags or symptoms that require immediate medical attention
+# Get the general, patient and carer advice from one call that returns all three as JSON
+COMBINED_ADVICE = os.getenv("COMBINED_ADVICE", "false").lower() not in ("0", "false", "no", "off")
+token_usage = token_budget.TokenUsage()
 
-5. **RECOVERY TIMELINE**: Expected progression and milestones, considering treatment timing
+# Cache replies so reloading the same patient doesn't call the model again
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "true").lower() not in ("0", "false", "no", "off")
+advice_cache = response_cache.ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "512")),
+    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", "2592000")),
+    disk_path=os.getenv("RESPONSE_CACHE_PATH") or None,
+    max_disk_entries=int(os.getenv("RESPONSE_CACHE_DISK_SIZE", "10000"))
+)
 
-6. **EMOTIONAL SUPPORT**: How to provide psychological support to the patient
+# Cache the general nursing advice section by section, so editing one field only
+# regenerates the sections that depend on it
+SECTION_CACHE_ENABLED = os.getenv("SECTION_CACHE", "false").lower() not in ("0", "false", "no", "off")
+section_cache = advice_sections.SectionCache(advice_cache)
 
-IMPORTANT: Tailor your advice based on whether treatment has started, is starting today, or is scheduled for the future. Provide appropriate guidance for the current phase.
-"""
+# Serve saved advice older than its staleness window straight away, marked with its age,
+# and refresh it in the background; the warning signs are always refreshed
+STALE_WHILE_REVALIDATE = os.getenv("STALE_WHILE_REVALIDATE", "false").lower() not in ("0", "false", "no", "off")
+STALE_AFTER_SECONDS = float(os.getenv("STALE_AFTER_SECONDS", "86400"))
+STALE_AFTER_SECTION = advice_sections.parse_windows(os.getenv("STALE_AFTER_SECTION", ""))
 
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are an experienced senior nurse with extensive clinical knowledge. Provide practical, evidence-based nursing advice for patient carers."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1500,
-            temperature=0.7
-        )
-        
-        return response.choices[0].message.content
-        
-    except Exception as e:
-        return f"❌ Error getting AI advice: {str(e)}\n\nPlease check your OpenAI API key and internet connection."
+# Reuse answers to reworded questions about the same patient and phase
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE", "true").lower() not in ("0", "false", "no", "off")
+question_cache = semantic_cache.SemanticQuestionCache(
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.8")),
+    max_per_scope=int(os.getenv("SEMANTIC_CACHE_SIZE", "200"))
+)
 
-def collect_patient_info(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date):
+# Patient records: JSON files in saved_data/ plus an index for fast listing and search,
+# opened on first use by get_store() (tests swap in a store of their own here)
+store = None
+_store_lock = threading.Lock()
+
+def get_store():
     """
-    Collect and process patient information
+    The patient store, created on first use so importing the app doesn't touch the disk
     """
-    # Validate inputs
-    if not all([gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date]):
-        return "Please fill in all fields before submitting.", None, "Please complete all fields to get AI nursing advice."
-    
-    # Create patient record
-    patient_record = {
+    global store
+    if store is None:
+        with _store_lock:
+            if store is None:
+                store = patient_store.PatientStore(
+                    os.getenv("PATIENT_DATA_DIR", "saved_data"),
+                    history_max_bytes=int(os.getenv("ADVICE_HISTORY_MAX_BYTES", "262144"))
+                )
+    return store
+
+SAVED_FILES_LIMIT = int(os.getenv("SAVED_FILES_LIMIT", "200"))
+
+# Keep every generated advice and answer in the patient's history in the store, so loading
+# a patient brings its latest advice back without another AI call
+ADVICE_HISTORY = os.getenv("ADVICE_HISTORY", "true").lower() not in ("0", "false", "no", "off")
+
+# Identical requests already in flight share one upstream call (double clicks, several devices)
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "true").lower() not in ("0", "false", "no", "off")
+request_flights = single_flight.SingleFlight()
+async_request_flights = single_flight.AsyncSingleFlight()
+
+# Generate the general, patient and carer advice together when a patient is submitted,
+# with a cap on how many of these fan-outs run at once
+PREFETCH_ADVICE = os.getenv("PREFETCH_ADVICE", "false").lower() not in ("0", "false", "no", "off")
+advice_fan_outs = fan_out.FanOutPool(max_concurrent=int(os.getenv("PREFETCH_MAX_CONCURRENT", "4")))
+
+# Counters the components above keep anyway, read when /metrics is scraped
+def _cache_lookups():
+    lookups = {}
+    for name, cache in (("response", advice_cache), ("semantic", question_cache)):
+        stats = cache.stats()
+        lookups[(name, "hit")] = stats["hits"]
+        lookups[(name, "miss")] = stats["misses"]
+    stats = section_cache.stats()
+    lookups[("section", "hit")] = stats["hits"]
+    lookups[("section", "miss")] = stats["misses"]
+    stats = prompts.prefix_cache_stats()
+    lookups[("prompt_prefix", "hit")] = stats["hits"]
+    lookups[("prompt_prefix", "miss")] = stats["misses"]
+    return lookups
+
+metrics.registry.collect("carer_cache_lookups_total", "Response, similar-question and prompt prefix cache lookups", _cache_lookups, ("cache", "result"), kind="counter")
+metrics.registry.collect("carer_coalesced_requests_total", "AI requests that shared an identical request already in flight",
+                         lambda: request_flights.stats()["coalesced"] + async_request_flights.stats()["coalesced"], kind="counter")
+metrics.registry.collect("carer_prefetch_fan_outs_total", "Advice prefetches on submit, started or skipped because too many were running",
+                         lambda: {(result,): advice_fan_outs.stats()[result] for result in ("started", "skipped")}, ("result",), kind="counter")
+metrics.registry.collect("carer_resilience_events_total", "AI calls, attempts, retries, failures, deadlines and hedges",
+                         lambda: {(name,): value for name, value in upstream.stats().items() if name != "breaker"}, ("event",), kind="counter")
+metrics.registry.collect("carer_circuit_breaker_open", "1 while the circuit breaker is rejecting AI calls",
+                         lambda: int(upstream.breaker.state != resilience.CircuitBreaker.CLOSED))
+metrics.registry.collect("carer_rate_limit_waiting", "AI calls queued for rate limit quota on this host", lambda: rate_limit.stats()["waiting"])
+metrics.registry.collect("carer_rate_limit_wait_seconds_total", "Time AI calls in this process spent waiting for quota",
+                         lambda: rate_limit.waited_seconds, kind="counter")
+
+def _error_message(label, error):
+    """Format an AI error in the same way for blocking and streaming calls"""
+    return f"❌ Error getting {label}: {str(error)}\n\nPlease check your OpenAI API key and internet connection."
+
+def _cache_key(persona, patient_args, max_tokens, record=None):
+    """
+    Cache key for one advice request: persona, patient details, question and model settings
+
+    The patient details go in as the PatientRecord's content hash, in which dates are
+    replaced by their recovery phases, so the key only changes when the patient moves
+    into a new phase, not every day. Pass the call's record to reuse its hash. The
+    prompt version the patient gets is part of the key too.
+    """
+    if record is None:
+        record = PatientRecord(*patient_args[:7])
+    question = patient_args[7] if len(patient_args) > 7 else None
+    version = prompts.choose_version(record.content_hash)
+    return response_cache.make_key(persona, record.content_hash, question, OPENAI_MODEL, max_tokens, TEMPERATURE, version)
+
+def _stale_after(persona):
+    """
+    Seconds before a saved reply for this persona is refreshed, or None when it never is
+
+    The general nursing advice holds every section, so it goes stale as soon as its
+    shortest-lived section does; the warning signs in it are never shown stale, so a
+    stale reply is regenerated before it is served (see _cached_reply). Answers to
+    questions and the combined document aren't served stale.
+    """
+    if not STALE_WHILE_REVALIDATE or persona not in ("nursing", "patient_advice", "carer_advice"):
+        return None
+    if persona == "nursing":
+        return min(advice_sections.stale_windows(STALE_AFTER_SECONDS, STALE_AFTER_SECTION).values())
+    return STALE_AFTER_SECONDS
+
+def _format_age(seconds):
+    """How long ago, in words: "5 minutes", "3 hours", "2 days" """
+    for unit, size in (("day", 86400), ("hour", 3600), ("minute", 60)):
+        if seconds >= size:
+            count = int(seconds // size)
+            return f"{count} {unit}{'s' if count != 1 else ''}"
+    return "less than a minute"
+
+def _stale_notice(age):
+    return f"🕒 Showing saved advice from {_format_age(age)} ago while it is refreshed.\n\n"
+
+def _refresh_failed_notice(age):
+    return f"⚠️ Showing saved advice from {_format_age(age)} ago - it couldn't be refreshed just now.\n\n"
+
+def _cached_reply(persona, patient_args, record, max_tokens, use_cache):
+    """
+    Return (key, cached reply, age) - the key is None when caching is off for this request
+
+    The age is the cached reply's age in seconds when it is past its staleness window
+    and should be refreshed, otherwise None. A stale general nursing reply is treated
+    as a miss instead, since its warning signs are never served stale. Questions that
+    miss the exact cache fall back to a similar earlier question about the same
+    patient context.
+    """
+    if not use_cache or not (RESPONSE_CACHE_ENABLED or SEMANTIC_CACHE_ENABLED):
+        return None, None, None
+    key = _cache_key(persona, patient_args, max_tokens, record)
+    entry = advice_cache.get_entry(key) if RESPONSE_CACHE_ENABLED else None
+    cached, age = entry[0] if entry else None, None
+    stale_after = _stale_after(persona) if len(patient_args) == 7 else None
+    if entry and stale_after is not None and time.time() - entry[1] > stale_after:
+        if persona == "nursing":
+            cached = None
+        else:
+            age = time.time() - entry[1]
+            if metrics.ENABLED:
+                metrics.stale_replies.inc(persona, "served")
+
+    if cached is None and SEMANTIC_CACHE_ENABLED and len(patient_args) > 7:
+        match = question_cache.lookup(_cache_key(persona, patient_args[:7], max_tokens, record), patient_args[7])
+        if match:
+            answer, asked, _ = match
+            cached = f"💡 Answered from a similar earlier question: \"{asked}\"\n\n{answer}"
+
+    return key, cached, age
+
+def _store_reply(key, persona, patient_args, record, max_tokens, text):
+    """
+    Remember a finished reply in the response cache and, for questions, the similarity cache
+    """
+    if RESPONSE_CACHE_ENABLED:
+        advice_cache.set(key, text)
+    if SEMANTIC_CACHE_ENABLED and len(patient_args) > 7:
+        question_cache.add(_cache_key(persona, patient_args[:7], max_tokens, record), patient_args[7], text)
+
+def _remember_advice(persona, record, question, request, text, started):
+    """
+    Append a newly generated reply to the advice history of each saved record with
+    these patient details
+
+    Advice for details that aren't saved in the store isn't kept. Token counts are
+    estimated from the request and reply, and the latency runs from when the request
+    was built. Saving history never fails the advice call.
+    """
+    if not ADVICE_HISTORY or not text or text.startswith("❌"):
+        return
+    entry = {
         "timestamp": datetime.now().isoformat(),
-        "gender": gender,
-        "age": int(age),
-        "diagnosis": diagnosis,
-        "operation": {
-            "description": operation_description,
-            "date": operation_date
-        },
-        "treatment": {
-            "details": treatment_details,
-            "start_date": treatment_start_date
-        }
+        "persona": persona,
+        "question": question,
+        "details_hash": record.details_hash,
+        "prompt_version": prompts.choose_version(record.content_hash),
+        "model": request["model"],
+        "prompt_tokens": token_budget.count_message_tokens(request["messages"], request["model"]),
+        "completion_tokens": token_budget.count_tokens(text, request["model"]),
+        "latency_seconds": round(time.perf_counter() - started, 3),
+        "advice": text,
     }
-    
-    # Convert to JSON for display
-    json_output = json.dumps(patient_record, indent=2)
-    
-    # Success message
-    success_msg = f"✅ Patient information collected successfully!\n\nPatient: {gender}, Age {age}\nDiagnosis: {diagnosis}\nOperation Date: {operation_date}\nTreatment Start: {treatment_start_date}"
-    
-    # Get AI nursing advice
-    ai_advice = get_nursing_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date)
-    
-    return success_msg, json_output, ai_advice
+    try:
+        patients = get_store()
+        for filename in patients.filenames_for_details(record.details_hash):
+            patients.append_history(filename, entry)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning("Couldn't save %s advice to the history: %s", persona, e)
 
-def get_patient_focused_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date):
+def _reply_keeper(key, persona, patient_args, record, max_tokens, request):
     """
-    Get AI-powered advice focused on the patient's perspective
+    Return a function that keeps a finished reply for this request: in the response
+    caches when key is set, and in the patient's advice history
+    """
+    started = time.perf_counter()
+    question = patient_args[7] if len(patient_args) > 7 else None
+
+    def keep(text):
+        if key:
+            _store_reply(key, persona, patient_args, record, max_tokens, text)
+        _remember_advice(persona, record, question, request, text, started)
+
+    return keep
+
+def _prepare(persona, build_messages, patient_args):
+    """
+    Build an advice call's PatientRecord and its prompt
+
+    Returns (arguments, record, messages); the arguments are the record's cleaned
+    fields plus any question. The record keeps the fields as entered, so cache keys
+    and the advice history match the saved record; only the prompt gets the free
+    text trimmed to budget. It reuses the record's timeline and uses the prompt
+    version chosen for this patient.
+    """
+    record = PatientRecord(*patient_args[:7])
+    patient_args = record.form_fields() + tuple(patient_args[7:])
+    version = prompts.choose_version(record.content_hash)
+    if metrics.ENABLED:
+        metrics.prompt_versions.inc(persona, version)
+    prompt_args = token_budget.fit_fields(patient_args, OPENAI_MODEL)
+    return patient_args, record, build_messages(*prompt_args, timeline=record.timeline, version=version)
+
+def _completion_request(messages, max_tokens):
     """
+    The chat completion arguments shared by every advice request
+
+    max_tokens is reduced if the prompt leaves less room than that in the context window.
+    """
+    prompt_tokens = token_budget.count_message_tokens(messages, OPENAI_MODEL)
+    max_tokens = token_budget.completion_budget(max_tokens, prompt_tokens, OPENAI_MODEL)
+    return {"model": OPENAI_MODEL, "messages": messages, "max_tokens": max_tokens, "temperature": TEMPERATURE}
+
+def _record_usage(persona, request, text, usage=None, started=None):
+    """Log the prompt and completion tokens of one upstream call and record its metrics"""
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or token_budget.count_message_tokens(request["messages"], request["model"])
+    completion_tokens = getattr(usage, "completion_tokens", None) or token_budget.count_tokens(text, request["model"])
+    token_usage.record(persona, prompt_tokens, completion_tokens, request["max_tokens"])
+    if started is not None:
+        metrics.record_upstream(persona, request["model"], time.perf_counter() - started, prompt_tokens, completion_tokens)
+
+def _request_cost(request):
+    """Tokens one request counts against the per-minute token limit"""
+    return rate_limiter.estimate_request_tokens(request["messages"], request["max_tokens"], request["model"])
+
+def _create(request, timeout, **options):
+    """Wait for rate limit quota, then send one request with the sync client"""
+    rate_limit.acquire(_request_cost(request), timeout=timeout)
+    return get_client().chat.completions.create(**request, timeout=timeout, **options)
+
+async def _acreate(request, timeout, **options):
+    """Async version of _create using the pooled async client"""
+    await rate_limit.aacquire(_request_cost(request), timeout=timeout)
+    return await get_async_client().chat.completions.create(**request, timeout=timeout, **options)
+
+def _complete(request, persona):
+    """Send one request and return the whole reply"""
+    started = time.perf_counter()
     try:
-        # Calculate days since operation and treatment start
-        op_date = datetime.strptime(operation_date, "%Y-%m-%d").date()
-        treat_date = datetime.strptime(treatment_start_date, "%Y-%m-%d").date()
-        today = date.today()
-        
-        days_since_op = (today - op_date).days
-        
-        # Determine treatment status
-        if treat_date > today:
-            days_until_treatment = (treat_date - today).days
-            treatment_status = f"Treatment starts in {days_until_treatment} days (future)"
-        elif treat_date == today:
-            treatment_status = "Treatment starts today"
-        else:
-            days_since_treatment = (today - treat_date).days
-            treatment_status = f"Treatment started {days_since_treatment} days ago (ongoing)"
-        
-        # Create patient-focused prompt
-        prompt = f"""
-You are an experienced senior nurse speaking directly to a patient. Based on the following patient information, provide encouraging, empowering advice that helps the patient understand their situation and take an active role in their recovery.
+        response = upstream.call(lambda timeout: _create(request, timeout))
+    except Exception as e:
+        metrics.record_upstream_error(persona, e)
+        raise
+    text = response.choices[0].message.content
+    _record_usage(persona, request, text, getattr(response, "usage", None), started)
+    return text
 
-PATIENT INFORMATION:
-- Gender: {gender}
-- Age: {age} years
-- Primary Diagnosis: {diagnosis}
-- Operation: {operation_description}
-- Operation Date: {operation_date} ({days_since_op} days ago)
-- Treatment Details: {treatment_details}
-- Treatment Start Date: {treatment_start_date} - {treatment_status}
+def _stream_text(request, persona):
+    """Send one streaming request and yield the reply text so far as each token arrives"""
+    started = time.perf_counter()
+    text = ""
+    try:
+        for chunk in upstream.stream(lambda timeout: _create(request, timeout, stream=True)):
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not text:
+                    metrics.record_first_token(persona, time.perf_counter() - started)
+                text += delta
+                yield text
+    except Exception as e:
+        metrics.record_upstream_error(persona, e)
+        raise
+    _record_usage(persona, request, text, started=started)
 
-Please provide advice in the following structure:
+async def _acomplete(request, persona):
+    """Async version of _complete using the pooled async client"""
+    started = time.perf_counter()
+    try:
+        response = await upstream.acall(lambda timeout: _acreate(request, timeout))
+    except Exception as e:
+        metrics.record_upstream_error(persona, e)
+        raise
+    text = response.choices[0].message.content
+    _record_usage(persona, request, text, getattr(response, "usage", None), started)
+    return text
 
-1. **YOUR RECOVERY JOURNEY**: Explain where you are in your recovery process and what this means
+async def _astream_text(request, persona):
+    """Async version of _stream_text using the pooled async client"""
+    started = time.perf_counter()
+    text = ""
+    try:
+        async for chunk in upstream.astream(lambda timeout: _acreate(request, timeout, stream=True)):
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not text:
+                    metrics.record_first_token(persona, time.perf_counter() - started)
+                text += delta
+                yield text
+    except Exception as e:
+        metrics.record_upstream_error(persona, e)
+        raise
+    _record_usage(persona, request, text, started=started)
 
-2. **WHAT YOU CAN EXPECT**: What to expect during this stage of your recovery
+def _coalesced_stream(request, produce, keep=None):
+    """
+    Share one upstream run between identical requests already in flight
 
-3. **HOW YOU CAN HELP YOURSELF**: Specific things you can do to support your own healing:
-   - Daily activities that promote recovery
-   - Self-care practices
-   - Things to monitor about your own condition
-   - Activities that are safe for you
+    keep, when given, is called with the finished reply by the caller whose produce()
+    actually runs, the single-flight leader, so a reply shared by several callers is
+    cached and added to the history once.
+    """
+    if keep is not None:
+        produce = _keeping(produce, keep)
+    if not COALESCE_REQUESTS:
+        return produce()
+    return request_flights.stream(single_flight.fingerprint(request), produce)
 
-4. **RECOVERY TIMELINE**: What milestones you can look forward to
+def _acoalesced_stream(request, produce, keep=None):
+    """Async version of _coalesced_stream"""
+    if keep is not None:
+        produce = _akeeping(produce, keep)
+    if not COALESCE_REQUESTS:
+        return produce()
+    return async_request_flights.stream(single_flight.fingerprint(request), produce)
 
-5. **EMOTIONAL WELLBEING**: How to stay positive and manage any concerns
+def _keeping(produce, keep):
+    """Wrap a generator function so it passes its last, non-empty text to keep when it ends"""
+    def run():
+        text = ""
+        for text in produce():
+            yield text
+        if text:
+            keep(text)
+    return run
 
-6. **WHEN TO SEEK HELP**: Signs that indicate you should contact your healthcare team
+def _akeeping(produce, keep):
+    """Async version of _keeping; keep runs in a worker thread so its file writes don't block the event loop"""
+    async def run():
+        text = ""
+        async for text in produce():
+            yield text
+        if text:
+            await asyncio.to_thread(keep, text)
+    return run
 
-Please be encouraging, empowering, and speak directly to the patient using "you" language. Focus on what they can control and do for themselves.
-"""
+async def _alookup(lookup, *args):
+    """
+    Run a cache lookup for an async handler, in a worker thread when it may read the
+    disk cache so the event loop never waits on the file
+    """
+    if advice_cache.disk_path:
+        return await asyncio.to_thread(lookup, *args)
+    return lookup(*args)
 
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are an experienced senior nurse speaking directly to patients. Provide encouraging, empowering advice that helps patients take an active role in their recovery. Use 'you' language and be supportive."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1500,
-            temperature=0.7
-        )
-        
-        return response.choices[0].message.content
-        
+# Stale replies being refreshed in the background, by request fingerprint, and the
+# asyncio tasks doing it for async handlers (kept so they aren't garbage collected)
+_revalidating = set()
+_revalidating_lock = threading.Lock()
+_revalidation_tasks = set()
+
+def _claim_revalidation(request):
+    """Return the request's fingerprint, or None when it is already being refreshed"""
+    fingerprint = single_flight.fingerprint(request)
+    with _revalidating_lock:
+        if fingerprint in _revalidating:
+            return None
+        _revalidating.add(fingerprint)
+    return fingerprint
+
+def _record_refresh(persona, error=None):
+    """Log and count how a stale reply's refresh went"""
+    if error is not None:
+        logger.warning("Couldn't refresh saved advice for %s: %s", persona, error)
+    if metrics.ENABLED:
+        metrics.stale_replies.inc(persona, "failed" if error is not None else "refreshed")
+
+def _revalidated(persona, fingerprint, error=None):
+    with _revalidating_lock:
+        _revalidating.discard(fingerprint)
+    _record_refresh(persona, error)
+
+def _revalidate(request, persona, keep):
+    """
+    Refresh a stale reply in a background thread, behind interactive requests for quota
+
+    keep is called with the new reply text to cache it.
+    """
+    fingerprint = _claim_revalidation(request)
+    if fingerprint is None:
+        return
+
+    def refresh():
+        try:
+            with rate_limiter.use_priority(rate_limiter.PRIORITY_PREFETCH):
+                for _ in _coalesced_stream(request, lambda: iter([_complete(request, persona)]), keep):
+                    pass
+        except Exception as e:
+            _revalidated(persona, fingerprint, e)
+        else:
+            _revalidated(persona, fingerprint)
+
+    threading.Thread(target=refresh, name=f"revalidate-{persona}", daemon=True).start()
+
+def _arevalidate(request, persona, keep):
+    """Async version of _revalidate, refreshing in a task on the running event loop"""
+    fingerprint = _claim_revalidation(request)
+    if fingerprint is None:
+        return
+
+    async def refresh():
+        async def produce():
+            yield await _acomplete(request, persona)
+
+        try:
+            with rate_limiter.use_priority(rate_limiter.PRIORITY_PREFETCH):
+                async for _ in _acoalesced_stream(request, produce, keep):
+                    pass
+        except Exception as e:
+            _revalidated(persona, fingerprint, e)
+        else:
+            _revalidated(persona, fingerprint)
+
+    task = asyncio.get_running_loop().create_task(refresh())
+    _revalidation_tasks.add(task)
+    task.add_done_callback(_revalidation_tasks.discard)
+
+def _refreshed_reply(request, persona, cached, age, keep):
+    """
+    Wait for a stale reply's replacement while the stale one is on show, and cache it
+
+    If the refresh fails, the stale reply is returned again with a notice saying so.
+    """
+    try:
+        text = ""
+        for text in _coalesced_stream(request, lambda: iter([_complete(request, persona)]), keep):
+            pass
+    except Exception as e:
+        _record_refresh(persona, e)
+        return _refresh_failed_notice(age) + cached
+    _record_refresh(persona)
+    return text
+
+async def _arefreshed_reply(request, persona, cached, age, keep):
+    """Async version of _refreshed_reply"""
+    async def produce():
+        yield await _acomplete(request, persona)
+
+    try:
+        text = ""
+        async for text in _acoalesced_stream(request, produce, keep):
+            pass
     except Exception as e:
-        return f"❌ Error getting patient advice: {str(e)}\n\nPlease check your OpenAI API key and internet connection."
+        _record_refresh(persona, e)
+        return _refresh_failed_notice(age) + cached
+    _record_refresh(persona)
+    return text
+
+def _use_combined(persona):
+    """Whether this persona's advice comes from the combined call"""
+    return COMBINED_ADVICE and persona in combined_advice.VIEWS
 
-def get_carer_focused_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date):
+def _combined_call(patient_args, use_cache):
     """
-    Get AI-powered advice focused on the carer's perspective
+    Prepare the combined advice call: returns (cache key, record, cached document or None, request)
+    """
+    patient_args, record, messages = _prepare("combined", prompts.combined_advice_messages, patient_args[:7])
+    key, cached, _ = _cached_reply("combined", patient_args, record, COMBINED_MAX_TOKENS, use_cache)
+    if cached is not None:
+        return key, record, json.loads(cached), None
+    request = _completion_request(messages, COMBINED_MAX_TOKENS)
+    request.update(combined_advice.request_options(OPENAI_MODEL))
+    return key, record, None, request
+
+def _combined_keeper(key, record, request):
     """
+    Return a function that checks a finished combined reply against the schema, caches
+    it and adds its views to the history
+    """
+    started = time.perf_counter()
+
+    def keep(text):
+        document = combined_advice.parse(text)
+        if key and RESPONSE_CACHE_ENABLED:
+            advice_cache.set(key, json.dumps(document))
+        for view in combined_advice.VIEWS:
+            _remember_advice(view, record, None, request, combined_advice.render(document, view), started)
+
+    return keep
+
+def _combined_document(patient_args, use_cache):
+    """
+    The combined advice for a patient, from the cache or one upstream call
+
+    Identical calls already in flight (the three prefetched views, say) share it.
+    """
+    key, record, document, request = _combined_call(patient_args, use_cache)
+    if document is not None:
+        return document
+    keep = _combined_keeper(key, record, request)
+    text = ""
+    for text in _coalesced_stream(request, lambda: iter([_complete(request, "combined")]), keep):
+        pass
+    return combined_advice.parse(text)
+
+async def _acombined_document(patient_args, use_cache):
+    """Async version of _combined_document"""
+    key, record, document, request = await _alookup(_combined_call, patient_args, use_cache)
+    if document is not None:
+        return document
+    keep = _combined_keeper(key, record, request)
+
+    async def produce():
+        yield await _acomplete(request, "combined")
+
+    text = ""
+    async for text in _acoalesced_stream(request, produce, keep):
+        pass
+    return combined_advice.parse(text)
+
+def _combined_view(persona, patient_args, use_cache):
+    """One view rendered from the combined advice, or None to fall back to its own call"""
     try:
-        # Calculate days since operation and treatment start
-        op_date = datetime.strptime(operation_date, "%Y-%m-%d").date()
-        treat_date = datetime.strptime(treatment_start_date, "%Y-%m-%d").date()
-        today = date.today()
-        
-        days_since_op = (today - op_date).days
-        
-        # Determine treatment status
-        if treat_date > today:
-            days_until_treatment = (treat_date - today).days
-            treatment_status = f"Treatment starts in {days_until_treatment} days (future)"
-        elif treat_date == today:
-            treatment_status = "Treatment starts today"
-        else:
-            days_since_treatment = (today - treat_date).days
-            treatment_status = f"Treatment started {days_since_treatment} days ago (ongoing)"
-        
-        # Create carer-focused prompt
-        prompt = f"""
-You are an experienced senior nurse providing guidance to a carer. Based on the following patient information, provide comprehensive caregiving advice that helps the carer provide the best possible support.
+        return combined_advice.render(_combined_document(patient_args, use_cache), persona)
+    except combined_advice.InvalidAdvice as e:
+        logger.warning("Combined advice reply was invalid (%s), asking for %s on its own", e, persona)
+        return None
+
+async def _acombined_view(persona, patient_args, use_cache):
+    """Async version of _combined_view"""
+    try:
+        return combined_advice.render(await _acombined_document(patient_args, use_cache), persona)
+    except combined_advice.InvalidAdvice as e:
+        logger.warning("Combined advice reply was invalid (%s), asking for %s on its own", e, persona)
+        return None
+
+def _use_sections(persona, use_cache):
+    """Whether this persona's advice is built from separately cached sections"""
+    return SECTION_CACHE_ENABLED and RESPONSE_CACHE_ENABLED and use_cache and persona == "nursing"
 
-PATIENT INFORMATION:
-- Gender: {gender}
-- Age: {age} years
-- Primary Diagnosis: {diagnosis}
-- Operation: {operation_description}
-- Operation Date: {operation_date} ({days_since_op} days ago)
-- Treatment Details: {treatment_details}
-- Treatment Start Date: {treatment_start_date} - {treatment_status}
+# A nursing advice lookup: the patient's record, section keys, cached sections, sections with
+# nothing cached, ages of cached sections past their staleness window, the request for the
+# rest (or None), when it was planned, and the request refreshing stale sections in the
+# background (or None)
+SectionPlan = namedtuple("SectionPlan", "record keys cached missing stale request started refresh")
 
-Please provide advice in the following structure:
+def _sections_request(record, version, wanted):
+    """The completion request for just the wanted nursing advice sections"""
+    if metrics.ENABLED:
+        metrics.prompt_versions.inc("nursing_sections", version)
+    messages = prompts.nursing_sections_messages(
+        *token_budget.fit_fields(record.form_fields(), OPENAI_MODEL), advice_sections.instructions(wanted),
+        timeline=record.timeline, version=version
+    )
+    # Room for the wanted sections' share of a full assessment
+    max_tokens = -(-ASSESSMENT_MAX_TOKENS * len(wanted) // len(advice_sections.SECTIONS))
+    return _completion_request(messages, max_tokens)
 
-1. **CARE STAGE ASSESSMENT**: What stage of care you're providing and what this means
+def _section_call(patient_args):
+    """
+    Look up the nursing advice sections for a patient and plan the call for the rest
 
-2. **YOUR CAREGIVING ROLE**: What you should expect as a carer during this stage
+    The warning signs are always asked for. With STALE_WHILE_REVALIDATE on, sections
+    past their staleness window are refreshed by a separate background request when
+    nothing else is missing, and asked for along with the missing ones otherwise.
+    """
+    record = PatientRecord(*patient_args[:7])
+    version = prompts.choose_version(record.content_hash)
+    keys = advice_sections.section_keys(record, OPENAI_MODEL, TEMPERATURE, version)
+    stale_after = advice_sections.stale_windows(STALE_AFTER_SECONDS, STALE_AFTER_SECTION) if STALE_WHILE_REVALIDATE else None
+    cached, missing, stale = section_cache.lookup(keys, stale_after)
+    if stale and metrics.ENABLED:
+        metrics.stale_replies.inc("nursing", "served")
+    in_background = bool(stale) and set(missing) <= set(advice_sections.ALWAYS_REFRESH)
+    wanted = set(missing) if in_background else set(missing) | set(stale)
+    refresh = _sections_request(record, version, set(stale)) if in_background else None
+    if not wanted:
+        return SectionPlan(record, keys, cached, missing, stale, None, None, refresh)
+    return SectionPlan(record, keys, cached, missing, stale, _sections_request(record, version, wanted), time.perf_counter(), refresh)
 
-3. **DAILY CARE ACTIVITIES**: Specific ways you can help the patient, including:
-   - Daily care tasks
-   - Monitoring responsibilities
-   - Comfort measures
-   - Medication management (if applicable)
-   - Mobility and activity support
+def _section_update(plan, text, done):
+    """
+    The advice so far: cached sections with the new ones filled in as they arrive
 
-4. **WARNING SIGNS TO WATCH**: Red flags or symptoms that require immediate medical attention
+    Stale sections stay on show, under a notice with their age, until a reply
+    replacing them is in. A reply without any of the expected headings is shown as it is.
+    """
+    fresh = advice_sections.split(text)
+    if text and not fresh:
+        return text
+    if done:
+        shown = dict(plan.cached, **fresh)
+        waiting = [age for key, age in plan.stale.items() if key not in fresh]
+    else:
+        shown = dict(plan.cached, **{key: value for key, value in fresh.items() if key not in plan.stale})
+        waiting = list(plan.stale.values())
+    notice = _stale_notice(max(waiting)) if waiting else ""
+    return notice + advice_sections.stitch(shown)
 
-5. **CAREGIVER SELF-CARE**: How to take care of yourself while caring for the patient
+def _section_keeper(plan):
+    """Return a function that caches a finished section reply and adds the advice to the history"""
+    def keep(text):
+        fresh = advice_sections.split(text)
+        if fresh:
+            section_cache.store(plan.keys, fresh)
+            _remember_advice("nursing", plan.record, None, plan.request, advice_sections.stitch(dict(plan.cached, **fresh)), plan.started)
 
-6. **EMOTIONAL SUPPORT**: How to provide psychological support to the patient
+    return keep
 
-Please be specific, practical, and empathetic. Focus on actionable guidance that a carer can implement immediately.
-"""
+def _section_refresher(plan):
+    """Return a function that caches the stale sections refreshed in the background"""
+    def keep(text):
+        fresh = advice_sections.split(text)
+        if fresh:
+            section_cache.store(plan.keys, fresh)
+
+    return keep
+
+def _section_updates(patient_args, stream):
+    """
+    Yield the nursing advice, showing cached sections at once and generating only the rest
+
+    Stale sections planned for a background refresh are shown as they are meanwhile.
+    """
+    plan = _section_call(patient_args)
+    if plan.refresh is not None:
+        _revalidate(plan.refresh, "nursing", _section_refresher(plan))
+    if plan.cached:
+        yield _section_update(plan, "", done=plan.request is None)
+    if plan.request is None:
+        return
+    request = plan.request
+    if stream:
+        produce = lambda: _stream_text(request, "nursing")
+    else:
+        produce = lambda: iter([_complete(request, "nursing")])
+    text = ""
+    for text in _coalesced_stream(request, produce, _section_keeper(plan)):
+        if stream:
+            yield _section_update(plan, text, done=False)
+    yield _section_update(plan, text, done=True)
+
+async def _asection_updates(patient_args, stream):
+    """Async version of _section_updates"""
+    plan = await _alookup(_section_call, patient_args)
+    if plan.refresh is not None:
+        _arevalidate(plan.refresh, "nursing", _section_refresher(plan))
+    if plan.cached:
+        yield _section_update(plan, "", done=plan.request is None)
+    if plan.request is None:
+        return
+    request = plan.request
+    if stream:
+        produce = lambda: _astream_text(request, "nursing")
+    else:
+        async def produce():
+            yield await _acomplete(request, "nursing")
+    text = ""
+    async for text in _acoalesced_stream(request, produce, _section_keeper(plan)):
+        if stream:
+            yield _section_update(plan, text, done=False)
+    yield _section_update(plan, text, done=True)
+
+def _run_completion(persona, build_messages, patient_args, max_tokens, label, use_cache=True):
+    """
+    Build the prompt and wait for the full reply from the model
+    """
+    try:
+        combined = _combined_view(persona, patient_args, use_cache) if _use_combined(persona) else None
+        if combined is not None:
+            return combined
+        if _use_sections(persona, use_cache):
+            text = ""
+            for text in _section_updates(patient_args, stream=False):
+                pass
+            return text
+
+        patient_args, record, messages = _prepare(persona, build_messages, patient_args)
+        key, cached, age = _cached_reply(persona, patient_args, record, max_tokens, use_cache)
+        if cached is not None and age is None:
+            return cached
+
+        request = _completion_request(messages, max_tokens)
+        keep = _reply_keeper(key, persona, patient_args, record, max_tokens, request)
+        if age is not None:
+            _revalidate(request, persona, keep)
+            return _stale_notice(age) + cached
+
+        text = ""
+        for text in _coalesced_stream(request, lambda: iter([_complete(request, persona)]), keep):
+            pass
+
+        return text
 
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are an experienced senior nurse providing guidance to carers. Provide practical, evidence-based caregiving advice. Be empathetic and specific in your guidance."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1500,
-            temperature=0.7
-        )
-        
-        return response.choices[0].message.content
-        
     except Exception as e:
-        return f"❌ Error getting carer advice: {str(e)}\n\nPlease check your OpenAI API key and internet connection."
+        return _error_message(label, e)
 
-def get_patient_question_answer(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, patient_question):
+def _stream_completion(persona, build_messages, patient_args, max_tokens, label, use_cache=True):
     """
-    Get AI-powered answer to patient's specific question
+    Build the prompt and yield the reply text so far as each token arrives
+
+    Views from the combined call arrive in one piece once the whole reply is in.
     """
+    text = ""
     try:
-        # Calculate days since operation and treatment start
-        op_date = datetime.strptime(operation_date, "%Y-%m-%d").date()
-        treat_date = datetime.strptime(treatment_start_date, "%Y-%m-%d").date()
-        today = date.today()
-        
-        days_since_op = (today - op_date).days
-        
-        # Determine treatment status
-        if treat_date > today:
-            days_until_treatment = (treat_date - today).days
-            treatment_status = f"Treatment starts in {days_until_treatment} days (future)"
-        elif treat_date == today:
-            treatment_status = "Treatment starts today"
-        else:
-            days_since_treatment = (today - treat_date).days
-            treatment_status = f"Treatment started {days_since_treatment} days ago (ongoing)"
-        
-        # Create patient question prompt
-        prompt = f"""
-You are an experienced senior nurse speaking directly to a patient. A patient is asking you a specific question about their care and recovery. Please provide a helpful, encouraging answer.
-
-PATIENT INFORMATION:
-- Gender: {gender}
-- Age: {age} years
-- Primary Diagnosis: {diagnosis}
-- Operation: {operation_description}
-- Operation Date: {operation_date} ({days_since_op} days ago)
-- Treatment Details: {treatment_details}
-- Treatment Start Date: {treatment_start_date} - {treatment_status}
-
-PATIENT'S QUESTION:
-"{patient_question}"
-
-Please provide:
-1. **DIRECT ANSWER**: Address the specific question with practical guidance
-2. **STEP-BY-STEP INSTRUCTIONS**: Clear, actionable steps the patient can follow
-3. **IMPORTANT CONSIDERATIONS**: Things to be aware of or monitor
-4. **WHEN TO SEEK HELP**: Signs that indicate the need for medical attention
-5. **ENCOURAGEMENT**: Positive reinforcement and reassurance
-
-IMPORTANT: Consider whether treatment has started yet when providing your advice. Tailor your response to the current phase (pre-treatment, starting treatment, or ongoing treatment).
-
-Be empathetic, encouraging, and speak directly to the patient using "you" language. Focus on what they can do to help themselves.
-"""
+        combined = _combined_view(persona, patient_args, use_cache) if _use_combined(persona) else None
+        if combined is not None:
+            yield combined
+            return
+        if _use_sections(persona, use_cache):
+            for text in _section_updates(patient_args, stream=True):
+                yield text
+            return
+
+        patient_args, record, messages = _prepare(persona, build_messages, patient_args)
+        key, cached, age = _cached_reply(persona, patient_args, record, max_tokens, use_cache)
+        if cached is not None and age is None:
+            yield cached
+            return
+
+        request = _completion_request(messages, max_tokens)
+        keep = _reply_keeper(key, persona, patient_args, record, max_tokens, request)
+        if age is not None:
+            yield _stale_notice(age) + cached
+            yield _refreshed_reply(request, persona, cached, age, keep)
+            return
+
+        for text in _coalesced_stream(request, lambda: _stream_text(request, persona), keep):
+            yield text
+
+        if not text:
+            yield ""
 
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are an experienced senior nurse speaking directly to patients. Provide encouraging, practical answers to patient questions. Use 'you' language and be supportive."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1200,
-            temperature=0.7
-        )
-        
-        return response.choices[0].message.content
-        
     except Exception as e:
-        return f"❌ Error getting patient answer: {str(e)}\n\nPlease check your OpenAI API key and internet connection."
+        # Keep whatever already arrived so the user can still read it
+        prefix = f"{text}\n\n" if text else ""
+        yield prefix + _error_message(label, e)
 
-def get_carer_question_answer(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, carer_question):
+async def _arun_completion(persona, build_messages, patient_args, max_tokens, label, use_cache=True):
     """
-    Get AI-powered answer to carer's specific question
+    Async version of _run_completion using the pooled async client
     """
     try:
-        # Calculate days since operation and treatment start
-        op_date = datetime.strptime(operation_date, "%Y-%m-%d").date()
-        treat_date = datetime.strptime(treatment_start_date, "%Y-%m-%d").date()
-        today = date.today()
-        
-        days_since_op = (today - op_date).days
-        
-        # Determine treatment status
-        if treat_date > today:
-            days_until_treatment = (treat_date - today).days
-            treatment_status = f"Treatment starts in {days_until_treatment} days (future)"
-        elif treat_date == today:
-            treatment_status = "Treatment starts today"
-        else:
-            days_since_treatment = (today - treat_date).days
-            treatment_status = f"Treatment started {days_since_treatment} days ago (ongoing)"
-        
-        # Create carer question prompt
-        prompt = f"""
-You are an experienced senior nurse providing guidance to a carer. A carer is asking you a specific question about providing care. Please provide detailed, practical guidance.
-
-PATIENT INFORMATION:
-- Gender: {gender}
-- Age: {age} years
-- Primary Diagnosis: {diagnosis}
-- Operation: {operation_description}
-- Operation Date: {operation_date} ({days_since_op} days ago)
-- Treatment Details: {treatment_details}
-- Treatment Start Date: {treatment_start_date} - {treatment_status}
-
-CARER'S QUESTION:
-"{carer_question}"
-
-Please provide:
-1. **DIRECT ANSWER**: Address the specific question with practical guidance
-2. **STEP-BY-STEP INSTRUCTIONS**: Clear, actionable steps the carer can follow
-3. **IMPORTANT CONSIDERATIONS**: Things to be aware of or monitor
-4. **WHEN TO SEEK HELP**: Signs that indicate the need for medical attention
-5. **ADDITIONAL TIPS**: Extra helpful information related to the question
-
-IMPORTANT: Consider whether treatment has started yet when providing your advice. Tailor your response to the current phase (pre-treatment, starting treatment, or ongoing treatment).
-
-Be empathetic, specific, and practical. Focus on what the carer can do right now to help their patient.
-"""
+        combined = await _acombined_view(persona, patient_args, use_cache) if _use_combined(persona) else None
+        if combined is not None:
+            return combined
+        if _use_sections(persona, use_cache):
+            text = ""
+            async for text in _asection_updates(patient_args, stream=False):
+                pass
+            return text
+
+        patient_args, record, messages = _prepare(persona, build_messages, patient_args)
+        key, cached, age = await _alookup(_cached_reply, persona, patient_args, record, max_tokens, use_cache)
+        if cached is not None and age is None:
+            return cached
+
+        request = _completion_request(messages, max_tokens)
+        keep = _reply_keeper(key, persona, patient_args, record, max_tokens, request)
+        if age is not None:
+            _arevalidate(request, persona, keep)
+            return _stale_notice(age) + cached
+
+        async def produce():
+            yield await _acomplete(request, persona)
+
+        text = ""
+        async for text in _acoalesced_stream(request, produce, keep):
+            pass
+
+        return text
 
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are an experienced senior nurse providing guidance to carers. Provide practical, evidence-based caregiving advice. Be empathetic and specific in your guidance."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1200,
-            temperature=0.7
-        )
-        
-        return response.choices[0].message.content
-        
     except Exception as e:
-        return f"❌ Error getting carer answer: {str(e)}\n\nPlease check your OpenAI API key and internet connection."
+        return _error_message(label, e)
 
-def get_specific_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, specific_question):
+async def _astream_completion(persona, build_messages, patient_args, max_tokens, label, use_cache=True):
     """
-    Get AI-powered specific advice based on carer's question
+    Async version of _stream_completion using the pooled async client
     """
+    text = ""
     try:
-        # Calculate days since operation and treatment start
-        op_date = datetime.strptime(operation_date, "%Y-%m-%d").date()
-        treat_date = datetime.strptime(treatment_start_date, "%Y-%m-%d").date()
-        today = date.today()
-        
-        days_since_op = (today - op_date).days
-        
-        # Determine treatment status
-        if treat_date > today:
-            days_until_treatment = (treat_date - today).days
-            treatment_status = f"Treatment starts in {days_until_treatment} days (future)"
-        elif treat_date == today:
-            treatment_status = "Treatment starts today"
-        else:
-            days_since_treatment = (today - treat_date).days
-            treatment_status = f"Treatment started {days_since_treatment} days ago (ongoing)"
-        
-        # Create specific advice prompt
-        prompt = f"""
-You are an experienced senior nurse with the knowledge of a senior consultant. A carer is asking for specific advice about their patient. Please provide detailed, practical guidance.
-
-PATIENT INFORMATION:
-- Gender: {gender}
-- Age: {age} years
-- Primary Diagnosis: {diagnosis}
-- Operation: {operation_description}
-- Operation Date: {operation_date} ({days_since_op} days ago)
-- Treatment Details: {treatment_details}
-- Treatment Start Date: {treatment_start_date} - {treatment_status}
-
-CARER'S SPECIFIC QUESTION:
-"{specific_question}"
-
-Please provide:
-1. **DIRECT ANSWER**: Address the specific question with practical guidance appropriate for the current treatment phase
-2. **STEP-BY-STEP INSTRUCTIONS**: Clear, actionable steps the carer can follow
-3. **IMPORTANT CONSIDERATIONS**: Things to be aware of or monitor
-4. **WHEN TO SEEK HELP**: Signs that indicate the need for medical attention
-5. **ADDITIONAL TIPS**: Extra helpful information related to the question
-
-IMPORTANT: Consider whether treatment has started yet when providing your advice. Tailor your response to the current phase (pre-treatment, starting treatment, or ongoing treatment).
-
-Be empathetic, specific, and practical. Focus on what the carer can do right now to help their patient.
-"""
+        combined = await _acombined_view(persona, patient_args, use_cache) if _use_combined(persona) else None
+        if combined is not None:
+            yield combined
+            return
+        if _use_sections(persona, use_cache):
+            async for text in _asection_updates(patient_args, stream=True):
+                yield text
+            return
+
+        patient_args, record, messages = _prepare(persona, build_messages, patient_args)
+        key, cached, age = await _alookup(_cached_reply, persona, patient_args, record, max_tokens, use_cache)
+        if cached is not None and age is None:
+            yield cached
+            return
+
+        request = _completion_request(messages, max_tokens)
+        keep = _reply_keeper(key, persona, patient_args, record, max_tokens, request)
+        if age is not None:
+            yield _stale_notice(age) + cached
+            yield await _arefreshed_reply(request, persona, cached, age, keep)
+            return
+
+        async for text in _acoalesced_stream(request, lambda: _astream_text(request, persona), keep):
+            yield text
+
+        if not text:
+            yield ""
 
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are an experienced senior nurse with extensive clinical knowledge. Provide practical, evidence-based nursing advice for patient carers. Be empathetic and specific in your guidance."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1200,
-            temperature=0.7
-        )
-        
-        return response.choices[0].message.content
-        
     except Exception as e:
-        return f"❌ Error getting specific advice: {str(e)}\n\nPlease check your OpenAI API key and internet connection."
+        prefix = f"{text}\n\n" if text else ""
+        yield prefix + _error_message(label, e)
 
-def save_patient_data(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, filename):
+def get_nursing_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, use_cache=True):
     """
-    Save patient data to a JSON file
+    Get AI-powered nursing advice based on patient information
+    """
+    return _run_completion("nursing", prompts.nursing_advice_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date), ASSESSMENT_MAX_TOKENS, "AI advice", use_cache)
+
+def stream_nursing_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, use_cache=True):
+    """
+    Streaming version of get_nursing_advice: yields the reply as it grows
+    """
+    yield from _stream_completion("nursing", prompts.nursing_advice_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date), ASSESSMENT_MAX_TOKENS, "AI advice", use_cache)
+
+async def aget_nursing_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, use_cache=True):
+    """
+    Async version of get_nursing_advice
+    """
+    return await _arun_completion("nursing", prompts.nursing_advice_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date), ASSESSMENT_MAX_TOKENS, "AI advice", use_cache)
+
+async def astream_nursing_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, use_cache=True):
+    """
+    Async version of stream_nursing_advice
+    """
+    async for text in _astream_completion("nursing", prompts.nursing_advice_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date), ASSESSMENT_MAX_TOKENS, "AI advice", use_cache):
+        yield text
+
+# Advice views generated together on submit; the tabs pick them up from the session
+PREFETCH_VIEWS = ("nursing_advice", "patient_focused_advice", "carer_focused_advice")
+
+def _start_advice_fan_out(patient_args):
+    """
+    Start every prefetched advice view for a patient at once
+
+    Returns None when prefetching is off or too many fan-outs are already running.
+    """
+    if not PREFETCH_ADVICE:
+        return None
+    jobs = {}
+    for name in PREFETCH_VIEWS:
+        if STREAM_RESPONSES:
+            jobs[name] = lambda fn=globals()["stream_" + name]: _at_prefetch_priority(lambda: fn(*patient_args))
+        else:
+            jobs[name] = lambda fn=globals()["get_" + name]: _at_prefetch_priority(lambda: iter([fn(*patient_args)]))
+    return advice_fan_outs.start(patient_args, jobs)
+
+def _at_prefetch_priority(produce):
+    """Run a prefetch job's AI calls behind interactive requests for the rate limit quota"""
+    with rate_limiter.use_priority(rate_limiter.PRIORITY_PREFETCH):
+        yield from produce()
+
+def submit_patient_info(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, advice_fan_out=None):
+    """
+    Collect patient information and stream the general nursing advice for it
+
+    With PREFETCH_ADVICE on, the patient and carer advice are generated at the same
+    time and the fan-out is handed to the session straight away, so the advice tabs
+    show them without another wait.
+    """
+    patient_args = (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date)
+
+    # Validate inputs
+    if not all(patient_args):
+        yield "Please fill in all fields before submitting.", None, "Please complete all fields to get AI nursing advice.", advice_fan_out
+        return
+    
+    # Create patient record
+    try:
+        record = PatientRecord(*patient_args)
+    except ValueError as e:
+        yield f"❌ {e}", None, "Please correct the patient details to get AI nursing advice.", advice_fan_out
+        return
+    
+    # Convert to JSON for display
+    json_output = json.dumps(record.to_dict(), indent=2)
+    
+    # Success message
+    success_msg = f"✅ Patient information collected successfully!\n\nPatient: {record.gender}, Age {record.age}\nDiagnosis: {record.diagnosis}\nOperation Date: {record.operation_date}\nTreatment Start: {record.treatment_start_date}"
+    
+    # Reuse a fan-out still running for the same patient, otherwise replace the session's old one
+    if advice_fan_out is None or advice_fan_out.done() or not advice_fan_out.matches(patient_args):
+        if advice_fan_out is not None:
+            advice_fan_out.cancel()
+        advice_fan_out = _start_advice_fan_out(patient_args)
+    yield success_msg, json_output, "", advice_fan_out
+    
+    # Get AI nursing advice
+    if advice_fan_out is not None:
+        updates = advice_fan_out.follow("nursing_advice")
+    elif STREAM_RESPONSES:
+        updates = stream_nursing_advice(*patient_args)
+    else:
+        updates = iter([get_nursing_advice(*patient_args)])
+    for ai_advice in updates:
+        yield success_msg, json_output, ai_advice, advice_fan_out
+
+def collect_patient_info(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date):
+    """
+    Collect and process patient information
+    """
+    result = None
+    for result in submit_patient_info(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date):
+        pass
+    success_msg, json_output, ai_advice, _ = result
+    return success_msg, json_output, ai_advice
+
+def get_patient_focused_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, use_cache=True):
+    """
+    Get AI-powered advice focused on the patient's perspective
+    """
+    return _run_completion("patient_advice", prompts.patient_focused_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date), ASSESSMENT_MAX_TOKENS, "patient advice", use_cache)
+
+def stream_patient_focused_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, use_cache=True):
+    """
+    Streaming version of get_patient_focused_advice: yields the reply as it grows
+    """
+    yield from _stream_completion("patient_advice", prompts.patient_focused_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date), ASSESSMENT_MAX_TOKENS, "patient advice", use_cache)
+
+async def aget_patient_focused_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, use_cache=True):
+    """
+    Async version of get_patient_focused_advice
+    """
+    return await _arun_completion("patient_advice", prompts.patient_focused_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date), ASSESSMENT_MAX_TOKENS, "patient advice", use_cache)
+
+async def astream_patient_focused_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, use_cache=True):
+    """
+    Async version of stream_patient_focused_advice
+    """
+    async for text in _astream_completion("patient_advice", prompts.patient_focused_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date), ASSESSMENT_MAX_TOKENS, "patient advice", use_cache):
+        yield text
+
+def get_carer_focused_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, use_cache=True):
+    """
+    Get AI-powered advice focused on the carer's perspective
+    """
+    return _run_completion("carer_advice", prompts.carer_focused_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date), ASSESSMENT_MAX_TOKENS, "carer advice", use_cache)
+
+def stream_carer_focused_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, use_cache=True):
+    """
+    Streaming version of get_carer_focused_advice: yields the reply as it grows
+    """
+    yield from _stream_completion("carer_advice", prompts.carer_focused_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date), ASSESSMENT_MAX_TOKENS, "carer advice", use_cache)
+
+async def aget_carer_focused_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, use_cache=True):
+    """
+    Async version of get_carer_focused_advice
+    """
+    return await _arun_completion("carer_advice", prompts.carer_focused_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date), ASSESSMENT_MAX_TOKENS, "carer advice", use_cache)
+
+async def astream_carer_focused_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, use_cache=True):
+    """
+    Async version of stream_carer_focused_advice
+    """
+    async for text in _astream_completion("carer_advice", prompts.carer_focused_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date), ASSESSMENT_MAX_TOKENS, "carer advice", use_cache):
+        yield text
+
+def get_patient_question_answer(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, patient_question, use_cache=True):
+    """
+    Get AI-powered answer to patient's specific question
+    """
+    return _run_completion("patient_question", prompts.patient_question_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, patient_question), ANSWER_MAX_TOKENS, "patient answer", use_cache)
+
+def stream_patient_question_answer(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, patient_question, use_cache=True):
+    """
+    Streaming version of get_patient_question_answer: yields the reply as it grows
+    """
+    yield from _stream_completion("patient_question", prompts.patient_question_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, patient_question), ANSWER_MAX_TOKENS, "patient answer", use_cache)
+
+async def aget_patient_question_answer(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, patient_question, use_cache=True):
+    """
+    Async version of get_patient_question_answer
+    """
+    return await _arun_completion("patient_question", prompts.patient_question_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, patient_question), ANSWER_MAX_TOKENS, "patient answer", use_cache)
+
+async def astream_patient_question_answer(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, patient_question, use_cache=True):
+    """
+    Async version of stream_patient_question_answer
+    """
+    async for text in _astream_completion("patient_question", prompts.patient_question_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, patient_question), ANSWER_MAX_TOKENS, "patient answer", use_cache):
+        yield text
+
+def get_carer_question_answer(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, carer_question, use_cache=True):
+    """
+    Get AI-powered answer to carer's specific question
+    """
+    return _run_completion("carer_question", prompts.carer_question_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, carer_question), ANSWER_MAX_TOKENS, "carer answer", use_cache)
+
+def stream_carer_question_answer(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, carer_question, use_cache=True):
+    """
+    Streaming version of get_carer_question_answer: yields the reply as it grows
+    """
+    yield from _stream_completion("carer_question", prompts.carer_question_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, carer_question), ANSWER_MAX_TOKENS, "carer answer", use_cache)
+
+async def aget_carer_question_answer(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, carer_question, use_cache=True):
+    """
+    Async version of get_carer_question_answer
+    """
+    return await _arun_completion("carer_question", prompts.carer_question_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, carer_question), ANSWER_MAX_TOKENS, "carer answer", use_cache)
+
+async def astream_carer_question_answer(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, carer_question, use_cache=True):
+    """
+    Async version of stream_carer_question_answer
+    """
+    async for text in _astream_completion("carer_question", prompts.carer_question_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, carer_question), ANSWER_MAX_TOKENS, "carer answer", use_cache):
+        yield text
+
+def get_specific_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, specific_question, use_cache=True):
+    """
+    Get AI-powered specific advice based on carer's question
+    """
+    return _run_completion("specific_advice", prompts.specific_advice_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, specific_question), ANSWER_MAX_TOKENS, "specific advice", use_cache)
+
+def stream_specific_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, specific_question, use_cache=True):
+    """
+    Streaming version of get_specific_advice: yields the reply as it grows
+    """
+    yield from _stream_completion("specific_advice", prompts.specific_advice_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, specific_question), ANSWER_MAX_TOKENS, "specific advice", use_cache)
+
+async def aget_specific_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, specific_question, use_cache=True):
+    """
+    Async version of get_specific_advice
+    """
+    return await _arun_completion("specific_advice", prompts.specific_advice_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, specific_question), ANSWER_MAX_TOKENS, "specific advice", use_cache)
+
+async def astream_specific_advice(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, specific_question, use_cache=True):
+    """
+    Async version of stream_specific_advice
+    """
+    async for text in _astream_completion("specific_advice", prompts.specific_advice_messages, (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, specific_question), ANSWER_MAX_TOKENS, "specific advice", use_cache):
+        yield text
+
+def _save_patient_record(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, filename, expected_version=None):
+    """
+    Save patient data and return (status message, saved files, filename, new version or None)
     """
     try:
         if not filename:
-            return "Please enter a filename to save the patient data.", None
+            return "Please enter a filename to save the patient data.", None, None, None
         
         # Create patient record
-        patient_record = {
-            "timestamp": datetime.now().isoformat(),
-            "gender": gender,
-            "age": int(age) if age else None,
-            "diagnosis": diagnosis,
-            "operation": {
-                "description": operation_description,
-                "date": operation_date
-            },
-            "treatment": {
-                "details": treatment_details,
-                "start_date": treatment_start_date
-            }
-        }
-        
-        # Ensure saved_data directory exists
-        os.makedirs("saved_data", exist_ok=True)
-        
-        # Add .json extension if not present
-        if not filename.endswith('.json'):
-            filename += '.json'
-        
-        filepath = os.path.join("saved_data", filename)
+        record = PatientRecord(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date)
         
-        # Save to file
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(patient_record, f, indent=2, ensure_ascii=False)
+        # Save to file and update the patient index
+        filename, version = get_store().save(filename, record.to_dict(), expected_version=expected_version)
         
-        return f"✅ Patient data saved successfully to {filename}", get_saved_files()
+        return f"✅ Patient data saved successfully to {filename}", get_saved_files(), filename, version
         
+    except patient_store.StaleRecordError as e:
+        if not e.expected_version:
+            return (
+                f"❌ {e.filename} already exists. Load it first to edit it, or save under a new filename.",
+                get_saved_files(), e.filename, None
+            )
+        return (
+            f"❌ {e.filename} was changed by someone else since you loaded it. "
+            "Load it again to see the latest details before saving, or save under a new filename.",
+            get_saved_files(), e.filename, None
+        )
     except Exception as e:
-        return f"❌ Error saving patient data: {str(e)}", get_saved_files()
+        return f"❌ Error saving patient data: {str(e)}", get_saved_files(), None, None
 
-def load_patient_data(filename):
+def save_patient_data(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, filename, expected_version=None):
     """
-    Load patient data from a JSON file
+    Save patient data to a JSON file
+
+    Pass the version that was loaded as expected_version to refuse the save if
+    someone else has saved the record since.
+    """
+    status, saved_files, _, _ = _save_patient_record(
+        gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date,
+        filename, expected_version
+    )
+    return status, saved_files
+
+def patient_fields(patient_record):
+    """
+    Pull the seven form fields out of a saved patient record
+    """
+    return (
+        patient_record.get("gender", ""),
+        patient_record.get("age", ""),
+        patient_record.get("diagnosis", ""),
+        patient_record.get("operation", {}).get("description", ""),
+        patient_record.get("operation", {}).get("date", ""),
+        patient_record.get("treatment", {}).get("details", ""),
+        patient_record.get("treatment", {}).get("start_date", "")
+    )
+
+def _load_patient_record(filename):
+    """
+    Load patient data and return (status message and form fields, version or None)
     """
     try:
         if not filename:
-            return "Please select a file to load.", None, None, None, None, None, None
-        
-        # Ensure saved_data directory exists
-        os.makedirs("saved_data", exist_ok=True)
-        
-        filepath = os.path.join("saved_data", filename)
-        
-        if not os.path.exists(filepath):
-            return f"❌ File {filename} not found.", None, None, None, None, None, None
+            return ("Please select a file to load.", None, None, None, None, None, None, None), None
         
         # Load from file
-        with open(filepath, 'r', encoding='utf-8') as f:
-            patient_record = json.load(f)
+        patient_record = get_store().load(filename)
+        
+        if patient_record is None:
+            return (f"❌ File {filename} not found.", None, None, None, None, None, None, None), None
         
         # Extract data
-        gender = patient_record.get("gender", "")
-        age = patient_record.get("age", "")
-        diagnosis = patient_record.get("diagnosis", "")
-        operation_description = patient_record.get("operation", {}).get("description", "")
-        operation_date = patient_record.get("operation", {}).get("date", "")
-        treatment_details = patient_record.get("treatment", {}).get("details", "")
-        treatment_start_date = patient_record.get("treatment", {}).get("start_date", "")
+        gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date = patient_fields(patient_record)
         
-        return f"✅ Patient data loaded successfully from {filename}", gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date
+        return (f"✅ Patient data loaded successfully from {filename}", gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date), patient_store.record_version(patient_record)
         
     except Exception as e:
-        return f"❌ Error loading patient data: {str(e)}", None, None, None, None, None, None
+        return (f"❌ Error loading patient data: {str(e)}", None, None, None, None, None, None, None), None
+
+def load_patient_data(filename):
+    """
+    Load patient data from a JSON file
+    """
+    return _load_patient_record(filename)[0]
+
+# Advice views brought back from the history when a patient is loaded, in the order of the advice boxes
+HISTORY_VIEWS = ("nursing", "patient_advice", "carer_advice")
+
+def saved_advice(filename, gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date):
+    """
+    The latest advice in a record's history for its current patient details, one text
+    per view in HISTORY_VIEWS
 
-def get_saved_files():
+    Each is marked with when it was generated, or "" when the history has none. No
+    AI call is made.
     """
-    Get list of saved patient files
+    try:
+        record = PatientRecord(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date)
+        latest = get_store().latest_advice(filename, record.details_hash)
+    except ValueError:
+        return ("",) * len(HISTORY_VIEWS)
+    texts = []
+    for view in HISTORY_VIEWS:
+        entry = latest.get(view)
+        when = entry["timestamp"][:16].replace("T", " ") if entry else ""
+        texts.append(f"🗂️ Saved advice from {when}\n\n{entry['advice']}" if entry else "")
+    return tuple(texts)
+
+# Suffix of the pre-generated advice files stored next to each patient record
+ADVICE_FILE_SUFFIX = patient_store.ADVICE_FILE_SUFFIX
+
+def get_saved_files(search=""):
+    """
+    Get list of saved patient files, most recently updated first
+
+    With a search term, only files whose name or diagnosis starts with it are listed.
     """
     try:
-        os.makedirs("saved_data", exist_ok=True)
-        files = glob.glob("saved_data/*.json")
-        filenames = [os.path.basename(f) for f in files]
+        patients = get_store()
+        rows = patients.find(search, limit=SAVED_FILES_LIMIT) if search and search.strip() else patients.list(limit=SAVED_FILES_LIMIT)
+        filenames = [row["filename"] for row in rows]
         return filenames if filenames else ["No saved files found"]
     except Exception as e:
         return [f"Error: {str(e)}"]
 
-def clear_form():
-    """Clear all form fields"""
-    return None, None, None, None, None, None, None, "", "", "", "", ""
+def _advice_handler(name):
+    """
+    Pick the blocking, streaming, sync or async variant of an advice function for the UI
+    """
+    prefix = "stream_" if STREAM_RESPONSES else "get_"
+    if ASYNC_HANDLERS:
+        prefix = "a" + prefix
+    return globals()[prefix + name]
 
-# Create the Gradio interface
-with gr.Blocks(title="AI-Powered Patient Care System", theme=gr.themes.Soft()) as app:
-    gr.Markdown("# 🏥 AI-Powered Patient Care System")
-    gr.Markdown("Comprehensive patient care management with AI-powered nursing advice")
-    
-    # Create tabs
-    with gr.Tabs():
-        
-        # Tab 1: Patient Information & Save/Load
-        with gr.Tab("📋 Patient Info & Save/Load"):
-            gr.Markdown("## Patient Information Collection")
-            gr.Markdown("Enter patient details and manage saved data")
-            
-            with gr.Row():
-                with gr.Column(scale=1):
-                    gender = gr.Dropdown(
-                        choices=["Male", "Female", "Other", "Prefer not to say"],
-                        label="Gender",
-                        info="Select patient's gender"
-                    )
-                    
-                    age = gr.Number(
-                        label="Age",
-                        info="Patient's age in years",
-                        minimum=0,
-                        maximum=150,
-                        step=1
-                    )
-                    
-                    diagnosis = gr.Textbox(
-                        label="Diagnosis",
-                        info="Primary medical diagnosis",
-                        placeholder="Enter the main diagnosis..."
-                    )
-                    
-                    operation_description = gr.Textbox(
-                        label="Operation Description",
-                        info="Description of the surgical procedure",
-                        placeholder="Describe the operation performed...",
-                        lines=3
-                    )
-                    
-                    operation_date = gr.Textbox(
-                        label="Operation Date",
-                        info="Date when the operation was performed (YYYY-MM-DD)",
-                        placeholder="2024-01-15",
-                        value=date.today().strftime("%Y-%m-%d")
-                    )
-                    
-                    treatment_details = gr.Textbox(
-                        label="Treatment Details",
-                        info="Details about ongoing treatment",
-                        placeholder="Describe the treatment plan...",
-                        lines=3
-                    )
-                    
-                    treatment_start_date = gr.Textbox(
-                        label="Treatment Start Date",
-                        info="Date when treatment began (YYYY-MM-DD)",
-                        placeholder="2024-01-15",
-                        value=date.today().strftime("%Y-%m-%d")
-                    )
-                
-                with gr.Column(scale=1):
-                    gr.Markdown("## 💾 Save & Load Patient Data")
-                    
-                    with gr.Row():
-                        with gr.Column(scale=2):
-                            save_filename = gr.Textbox(
-                                label="Save As",
-                                info="Enter filename to save patient data",
-                                placeholder="patient_john_doe",
-                                lines=1
-                            )
-                            save_btn = gr.Button("💾 Save Patient Data", variant="secondary")
-                        
-                        with gr.Column(scale=2):
-                            load_file_dropdown = gr.Dropdown(
-                                choices=get_saved_files(),
-                                label="Load Patient Data",
-                                info="Select a saved patient file to load",
-                                value=None
-                            )
-                            load_btn = gr.Button("📂 Load Patient Data", variant="secondary")
-                    
-                    save_load_status = gr.Textbox(
-                        label="Save/Load Status",
-                        interactive=False,
-                        lines=2,
-                        placeholder="Save/load status will appear here..."
-                    )
-                    
-                    gr.Markdown("## 📊 Patient Record")
-                    
-                    json_output = gr.JSON(
-                        label="Patient Record (JSON)"
-                    )
-            
-            with gr.Row():
-                submit_btn = gr.Button("Submit Patient Info", variant="primary", size="lg")
-                clear_btn = gr.Button("Clear Form", variant="secondary")
-        
-        # Tab 2: Patient Advice
-        with gr.Tab("👤 Patient Advice"):
-            gr.Markdown("## AI-Powered Patient Guidance")
-            gr.Markdown("Get personalized advice and answers for the patient")
-            
-            with gr.Row():
-                with gr.Column(scale=1):
-                    gr.Markdown("### 🤖 General Patient Advice")
-                    
-                    patient_advice_output = gr.Textbox(
-                        label="Patient-Focused Nursing Advice",
-                        interactive=False,
-                        lines=20,
-                        placeholder="Patient-focused advice will appear here after submitting patient information..."
-                    )
-                    
-                    get_patient_advice_btn = gr.Button("Get Patient Advice", variant="primary", size="lg")
-                
-                with gr.Column(scale=1):
-                    gr.Markdown("### 💬 Patient Questions")
-                    gr.Markdown("Ask questions from the patient's perspective")
-                    
-                    patient_question = gr.Textbox(
-                        label="Patient's Question",
-                        info="Ask questions about recovery, what to expect, or concerns",
-                        placeholder="e.g., 'How long will my recovery take?', 'What can I do to help myself heal?', 'When can I return to normal activities?'",
-                        lines=3
-                    )
-                    
-                    ask_patient_question_btn = gr.Button("Ask AI Nurse (Patient View)", variant="primary", size="lg")
-                    
-                    patient_question_output = gr.Textbox(
-                        label="AI Nurse's Answer (Patient-Focused)",
-                        interactive=False,
-                        lines=15,
-                        placeholder="Patient-focused answers will appear here..."
-                    )
-        
-        # Tab 3: Carer Advice
-        with gr.Tab("👥 Carer Advice"):
-            gr.Markdown("## AI-Powered Carer Guidance")
-            gr.Markdown("Get expert advice and answers for carers")
-            
-            with gr.Row():
-                with gr.Column(scale=1):
-                    gr.Markdown("### 🤖 General Carer Advice")
-                    
-                    carer_advice_output = gr.Textbox(
-                        label="Carer-Focused Nursing Advice",
-                        interactive=False,
-                        lines=20,
-                        placeholder="Carer-focused advice will appear here after submitting patient information..."
-                    )
-                    
-                    get_carer_advice_btn = gr.Button("Get Carer Advice", variant="primary", size="lg")
-                
-                with gr.Column(scale=1):
-                    gr.Markdown("### 💬 Carer Questions")
-                    gr.Markdown("Ask questions from the carer's perspective")
-                    
-                    carer_question = gr.Textbox(
-                        label="Carer's Question",
-                        info="Ask questions about caregiving, monitoring, or support",
-                        placeholder="e.g., 'How can I help with pain management?', 'What signs should I watch for?', 'How can I provide emotional support?'",
-                        lines=3
-                    )
-                    
-                    ask_carer_question_btn = gr.Button("Ask AI Nurse (Carer View)", variant="primary", size="lg")
-                    
-                    carer_question_output = gr.Textbox(
-                        label="AI Nurse's Answer (Carer-Focused)",
-                        interactive=False,
-                        lines=15,
-                        placeholder="Carer-focused answers will appear here..."
-                    )
-    
-    # Event handlers
-    submit_btn.click(
-        fn=collect_patient_info,
-        inputs=[gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date],
-        outputs=[json_output]
-    )
-    
-    # Patient Advice Tab
-    get_patient_advice_btn.click(
-        fn=get_patient_focused_advice,
-        inputs=[gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date],
-        outputs=[patient_advice_output]
-    )
-    
-    ask_patient_question_btn.click(
-        fn=get_patient_question_answer,
-        inputs=[gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, patient_question],
-        outputs=[patient_question_output]
-    )
-    
-    # Carer Advice Tab
-    get_carer_advice_btn.click(
-        fn=get_carer_focused_advice,
-        inputs=[gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date],
-        outputs=[carer_advice_output]
-    )
-    
-    ask_carer_question_btn.click(
-        fn=get_carer_question_answer,
-        inputs=[gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, carer_question],
-        outputs=[carer_question_output]
-    )
-    
-    # Save/Load functionality
-    save_btn.click(
-        fn=save_patient_data,
-        inputs=[gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, save_filename],
-        outputs=[save_load_status, load_file_dropdown]
-    )
-    
-    load_btn.click(
-        fn=load_patient_data,
-        inputs=[load_file_dropdown],
-        outputs=[save_load_status, gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date]
-    )
-    
-    clear_btn.click(
-        fn=clear_form,
-        outputs=[gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, save_load_status, patient_advice_output, patient_question_output, carer_advice_output, carer_question_output]
-    )
+def _prefetch_usable(advice_fan_out, patient_args, name):
+    """Whether the session's fan-out has (or is generating) this view for these patient details"""
+    if advice_fan_out is None or not advice_fan_out.matches(patient_args, name):
+        return False
+    text, done = advice_fan_out.peek(name)
+    # A failed generation is retried on demand instead of showing the error again
+    return not (done and (not text or text.startswith("❌")))
+
+def _prefetched_handler(name):
+    """
+    Advice handler that shows the view from the session's submit fan-out when there is one
+    """
+    handler = _advice_handler(name)
+
+    if ASYNC_HANDLERS:
+        async def prefetched(*args):
+            *patient_args, advice_fan_out = args
+            if _prefetch_usable(advice_fan_out, tuple(patient_args), name):
+                try:
+                    async for text in advice_fan_out.afollow(name):
+                        yield text
+                    return
+                except fan_out.FanOutCancelled:
+                    pass
+            if STREAM_RESPONSES:
+                async for text in handler(*patient_args):
+                    yield text
+            else:
+                yield await handler(*patient_args)
+        return prefetched
+
+    def prefetched(*args):
+        *patient_args, advice_fan_out = args
+        if _prefetch_usable(advice_fan_out, tuple(patient_args), name):
+            try:
+                yield from advice_fan_out.follow(name)
+                return
+            except fan_out.FanOutCancelled:
+                pass
+        if STREAM_RESPONSES:
+            yield from handler(*patient_args)
+        else:
+            yield handler(*patient_args)
+    return prefetched
+
+# The interface and its form handlers live in ui.py; app.app builds it on first use
+_UI_NAMES = ("app", "save_patient_form", "load_patient_form", "search_saved_files", "clear_form")
+
+def __getattr__(name):
+    if name in _UI_NAMES:
+        import ui
+        return ui.build_app() if name == "app" else getattr(ui, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
-    app.launch(
-        server_name="0.0.0.0",
-        server_port=7860,
-        share=False,
-        show_error=True
-    )
\ No newline at end of file
+    import sys
+    # Let ui.py's "import app" use this module rather than loading a second copy
+    sys.modules.setdefault("app", sys.modules[__name__])
+    import ui
+    ui.main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Batch advice generator for every saved patient record
+
+Pre-generates advice overnight for each record in saved_data/ and writes it
+next to the record as <name>.advice.json. Records are read one at a time and
+handed to a bounded worker pool, requests are paced to stay under a rate
+limit (and wait behind interactive users for the shared quota), and progress is checkpointed so an interrupted run picks up where it
+stopped.
+
+Usage:
+    python batch_advice.py --workers 4 --rpm 60
+    python batch_advice.py --personas carer --fresh
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+import app
+import rate_limiter
+
+ADVICE_FUNCTIONS = {
+    "nursing": app.get_nursing_advice,
+    "patient": app.get_patient_focused_advice,
+    "carer": app.get_carer_focused_advice,
+}
+
+def iter_records(data_dir):
+    """
+    Yield patient record paths one at a time without listing the whole directory first
+    """
+    with os.scandir(data_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(".json") and not entry.name.endswith(app.ADVICE_FILE_SUFFIX):
+                yield entry.path
+
+def advice_path(record_path):
+    """Where the advice for a record is written"""
+    return record_path[:-len(".json")] + app.ADVICE_FILE_SUFFIX
+
+class Checkpoint:
+    """
+    Append-only log of finished records, so a crash never loses earlier progress
+    """
+
+    def __init__(self, path, fresh=False):
+        self.path = path
+        self.done = {}
+        self._lock = threading.Lock()
+
+        if fresh and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # half-written line from an interrupted run
+                    self.done[entry["file"]] = entry["mtime"]
+
+    def is_done(self, record_path):
+        name = os.path.basename(record_path)
+        return self.done.get(name) == os.path.getmtime(record_path) and os.path.exists(advice_path(record_path))
+
+    def mark_done(self, record_path, mtime):
+        name = os.path.basename(record_path)
+        with self._lock:
+            self.done[name] = mtime
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"file": name, "mtime": mtime}) + "\n")
+
+class RequestPacer:
+    """
+    Spaces out requests so the batch stays under its own requests-per-minute limit
+
+    This only paces the batch; the quota shared with the app is rate_limiter.RateLimiter.
+    """
+
+    def __init__(self, requests_per_minute):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+def process_record(record_path, personas, pacer, use_cache=True):
+    """
+    Generate advice for one record and write it next to the record
+
+    Returns the number of advice calls made and how many of them failed.
+    """
+    with open(record_path, 'r', encoding='utf-8') as f:
+        patient_record = json.load(f)
+    fields = app.patient_fields(patient_record)
+
+    results = {}
+    failures = 0
+    for persona in personas:
+        pacer.wait()
+        started = time.perf_counter()
+        # Queue behind people using the app for the shared requests/tokens per minute quota
+        with rate_limiter.use_priority(rate_limiter.PRIORITY_BATCH):
+            advice = ADVICE_FUNCTIONS[persona](*fields, use_cache=use_cache)
+        ok = not advice.startswith("❌")
+        failures += 0 if ok else 1
+        results[persona] = {"advice": advice, "ok": ok, "seconds": round(time.perf_counter() - started, 3)}
+
+    output = {
+        "record": os.path.basename(record_path),
+        "generated_at": datetime.now().isoformat(),
+        "model": app.OPENAI_MODEL,
+        "advice": results,
+    }
+    target = advice_path(record_path)
+    temp_path = target + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(output, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, target)
+
+    return len(personas), failures
+
+def run_batch(data_dir="saved_data", personas=("patient", "carer"), workers=4, rpm=60,
+              checkpoint_path=None, use_cache=True, fresh=False, log=print):
+    """
+    Generate advice for every record in data_dir and return a summary of the run
+    """
+    checkpoint = Checkpoint(checkpoint_path or os.path.join(data_dir, ".batch_checkpoint.jsonl"), fresh=fresh)
+    pacer = RequestPacer(rpm)
+    summary = {"records": 0, "skipped": 0, "succeeded": 0, "failed": 0, "calls": 0, "failed_calls": 0}
+    started = time.perf_counter()
+
+    def finish(future, record_path, mtime):
+        try:
+            calls, failures = future.result()
+        except Exception as e:
+            log(f"❌ {os.path.basename(record_path)}: {str(e)}")
+            summary["failed"] += 1
+            return
+        summary["calls"] += calls
+        summary["failed_calls"] += failures
+        if failures:
+            log(f"⚠️  {os.path.basename(record_path)}: {failures} of {calls} advice calls failed")
+            summary["failed"] += 1
+        else:
+            checkpoint.mark_done(record_path, mtime)
+            summary["succeeded"] += 1
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        for record_path in iter_records(data_dir):
+            summary["records"] += 1
+            if checkpoint.is_done(record_path):
+                summary["skipped"] += 1
+                continue
+
+            # Only keep a couple of records per worker queued so huge directories stream through
+            if len(pending) >= workers * 2:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    finish(future, *pending.pop(future))
+
+            mtime = os.path.getmtime(record_path)
+            future = pool.submit(process_record, record_path, personas, pacer, use_cache)
+            pending[future] = (record_path, mtime)
+
+        finished, _ = wait(pending)
+        for future in finished:
+            finish(future, *pending.pop(future))
+
+    elapsed = time.perf_counter() - started
+    summary["elapsed_seconds"] = round(elapsed, 2)
+    summary["records_per_minute"] = round(60 * (summary["succeeded"] + summary["failed"]) / elapsed, 2) if elapsed else 0.0
+    summary["calls_per_second"] = round(summary["calls"] / elapsed, 3) if elapsed else 0.0
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate advice for every saved patient record")
+    parser.add_argument("--data-dir", default="saved_data", help="Folder of saved patient records")
+    parser.add_argument("--personas", default="patient,carer", help=f"Comma-separated advice types: {', '.join(ADVICE_FUNCTIONS)}")
+    parser.add_argument("--workers", type=int, default=4, help="Number of records processed at once")
+    parser.add_argument("--rpm", type=float, default=60, help="Maximum AI requests per minute (0 for no limit)")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <data-dir>/.batch_checkpoint.jsonl)")
+    parser.add_argument("--no-cache", action="store_true", help="Always ask the model instead of using cached advice")
+    parser.add_argument("--fresh", action="store_true", help="Ignore the checkpoint and process every record again")
+    args = parser.parse_args()
+
+    personas = [persona.strip() for persona in args.personas.split(",") if persona.strip()]
+    unknown = [persona for persona in personas if persona not in ADVICE_FUNCTIONS]
+    if unknown:
+        parser.error(f"Unknown advice type(s): {', '.join(unknown)}")
+
+    print("🏥 Batch Advice Generator")
+    print("=" * 50)
+    summary = run_batch(
+        data_dir=args.data_dir,
+        personas=personas,
+        workers=args.workers,
+        rpm=args.rpm,
+        checkpoint_path=args.checkpoint,
+        use_cache=not args.no_cache,
+        fresh=args.fresh
+    )
+
+    print("\n" + "=" * 50)
+    print("📊 Batch Summary:")
+    print(f"   Records found: {summary['records']}")
+    print(f"   Skipped (already done): {summary['skipped']}")
+    print(f"   Succeeded: {summary['succeeded']}")
+    print(f"   Failed: {summary['failed']}")
+    print(f"   Advice calls: {summary['calls']} ({summary['failed_calls']} failed)")
+    print(f"   Elapsed: {summary['elapsed_seconds']}s")
+    print(f"   Throughput: {summary['records_per_minute']} records/min, {summary['calls_per_second']} calls/s")
+
+if __name__ == "__main__":
+    main()
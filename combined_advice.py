@@ -0,0 +1,88 @@
+"""
+Combined advice in one AI call
+
+Instead of three calls that each send the same patient details, the model is
+asked once for a JSON document holding the six sections of the nursing
+assessment, the patient-focused advice and the carer-focused advice. The
+document is checked against SCHEMA, and each advice view is rendered from it.
+"""
+
+import json
+
+import advice_sections
+
+# Sections of the general nursing assessment: (JSON key, heading)
+ASSESSMENT_SECTIONS = tuple((section.key, section.heading) for section in advice_sections.SECTIONS)
+
+# The advice views rendered from one document, by persona
+VIEWS = ("nursing", "patient_advice", "carer_advice")
+
+_TEXT = {"type": "string", "minLength": 1}
+
+SCHEMA = {
+    "type": "object",
+    "required": ["assessment", "patient_advice", "carer_advice"],
+    "properties": {
+        "assessment": {
+            "type": "object",
+            "required": [key for key, _ in ASSESSMENT_SECTIONS],
+            "properties": {key: _TEXT for key, _ in ASSESSMENT_SECTIONS},
+        },
+        "patient_advice": _TEXT,
+        "carer_advice": _TEXT,
+    },
+}
+
+# Models that accept response_format={"type": "json_object"}, by name prefix
+JSON_MODE_MODELS = ("gpt-4-turbo", "gpt-4-1106", "gpt-4-0125", "gpt-4o", "gpt-3.5-turbo-1106", "gpt-3.5-turbo-0125")
+
+class InvalidAdvice(ValueError):
+    """The model's reply was not a document matching SCHEMA"""
+
+def validate(value, schema=SCHEMA, path="advice"):
+    """
+    Check a parsed document against a schema (the object/string subset of JSON Schema used here)
+
+    Raises InvalidAdvice naming the first problem found.
+    """
+    expected = schema.get("type")
+    if expected == "object":
+        if not isinstance(value, dict):
+            raise InvalidAdvice(f"{path} should be an object")
+        for key in schema.get("required", ()):
+            if key not in value:
+                raise InvalidAdvice(f"{path} is missing {key}")
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                validate(value[key], subschema, f"{path}.{key}")
+    elif expected == "string":
+        if not isinstance(value, str):
+            raise InvalidAdvice(f"{path} should be a string")
+        if len(value.strip()) < schema.get("minLength", 0):
+            raise InvalidAdvice(f"{path} is empty")
+
+def parse(text):
+    """
+    Parse and check the model's reply, allowing for a ```json fence around it
+    """
+    text = (text or "").strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[-1].rsplit("```", 1)[0]
+    try:
+        document = json.loads(text)
+    except ValueError as e:
+        raise InvalidAdvice(f"reply is not JSON: {e}") from None
+    validate(document)
+    return document
+
+def render(document, view):
+    """The text of one advice view, laid out like the separate calls' replies"""
+    if view == "nursing":
+        return advice_sections.stitch({key: text.strip() for key, text in document["assessment"].items()})
+    return document[view].strip()
+
+def request_options(model):
+    """Extra chat completion arguments that ask for JSON, where the model supports it"""
+    if any(model.startswith(name) for name in JSON_MODE_MODELS):
+        return {"response_format": {"type": "json_object"}}
+    return {}
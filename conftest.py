@@ -0,0 +1,27 @@
+"""
+pytest setup: every test starts offline with a closed circuit breaker, empty caches, no
+rate limit and its own empty patient store, so the suite leaves saved_data/ alone
+"""
+
+import os
+
+# Point any client created during the tests at a closed local port, before app reads the settings
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ["OPENAI_BASE_URL"] = "http://127.0.0.1:9/v1"
+
+import pytest
+
+import app
+import patient_store
+import testkit
+
+@pytest.fixture(autouse=True)
+def clean_app(monkeypatch, tmp_path):
+    data_dir = str(tmp_path / "saved_data")
+    monkeypatch.setenv("PATIENT_DATA_DIR", data_dir)
+    monkeypatch.setattr(app, "store", patient_store.PatientStore(data_dir))
+    for name, value in testkit.clean_settings().items():
+        monkeypatch.setattr(app, name, value)
+    testkit.reset_state()
+    yield
+    testkit.reset_state()
@@ -6,13 +6,17 @@ Demo script showing AI nursing advice capabilities
 import os
 from dotenv import load_dotenv
 from openai import OpenAI
+import rate_limiter
 from datetime import datetime, date
 
 # Load environment variables
 load_dotenv()
 
 # Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL") or None)
+
+# Share the app's requests/tokens per minute quota
+rate_limit = rate_limiter.from_env()
 
 def demo_ai_advice():
     """Demonstrate AI nursing advice with sample patient data"""
@@ -81,12 +85,14 @@ Please provide advice in the following structure:
 Please be specific, practical, and empathetic in your advice. Focus on actionable guidance that a carer can implement immediately.
 """
 
+        messages = [
+            {"role": "system", "content": "You are an experienced senior nurse with extensive clinical knowledge. Provide practical, evidence-based nursing advice for patient carers."},
+            {"role": "user", "content": prompt}
+        ]
+        rate_limit.acquire(rate_limiter.estimate_request_tokens(messages, 1500))
         response = client.chat.completions.create(
             model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are an experienced senior nurse with extensive clinical knowledge. Provide practical, evidence-based nursing advice for patient carers."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=messages,
             max_tokens=1500,
             temperature=0.7
         )
@@ -6,13 +6,17 @@ Demo script showing the new specific advice feature
 import os
 from dotenv import load_dotenv
 from openai import OpenAI
+import rate_limiter
 from datetime import datetime, date
 
 # Load environment variables
 load_dotenv()
 
 # Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL") or None)
+
+# Share the app's requests/tokens per minute quota
+rate_limit = rate_limiter.from_env()
 
 def demo_specific_advice():
     """Demonstrate the specific advice feature with sample questions"""
@@ -89,12 +93,14 @@ Please provide:
 Be empathetic, specific, and practical. Focus on what the carer can do right now to help their patient.
 """
 
+            messages = [
+                {"role": "system", "content": "You are an experienced senior nurse with extensive clinical knowledge. Provide practical, evidence-based nursing advice for patient carers. Be empathetic and specific in your guidance."},
+                {"role": "user", "content": prompt}
+            ]
+            rate_limit.acquire(rate_limiter.estimate_request_tokens(messages, 1200))
             response = client.chat.completions.create(
                 model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are an experienced senior nurse with extensive clinical knowledge. Provide practical, evidence-based nursing advice for patient carers. Be empathetic and specific in your guidance."},
-                    {"role": "user", "content": prompt}
-                ],
+                messages=messages,
                 max_tokens=1200,
                 temperature=0.7
             )
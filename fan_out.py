@@ -0,0 +1,198 @@
+"""
+Parallel fan-out of several advice generations for one patient
+
+When a carer submits a patient, the general, patient-focused and carer-focused
+advice can all be generated at the same time instead of one after another as
+each tab is opened. A FanOut runs the generations in the background and keeps
+the latest text of each, so a tab opened later shows the finished advice
+straight away or follows the generation still in progress.
+
+FanOutPool caps how many fan-outs run at once so a busy deployment doesn't
+exhaust its upstream quota; when it is full, no fan-out is started and advice
+is generated on demand as before.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class FanOutCancelled(Exception):
+    """Raised in callers following a generation that was cancelled"""
+
+class _View:
+    """Latest text of one generation"""
+
+    def __init__(self):
+        self.text = None
+        self.version = 0
+        self.done = False
+        self.error = None
+
+class FanOut:
+    """
+    A set of named generations for one patient, running in the background
+    """
+
+    def __init__(self, key, names):
+        self.key = key
+        self._views = {name: _View() for name in names}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        # Async followers waiting for a change: (event loop, asyncio.Event) pairs
+        self._waiters = set()
+        self._cancelled = False
+
+    def matches(self, key, name=None):
+        """Whether this fan-out was started for key (and includes the named generation)"""
+        return self.key == key and (name is None or name in self._views)
+
+    def _run(self, name, produce):
+        view = self._views[name]
+        error = None
+        updates = None
+        try:
+            updates = produce()
+            for text in updates:
+                with self._lock:
+                    if self._cancelled:
+                        error = FanOutCancelled("The advice generation was cancelled")
+                        break
+                    view.text = text
+                    view.version += 1
+                    self._notify()
+        except Exception as e:
+            error = e
+        finally:
+            if updates is not None and hasattr(updates, "close"):
+                updates.close()
+            with self._lock:
+                view.error = error
+                view.done = True
+                self._notify()
+
+    def _notify(self):
+        """Wake every follower; the caller holds the lock"""
+        self._changed.notify_all()
+        for loop, changed in self._waiters:
+            try:
+                loop.call_soon_threadsafe(changed.set)
+            except RuntimeError:
+                # The follower's event loop has already closed
+                pass
+
+    def follow(self, name):
+        """
+        Yield the text of a generation as it grows, starting with whatever is already there
+        """
+        view = self._views[name]
+        seen = 0
+        while True:
+            with self._lock:
+                while view.version == seen and not view.done:
+                    self._changed.wait()
+                text, version, done, error = view.text, view.version, view.done, view.error
+
+            if version != seen:
+                seen = version
+                yield text
+            if done:
+                if error:
+                    raise error
+                return
+
+    async def afollow(self, name):
+        """
+        Async version of follow; the generation wakes the event loop on each update, so
+        followers wait without holding a worker thread each
+        """
+        view = self._views[name]
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        changed = waiter[1]
+        seen = 0
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            while True:
+                with self._lock:
+                    changed.clear()
+                    text, version, done, error = view.text, view.version, view.done, view.error
+
+                if version != seen:
+                    seen = version
+                    yield text
+                if done:
+                    if error:
+                        raise error
+                    return
+                await changed.wait()
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+    def peek(self, name):
+        """Latest text of a generation and whether it has finished, without waiting"""
+        with self._lock:
+            view = self._views[name]
+            return view.text, view.done
+
+    def result(self, name):
+        """Wait for a generation to finish and return its text"""
+        text = None
+        for text in self.follow(name):
+            pass
+        return text
+
+    def done(self):
+        """Whether every generation has finished"""
+        with self._lock:
+            return all(view.done for view in self._views.values())
+
+    def cancel(self):
+        """Stop the generations that are still running (finished text is kept)"""
+        with self._lock:
+            self._cancelled = True
+
+class FanOutPool:
+    """
+    Starts fan-outs on a shared thread pool, with a cap on how many run at once
+    """
+
+    def __init__(self, max_concurrent=4, max_workers=None):
+        self.max_concurrent = max_concurrent
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or max_concurrent * 4, thread_name_prefix="fan-out")
+        self.started = 0
+        self.skipped = 0
+
+    def start(self, key, jobs):
+        """
+        Run every generator function in jobs (a dict of name -> function) concurrently
+
+        Returns the FanOut, or None if the pool is already running max_concurrent fan-outs.
+        """
+        if not self._slots.acquire(blocking=False):
+            self.skipped += 1
+            return None
+        self.started += 1
+
+        fan_out = FanOut(key, list(jobs))
+        remaining = [len(jobs)]
+        remaining_lock = threading.Lock()
+
+        def run(name, produce):
+            try:
+                fan_out._run(name, produce)
+            finally:
+                with remaining_lock:
+                    remaining[0] -= 1
+                    finished = remaining[0] == 0
+                if finished:
+                    self._slots.release()
+
+        for name, produce in jobs.items():
+            self._executor.submit(run, name, produce)
+        return fan_out
+
+    def stats(self):
+        """How many fan-outs were started and how many were skipped because the pool was full"""
+        return {"started": self.started, "skipped": self.skipped, "max_concurrent": self.max_concurrent}
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+End-to-end load benchmark for the Gradio app
+
+Simulated carers click through the app with gradio_client, using the same
+event endpoints as the buttons (submit, patient advice, carer questions, save
+and load). By default the app is launched in-process against the local mock
+model server, so the benchmark runs offline. Reports p50/p95/p99 latency,
+time to first token, throughput and error rates per event, and writes them as
+JSON so runs can be compared.
+
+Usage:
+    python load_benchmark.py --users 20 --iterations 3 --output results.json
+    python load_benchmark.py --users 50 --latency lognormal:-0.5,0.4 --compare results.json
+    python load_benchmark.py --app-url http://127.0.0.1:7860/ --users 10
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import mock_openai_server
+
+# Click scripts: the events a carer triggers in one visit, in order
+SCRIPTS = {
+    "new_patient": ["submit", "save", "patient_advice", "carer_question", "load"],
+    "returning_carer": ["load", "carer_question", "carer_question", "patient_advice"],
+    "question_only": ["carer_question"],
+}
+DEFAULT_MIX = {"new_patient": 1, "returning_carer": 3}
+
+# Events that stream their reply, so time to first token is measured
+STREAMING_EVENTS = {"patient_advice", "patient_question", "carer_advice", "carer_question"}
+
+CARER_QUESTIONS = [
+    "When can she have a shower?",
+    "How much walking should he be doing each day?",
+    "What signs of infection should I look out for?",
+    "Can she sleep on her side yet?",
+    "How do I help with the pain at night?",
+    "When should we call the GP?",
+]
+
+DIAGNOSES = [
+    ("Hip replacement surgery", "Total hip arthroplasty (right hip)", "Physical therapy 3x weekly"),
+    ("Breast cancer", "Lumpectomy with sentinel node biopsy", "Radiotherapy 5x weekly for 3 weeks"),
+    ("Coronary artery disease", "Coronary artery bypass graft", "Cardiac rehabilitation programme"),
+    ("Knee replacement", "Total knee arthroplasty (left knee)", "Physiotherapy and pain management"),
+]
+
+def percentile(values, fraction):
+    """Linear-interpolated percentile of a list of numbers (None if empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def summarize(samples, elapsed):
+    """
+    Per-event statistics from a list of samples (event, ok, latency, ttft)
+    """
+    events = {}
+    for name in sorted({sample["event"] for sample in samples}):
+        event_samples = [sample for sample in samples if sample["event"] == name]
+        latencies = [sample["latency"] for sample in event_samples if sample["ok"]]
+        ttfts = [sample["ttft"] for sample in event_samples if sample["ok"] and sample["ttft"] is not None]
+        errors = sum(1 for sample in event_samples if not sample["ok"])
+        events[name] = {
+            "count": len(event_samples),
+            "errors": errors,
+            "error_rate": round(errors / len(event_samples), 4),
+            "throughput_per_second": round(len(event_samples) / elapsed, 3) if elapsed else 0.0,
+            "latency": _distribution(latencies),
+            "time_to_first_token": _distribution(ttfts) if name in STREAMING_EVENTS else None,
+        }
+
+    errors = sum(1 for sample in samples if not sample["ok"])
+    overall = {
+        "count": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "throughput_per_second": round(len(samples) / elapsed, 3) if elapsed else 0.0,
+        "latency": _distribution([sample["latency"] for sample in samples if sample["ok"]]),
+    }
+    return events, overall
+
+def _distribution(values):
+    def rounded(value):
+        return round(value, 4) if value is not None else None
+
+    return {
+        "p50": rounded(percentile(values, 0.50)),
+        "p95": rounded(percentile(values, 0.95)),
+        "p99": rounded(percentile(values, 0.99)),
+        "mean": rounded(sum(values) / len(values)) if values else None,
+        "max": rounded(max(values)) if values else None,
+    }
+
+class SimulatedUser:
+    """
+    One carer with their own browser session and patient
+    """
+
+    def __init__(self, number, app_url, think_time, rng):
+        from gradio_client import Client
+
+        self.number = number
+        self.client = Client(app_url, verbose=False, download_files=False)
+        self.think_time = think_time
+        self.rng = rng
+        diagnosis, operation, treatment = DIAGNOSES[number % len(DIAGNOSES)]
+        # Vary the patient per user so replies aren't all served from one cache entry
+        self.patient = ("Female" if number % 2 else "Male", 40 + number % 50, diagnosis, operation,
+                        "2024-01-10", treatment, "2024-01-12")
+        self.filename = f"loadtest_user_{number}"
+
+    def arguments(self, event):
+        if event in ("submit", "patient_advice", "carer_advice"):
+            return self.patient
+        if event in ("patient_question", "carer_question"):
+            return self.patient + (self.rng.choice(CARER_QUESTIONS),)
+        if event == "save":
+            return self.patient + (self.filename,)
+        if event == "load":
+            return (self.filename + ".json",)
+        raise ValueError(f"Unknown event {event}")
+
+    def run_event(self, event):
+        """Trigger one event and return its sample"""
+        started = time.perf_counter()
+        ttft = None
+        ok = True
+        error = None
+        try:
+            job = self.client.submit(*self.arguments(event), api_name=f"/{event}")
+            if event in STREAMING_EVENTS:
+                for update in job:
+                    if ttft is None and update:
+                        ttft = time.perf_counter() - started
+            result = job.result()
+            first = result[0] if isinstance(result, (list, tuple)) else result
+            if isinstance(first, str) and first.startswith("❌"):
+                ok, error = False, first[:200]
+        except Exception as e:
+            ok, error = False, str(e)[:200]
+        return {
+            "event": event,
+            "user": self.number,
+            "ok": ok,
+            "latency": time.perf_counter() - started,
+            "ttft": ttft,
+            "error": error,
+        }
+
+    def run(self, scripts, iterations, samples, lock, deadline=None):
+        # Make sure there's a record to load for returning visits
+        first = self.run_event("save")
+        with lock:
+            samples.append(first)
+
+        visits = 0
+        while iterations is None or visits < iterations:
+            visits += 1
+            script = self.rng.choices(list(scripts), weights=list(scripts.values()))[0]
+            for event in SCRIPTS[script]:
+                if deadline and time.monotonic() > deadline:
+                    return
+                sample = self.run_event(event)
+                with lock:
+                    samples.append(sample)
+                if self.think_time:
+                    time.sleep(self.rng.uniform(0, 2 * self.think_time))
+
+def start_local_app(mock_url, cache, data_dir, port=0):
+    """
+    Launch the app in this process, pointed at the mock server, and return (blocks, url, restore)
+
+    restore() puts back the app settings and environment variables that were changed
+    for the benchmark.
+    """
+    from openai import OpenAI, AsyncOpenAI
+    import httpx
+
+    environment = {
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY") or "mock",
+        "OPENAI_BASE_URL": mock_url,
+        "PATIENT_DATA_DIR": data_dir,
+    }
+    original_environment = {name: os.environ.get(name) for name in environment}
+    os.environ.update(environment)
+    import app
+    import patient_store
+
+    # The app may already have been imported with other settings, so point it at the mock explicitly
+    changed = ("client", "async_client", "store", "RESPONSE_CACHE_ENABLED", "SEMANTIC_CACHE_ENABLED", "COALESCE_REQUESTS")
+    original = {name: getattr(app, name) for name in changed}
+
+    def restore():
+        for name, value in original.items():
+            setattr(app, name, value)
+        for name, value in original_environment.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    app.client = OpenAI(api_key="mock", base_url=mock_url, max_retries=0)
+    app.async_client = AsyncOpenAI(
+        api_key="mock",
+        base_url=mock_url,
+        max_retries=0,
+        timeout=app.OPENAI_TIMEOUT,
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=app.OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=app.OPENAI_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            timeout=app.OPENAI_TIMEOUT
+        )
+    )
+    app.store = patient_store.PatientStore(data_dir)
+    app.RESPONSE_CACHE_ENABLED = app.SEMANTIC_CACHE_ENABLED = app.COALESCE_REQUESTS = cache
+    app.advice_cache.clear()
+    app.question_cache.clear()
+
+    try:
+        app.app.launch(prevent_thread_lock=True, server_name="127.0.0.1", server_port=port or None, quiet=True)
+    except Exception:
+        restore()
+        raise
+    return app.app, app.app.local_url, restore
+
+def run_benchmark(users=10, iterations=2, duration=None, scripts=None, think_time=0.0, ramp_up=0.0,
+                  app_url=None, mock_config=None, cache=False, seed=None, log=print):
+    """
+    Run the benchmark and return the results as a dict
+    """
+    scripts = scripts or DEFAULT_MIX
+    mock = blocks = restore = None
+    if app_url is None:
+        mock = mock_openai_server.serve_in_background(mock_config or mock_openai_server.MockConfig())
+        data_dir = tempfile.mkdtemp(prefix="carer_loadtest_")
+        blocks, app_url, restore = start_local_app(mock.base_url, cache, data_dir)
+        log(f"🚀 App running at {app_url} against mock model at {mock.base_url}")
+
+    samples = []
+    lock = threading.Lock()
+    rng = random.Random(seed)
+    try:
+        simulated = []
+        for number in range(users):
+            simulated.append(SimulatedUser(number, app_url, think_time, random.Random(rng.random())))
+
+        log(f"👥 {users} simulated users, {iterations} visit(s) each")
+        deadline = time.monotonic() + duration if duration else None
+        threads = []
+        started = time.perf_counter()
+        for user in simulated:
+            thread = threading.Thread(target=user.run, args=(scripts, None if duration else iterations, samples, lock, deadline))
+            thread.start()
+            threads.append(thread)
+            if ramp_up and users > 1:
+                time.sleep(ramp_up / (users - 1))
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        if blocks is not None:
+            blocks.close()
+            restore()
+            shutil.rmtree(data_dir, ignore_errors=True)
+        if mock is not None:
+            mock.shutdown()
+
+    events, overall = summarize(samples, elapsed)
+    errors = [sample["error"] for sample in samples if sample["error"]]
+    return {
+        "started_at": datetime.now().isoformat(),
+        "config": {
+            "users": users,
+            "iterations": iterations,
+            "duration": duration,
+            "scripts": scripts,
+            "think_time": think_time,
+            "ramp_up": ramp_up,
+            "cache": cache,
+            "app_url": app_url if blocks is None else "local",
+            "async_handlers": _app_setting("ASYNC_HANDLERS"),
+            "streaming": _app_setting("STREAM_RESPONSES"),
+        },
+        "elapsed_seconds": round(elapsed, 3),
+        "events": events,
+        "overall": overall,
+        "sample_errors": sorted(set(errors))[:10],
+        "mock_server": mock.state.stats() if mock else None,
+    }
+
+def _app_setting(name):
+    import sys
+
+    module = sys.modules.get("app")
+    return getattr(module, name, None) if module else None
+
+def print_report(results, baseline=None):
+    """Print a per-event table, with p95 changes against a baseline run if given"""
+    def ms(value):
+        return f"{value * 1000:8.0f}" if value is not None else "       -"
+
+    print("\n" + "=" * 86)
+    print(f"{'event':18} {'count':>6} {'err%':>6} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ttft p50':>9} {'ttft p95':>9}")
+    print("-" * 86)
+    for name, event in list(results["events"].items()) + [("overall", results["overall"])]:
+        ttft = event.get("time_to_first_token") or {}
+        print(f"{name:18} {event['count']:6d} {event['error_rate'] * 100:6.1f} {event['throughput_per_second']:7.2f} "
+              f"{ms(event['latency']['p50'])} {ms(event['latency']['p95'])} {ms(event['latency']['p99'])} "
+              f"{ms(ttft.get('p50')):>9} {ms(ttft.get('p95')):>9}")
+    print("=" * 86)
+
+    if baseline:
+        print("\n📈 p95 latency compared with baseline:")
+        for name, event in results["events"].items():
+            before = baseline.get("events", {}).get(name, {}).get("latency", {}).get("p95")
+            after = event["latency"]["p95"]
+            if before and after:
+                print(f"   {name:18} {before * 1000:8.0f} ms -> {after * 1000:8.0f} ms ({(after - before) / before * 100:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Gradio app with simulated carers")
+    parser.add_argument("--users", type=int, default=10, help="Number of simultaneous users")
+    parser.add_argument("--iterations", type=int, default=2, help="Visits per user")
+    parser.add_argument("--duration", type=float, help="Run for this many seconds instead of a fixed number of visits")
+    parser.add_argument("--scripts", default=",".join(f"{name}={weight}" for name, weight in DEFAULT_MIX.items()),
+                        help=f"Weighted click scripts, e.g. new_patient=1,returning_carer=3 (available: {', '.join(SCRIPTS)})")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Average pause between clicks in seconds")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Seconds over which users join")
+    parser.add_argument("--app-url", help="Benchmark an app that is already running instead of launching one")
+    parser.add_argument("--latency", default="lognormal:-1,0.5", help="Mock model time to first token (see mock_openai_server.py)")
+    parser.add_argument("--tokens-per-second", type=float, default=80, help="Mock model generation speed")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Mock model 500 rate")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Mock model 429 rate")
+    parser.add_argument("--cache", action="store_true", help="Leave the response caches and request coalescing on")
+    parser.add_argument("--seed", type=int, help="Random seed for repeatable click scripts")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Earlier results JSON to compare p95 latency against")
+    args = parser.parse_args()
+
+    scripts = {}
+    for item in args.scripts.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in SCRIPTS:
+            parser.error(f"Unknown script: {name}")
+        scripts[name.strip()] = float(weight or 1)
+
+    print("🏥 Carer App Load Benchmark")
+    print("=" * 50)
+    results = run_benchmark(
+        users=args.users,
+        iterations=args.iterations,
+        duration=args.duration,
+        scripts=scripts,
+        think_time=args.think_time,
+        ramp_up=args.ramp_up,
+        app_url=args.app_url,
+        mock_config=mock_openai_server.MockConfig(
+            latency=args.latency,
+            tokens_per_second=args.tokens_per_second,
+            error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate,
+            seed=args.seed
+        ),
+        cache=args.cache,
+        seed=args.seed
+    )
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    if results["sample_errors"]:
+        print("\n⚠️  Sample errors:")
+        for error in results["sample_errors"]:
+            print(f"   {error}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+Prometheus metrics for the app
+
+Handlers wired in the Blocks event section are wrapped with instrument(),
+which counts calls and errors and records how long each one took. The AI
+call helpers record upstream latency, time to first token, prompt and
+completion tokens and an estimated cost. Cache, coalescing, fan-out,
+resilience and rate limit counters that the app keeps anyway are read when
+/metrics is scraped, so they cost nothing per request.
+
+Recording is a dictionary update under a lock. Set METRICS=false to turn it
+off entirely; instrument() then returns handlers unchanged.
+"""
+
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+
+ENABLED = os.getenv("METRICS", "true").lower() not in ("0", "false", "no", "off")
+
+# Buckets in seconds, from a cache hit to a slow full assessment
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+# US dollars per 1,000 prompt and completion tokens (longest matching model prefix wins)
+MODEL_PRICES = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-32k": (0.06, 0.12),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.005, 0.015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """Estimated price of one call in US dollars (0 for models without a known price)"""
+    matches = [name for name in MODEL_PRICES if model.startswith(name)]
+    if not matches:
+        return 0.0
+    prompt_price, completion_price = MODEL_PRICES[max(matches, key=len)]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """A counter with optional labels"""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labels, label_values), value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+class Histogram:
+    """A histogram of durations with optional labels"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            series[0][index] += 1
+            series[1] += 1
+            series[2] += value
+
+    def count(self, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            return series[1] if series else 0
+
+    def samples(self):
+        with self._lock:
+            series = {labels: (list(counts), count, total) for labels, (counts, count, total) in self._series.items()}
+        for label_values, (counts, count, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                yield self.name + "_bucket", _format_labels(self.labels, label_values, f'le="{_format_value(bound)}"'), cumulative
+            yield self.name + "_count", _format_labels(self.labels, label_values), count
+            yield self.name + "_sum", _format_labels(self.labels, label_values), total
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+class Collected:
+    """
+    Values read from elsewhere when metrics are scraped
+
+    read() returns a number, or a dict of {label values tuple: number}.
+    """
+
+    def __init__(self, name, help_text, read, labels=(), kind="gauge"):
+        self.name = name
+        self.help = help_text
+        self.read = read
+        self.labels = tuple(labels)
+        self.kind = kind
+
+    def samples(self):
+        values = self.read()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in sorted(values.items()):
+            if value is not None:
+                yield self.name, _format_labels(self.labels, label_values), value
+
+    def clear(self):
+        pass
+
+class Registry:
+    """All metrics exposed on /metrics"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def collect(self, name, help_text, read, labels=(), kind="gauge"):
+        return self._add(Collected(name, help_text, read, labels, kind))
+
+    def render(self):
+        """All metrics in the Prometheus text format"""
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = list(metric.samples())
+            except Exception:
+                continue  # a broken collector shouldn't take the whole endpoint down
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in self._metrics.values():
+            metric.clear()
+
+registry = Registry()
+
+handler_calls = registry.counter("carer_handler_calls_total", "Calls to each UI/API handler", ("handler",))
+handler_errors = registry.counter("carer_handler_errors_total", "Handler calls that raised, by exception type", ("handler", "error"))
+handler_latency = registry.histogram("carer_handler_latency_seconds", "Time each handler took, to its last output", ("handler",))
+upstream_calls = registry.counter("carer_upstream_calls_total", "AI calls, by persona", ("persona",))
+upstream_errors = registry.counter("carer_upstream_errors_total", "AI calls that failed after retries, by exception type", ("persona", "error"))
+upstream_latency = registry.histogram("carer_upstream_latency_seconds", "Time for a whole AI reply", ("persona",))
+time_to_first_token = registry.histogram("carer_upstream_time_to_first_token_seconds", "Time until the first words of a streamed AI reply", ("persona",))
+prompt_tokens = registry.counter("carer_prompt_tokens_total", "Prompt tokens sent", ("persona",))
+completion_tokens = registry.counter("carer_completion_tokens_total", "Completion tokens received", ("persona",))
+cost_dollars = registry.counter("carer_estimated_cost_dollars_total", "Estimated AI spend in US dollars", ("persona",))
+prompt_versions = registry.counter("carer_prompt_version_total", "Advice prompts built, by persona and prompt template version", ("persona", "version"))
+stale_replies = registry.counter("carer_stale_replies_total", "Saved advice served past its staleness window, and how the refresh went", ("persona", "result"))
+
+def record_upstream(persona, model, seconds, prompt, completion):
+    """Record one finished AI call"""
+    if not ENABLED:
+        return
+    upstream_calls.inc(persona)
+    upstream_latency.observe(seconds, persona)
+    prompt_tokens.inc(persona, amount=prompt)
+    completion_tokens.inc(persona, amount=completion)
+    cost_dollars.inc(persona, amount=estimate_cost(model, prompt, completion))
+
+def record_first_token(persona, seconds):
+    if ENABLED:
+        time_to_first_token.observe(seconds, persona)
+
+def record_upstream_error(persona, error):
+    if ENABLED:
+        upstream_errors.inc(persona, type(error).__name__)
+
+def _finish(name, started, error=None):
+    handler_calls.inc(name)
+    handler_latency.observe(time.perf_counter() - started, name)
+    if error is not None:
+        handler_errors.inc(name, type(error).__name__)
+
+def instrument(name, fn):
+    """
+    Wrap a handler so its calls, errors and latency are recorded under name
+
+    Generators and coroutines get a wrapper of the same kind, so Gradio still streams them.
+    """
+    if not ENABLED:
+        return fn
+
+    if inspect.isasyncgenfunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                async for item in fn(*args, **kwargs):
+                    yield item
+            except GeneratorExit:
+                _finish(name, started)  # the client stopped reading early
+                raise
+            except Exception as error:
+                _finish(name, started, error)
+                raise
+            _finish(name, started)
+    elif inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                yield from fn(*args, **kwargs)
+            except GeneratorExit:
+                _finish(name, started)  # the client stopped reading early
+                raise
+            except Exception as error:
+                _finish(name, started, error)
+                raise
+            _finish(name, started)
+    elif inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as error:
+                _finish(name, started, error)
+                raise
+            _finish(name, started)
+            return result
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as error:
+                _finish(name, started, error)
+                raise
+            _finish(name, started)
+            return result
+    return wrapper
+
+def add_route(fastapi_app, path="/metrics"):
+    """Serve the registry in the Prometheus text format on a FastAPI app"""
+    from fastapi.responses import PlainTextResponse
+
+    @fastapi_app.get(path, include_in_schema=False)
+    def metrics_endpoint():
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+    return fastapi_app
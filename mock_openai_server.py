@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible stand-in server for load and latency testing
+
+Speaks the chat completions protocol (streaming included) so the app, the
+demos and the batch generator can be benchmarked completely offline. Latency,
+generation speed, errors and 429s are all configurable, and replies are
+canned or built from a template.
+
+Usage:
+    python mock_openai_server.py --port 8001 --latency lognormal:-0.5,0.4 --tokens-per-second 40
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=mock python app.py
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_TEMPLATE = (
+    "Mock reply from {model}. This is placeholder advice generated locally for load testing, "
+    "in answer to: {question}"
+)
+
+FILLER_WORDS = (
+    "rest well drink plenty of fluids keep the wound clean and dry take medication as prescribed "
+    "walk a little more each day and contact the care team if anything changes"
+).split()
+
+def parse_latency(spec):
+    """
+    Turn a latency spec into a function returning seconds before the first token
+
+    Supported: "fixed:S", "uniform:LOW,HIGH", "normal:MEAN,STDDEV",
+    "lognormal:MU,SIGMA" and "exponential:MEAN" (all in seconds).
+    """
+    kind, _, values = (spec or "fixed:0").partition(":")
+    try:
+        params = [float(value) for value in values.split(",") if value.strip()]
+    except ValueError:
+        raise ValueError(f"Invalid latency spec: {spec}")
+
+    samplers = {
+        "fixed": (1, lambda: params[0]),
+        "uniform": (2, lambda: random.uniform(params[0], params[1])),
+        "normal": (2, lambda: random.gauss(params[0], params[1])),
+        "lognormal": (2, lambda: random.lognormvariate(params[0], params[1])),
+        "exponential": (1, lambda: random.expovariate(1 / params[0]) if params[0] > 0 else 0.0),
+    }
+    if kind not in samplers or len(params) != samplers[kind][0]:
+        raise ValueError(f"Invalid latency spec: {spec}")
+    sample = samplers[kind][1]
+    return lambda: max(0.0, sample())
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token)"""
+    return max(1, math.ceil(len(text or "") / 4))
+
+class MockConfig:
+    """
+    Behaviour of the stand-in server
+    """
+
+    def __init__(self, latency="fixed:0", tokens_per_second=0.0, error_rate=0.0, rate_limit_rate=0.0,
+                 rpm=0, response_words=120, template=DEFAULT_TEMPLATE, responses=None, seed=None):
+        self.latency = parse_latency(latency)
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rpm = rpm
+        self.response_words = response_words
+        self.template = template
+        self.responses = list(responses or [])
+        self.random = random.Random(seed)
+
+class MockState:
+    """Request counters and the sliding window used for --rpm"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.streamed = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.recent = deque()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "streamed": self.streamed,
+                "errors": self.errors,
+                "rate_limited": self.rate_limited,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+            }
+
+def build_reply(config, request, counter):
+    """
+    Reply text for a request: the next canned response, or the template plus filler words
+    """
+    messages = request.get("messages") or []
+    user_messages = [message.get("content", "") for message in messages if message.get("role") == "user"]
+    system_messages = [message.get("content", "") for message in messages if message.get("role") == "system"]
+    question = (user_messages[-1] if user_messages else "").strip().splitlines()
+    values = {
+        "model": request.get("model", "mock"),
+        "question": question[-1][:200] if question else "",
+        "system": (system_messages[0] if system_messages else "")[:200],
+        "max_tokens": request.get("max_tokens", ""),
+        "request": counter,
+    }
+
+    if config.responses:
+        return config.responses[(counter - 1) % len(config.responses)].format(**values)
+
+    text = config.template.format(**values)
+    words = text.split()
+    filler = [FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(max(0, config.response_words - len(words)))]
+    text = " ".join(words + filler)
+
+    # Respect max_tokens like the real API does
+    max_tokens = request.get("max_tokens")
+    if max_tokens and estimate_tokens(text) > max_tokens:
+        text = text[:max_tokens * 4]
+    return text
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockOpenAI/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, message, error_type, headers=None):
+        self._send_json(status, {"error": {"message": message, "type": error_type, "param": None, "code": None}}, headers)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+        elif self.path.rstrip("/").endswith("/stats"):
+            self._send_json(200, self.server.state.stats())
+        else:
+            self._send_error(404, f"Unknown path {self.path}", "invalid_request_error")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_error(404, f"Unknown path {self.path}", "invalid_request_error")
+            return
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            self._send_error(400, "Request body is not valid JSON", "invalid_request_error")
+            return
+
+        config, state = self.server.config, self.server.state
+        with state.lock:
+            state.requests += 1
+            counter = state.requests
+            now = time.monotonic()
+            while state.recent and now - state.recent[0] > 60:
+                state.recent.popleft()
+            over_rpm = bool(config.rpm) and len(state.recent) >= config.rpm
+            if not over_rpm:
+                state.recent.append(now)
+            roll = config.random.random()
+
+        if over_rpm or roll < config.rate_limit_rate:
+            with state.lock:
+                state.rate_limited += 1
+            self._send_error(429, "Rate limit reached (mock server)", "rate_limit_exceeded", {"Retry-After": "1"})
+            return
+        if roll < config.rate_limit_rate + config.error_rate:
+            with state.lock:
+                state.errors += 1
+            self._send_error(500, "Injected server error (mock server)", "server_error")
+            return
+
+        with state.lock:
+            state.in_flight += 1
+            state.max_in_flight = max(state.max_in_flight, state.in_flight)
+        try:
+            time.sleep(config.latency())
+            reply = build_reply(config, request, counter)
+            if request.get("stream"):
+                with state.lock:
+                    state.streamed += 1
+                self._stream(request, reply)
+            else:
+                self._complete(request, reply)
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+    def _token_delay(self):
+        tokens_per_second = self.server.config.tokens_per_second
+        return 1.0 / tokens_per_second if tokens_per_second else 0.0
+
+    def _complete(self, request, reply):
+        completion_tokens = estimate_tokens(reply)
+        time.sleep(self._token_delay() * completion_tokens)
+        prompt_tokens = sum(estimate_tokens(message.get("content", "")) for message in request.get("messages") or [])
+        self._send_json(200, {
+            "id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    def _stream(self, request, reply):
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = request.get("model", "mock")
+
+        def chunk(delta, finish_reason=None):
+            event = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            self._write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        delay = self._token_delay()
+        chunk({"role": "assistant", "content": ""})
+        # Send roughly one token (a word or part of one) per chunk
+        for index, word in enumerate(reply.split(" ")):
+            piece = word if index == 0 else " " + word
+            for start in range(0, len(piece), 4):
+                if delay:
+                    time.sleep(delay)
+                chunk({"content": piece[start:start + 4]})
+        chunk({}, "stop")
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 512
+
+    def __init__(self, address, config=None, verbose=False):
+        super().__init__(address, MockHandler)
+        self.config = config or MockConfig()
+        self.state = MockState()
+        self.verbose = verbose
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+def serve_in_background(config=None, host="127.0.0.1", port=0):
+    """
+    Start a mock server on a background thread and return it (use server.base_url and server.shutdown())
+    """
+    server = MockServer((host, port), config)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", default="fixed:0.3",
+                        help="Time to first token: fixed:S, uniform:LOW,HIGH, normal:MEAN,SD, lognormal:MU,SIGMA or exponential:MEAN")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="Generation speed (0 for instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests rejected with a 429")
+    parser.add_argument("--rpm", type=int, default=0, help="Reject requests over this many per minute with a 429 (0 for no limit)")
+    parser.add_argument("--response-words", type=int, default=120, help="Length of templated replies")
+    parser.add_argument("--template", default=DEFAULT_TEMPLATE,
+                        help="Reply template; fields: {model}, {question}, {system}, {max_tokens}, {request}")
+    parser.add_argument("--responses-file", help="JSON list of canned replies, used in turn (templates allowed)")
+    parser.add_argument("--seed", type=int, help="Random seed for repeatable error injection")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    responses = None
+    if args.responses_file:
+        with open(args.responses_file, 'r', encoding='utf-8') as f:
+            responses = json.load(f)
+
+    try:
+        config = MockConfig(
+            latency=args.latency,
+            tokens_per_second=args.tokens_per_second,
+            error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate,
+            rpm=args.rpm,
+            response_words=args.response_words,
+            template=args.template,
+            responses=responses,
+            seed=args.seed
+        )
+    except ValueError as e:
+        parser.error(str(e))
+
+    server = MockServer((args.host, args.port), config, verbose=args.verbose)
+    print(f"🧪 Mock OpenAI server listening on {server.base_url}")
+    print(f"   Point the app at it with OPENAI_BASE_URL={server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
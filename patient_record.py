@@ -0,0 +1,163 @@
+"""
+Typed patient record
+
+PatientRecord holds the seven patient form fields for one event. It is built
+once per submit, save or advice call and then shared: the dates are parsed
+and checked when it is created, the recovery timeline is worked out once for
+the prompt builders, and a content hash gives the caches a ready-made key.
+The same record produces the JSON that is shown on submit and written by the
+patient store.
+"""
+
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Optional
+
+import recovery_phases
+import response_cache
+
+# The form fields, in the order the advice functions take them
+FIELDS = (
+    "gender",
+    "age",
+    "diagnosis",
+    "operation_description",
+    "operation_date",
+    "treatment_details",
+    "treatment_start_date",
+)
+
+DATE_FORMAT = "%Y-%m-%d"
+MAX_AGE = 150
+
+def _parse_date(value, label):
+    """Turn a YYYY-MM-DD string (or date) into a date; None for a blank field"""
+    if isinstance(value, date):
+        return value
+    if value is None or not str(value).strip():
+        return None
+    try:
+        return datetime.strptime(str(value).strip(), DATE_FORMAT).date()
+    except ValueError:
+        raise ValueError(f"{label} must be a date in YYYY-MM-DD format, not {value!r}") from None
+
+def _parse_age(value):
+    """Whole years as an int; None for a blank field"""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    try:
+        age = int(float(value))
+    except (TypeError, ValueError):
+        raise ValueError(f"Age must be a number, not {value!r}") from None
+    if not 0 <= age <= MAX_AGE:
+        raise ValueError(f"Age must be between 0 and {MAX_AGE}, not {age}")
+    return age
+
+def _text(value):
+    return "" if value is None else str(value).strip()
+
+@dataclass(frozen=True)
+class PatientRecord:
+    """
+    The patient form fields, checked and parsed once
+
+    Blank fields are allowed (a record can be saved half filled in); malformed
+    dates and ages raise ValueError. timeline is None until both dates are set.
+    """
+    __slots__ = FIELDS + ("operation_day", "treatment_start_day", "timeline", "content_hash")
+
+    gender: str
+    age: Optional[int]
+    diagnosis: str
+    operation_description: str
+    operation_date: str
+    treatment_details: str
+    treatment_start_date: str
+
+    def __post_init__(self):
+        operation_day = _parse_date(self.operation_date, "Operation date")
+        treatment_start_day = _parse_date(self.treatment_start_date, "Treatment start date")
+        values = {
+            "gender": _text(self.gender),
+            "age": _parse_age(self.age),
+            "diagnosis": _text(self.diagnosis),
+            "operation_description": _text(self.operation_description),
+            "operation_date": operation_day.isoformat() if operation_day else "",
+            "treatment_details": _text(self.treatment_details),
+            "treatment_start_date": treatment_start_day.isoformat() if treatment_start_day else "",
+            "operation_day": operation_day,
+            "treatment_start_day": treatment_start_day,
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+        timeline = None
+        if operation_day and treatment_start_day:
+            timeline = recovery_phases.calculate_timeline(
+                self.diagnosis, self.operation_description, operation_day, treatment_start_day
+            )
+        object.__setattr__(self, "timeline", timeline)
+        object.__setattr__(self, "content_hash", self._hash())
+
+    def _hash(self):
+        """
+        SHA-256 of the normalized fields as the prompts see them
+
+        The prompts only use the recovery phases, not the dates, so the dates are
+        hashed as their phases: the hash stays the same from day to day until the
+        patient moves into a new phase.
+        """
+        content = response_cache.normalize_patient(*self.form_fields())
+        if self.timeline:
+            content["operation_date"] = self.timeline["operation_phase"]
+            content["treatment_start_date"] = self.timeline["treatment_phase"]
+        encoded = json.dumps(content, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    @property
+    def details_hash(self):
+        """
+        SHA-256 of the normalized fields with the exact dates: one set of patient
+        details, as saved, which the advice history in the patient store is kept under
+        """
+        content = response_cache.normalize_patient(*self.form_fields())
+        encoded = json.dumps(content, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    @classmethod
+    def from_dict(cls, patient_record):
+        """Build a record from the saved JSON layout (see to_dict)"""
+        operation = patient_record.get("operation") or {}
+        treatment = patient_record.get("treatment") or {}
+        return cls(
+            patient_record.get("gender", ""),
+            patient_record.get("age"),
+            patient_record.get("diagnosis", ""),
+            operation.get("description", ""),
+            operation.get("date", ""),
+            treatment.get("details", ""),
+            treatment.get("start_date", ""),
+        )
+
+    def form_fields(self):
+        """The seven fields as a tuple, in the order the advice functions take them"""
+        return tuple(getattr(self, name) for name in FIELDS)
+
+    def to_dict(self, timestamp=None):
+        """The JSON layout shown on submit and saved by the patient store"""
+        return {
+            "timestamp": timestamp or datetime.now().isoformat(),
+            "gender": self.gender,
+            "age": self.age,
+            "diagnosis": self.diagnosis,
+            "operation": {
+                "description": self.operation_description,
+                "date": self.operation_date
+            },
+            "treatment": {
+                "details": self.treatment_details,
+                "start_date": self.treatment_start_date
+            }
+        }
@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+Indexed patient store
+
+Patient records stay as JSON files in saved_data/ (easy to back up and share),
+and a small SQLite index next to them tracks each record's filename, name,
+diagnosis and last update. Listing, sorting and prefix searches go through the
+index instead of scanning the folder, so the load dropdown stays quick with
+tens of thousands of patients.
+
+Saves are crash-safe and concurrent-safe: each record is written to a temp
+file, flushed to disk and renamed over the old one while holding a lock for
+that record, and every record carries a version number so a save based on an
+out-of-date copy is refused instead of overwriting newer data.
+
+Generated advice is kept in an append-only history per record
+(saved_data/.history/<name>.jsonl), so loading a patient brings back its latest
+advice. The index keeps each record's details hash so advice generated for a set
+of patient details can be added to the history of the records saved with them. Past a size limit the history is compacted: the oldest
+entries move to a gzipped archive next to it until the history is back to half
+the limit, keeping the latest advice of each persona.
+
+Usage:
+    python patient_store.py migrate                # index existing JSON files
+    python patient_store.py list --sort name       # show the first page
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from patient_record import PatientRecord
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+INDEX_FILENAME = ".patient_index.sqlite3"
+LOCK_DIRNAME = ".locks"
+HISTORY_DIRNAME = ".history"
+
+# Columns the listing can be sorted by, and their default direction
+SORT_COLUMNS = {
+    "name": ("name_key", False),
+    "diagnosis": ("diagnosis_key", False),
+    "updated": ("updated_at", True),
+}
+
+# Suffix of the pre-generated advice files stored next to each record (not patient records)
+ADVICE_FILE_SUFFIX = ".advice.json"
+
+def normalize_filename(filename):
+    """Add the .json extension if it is missing"""
+    return filename if filename.endswith('.json') else filename + '.json'
+
+def details_hash(patient_record):
+    """A saved record's PatientRecord.details_hash, or None when its fields aren't valid"""
+    try:
+        return PatientRecord.from_dict(patient_record).details_hash
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+def _prefix_range(prefix):
+    """Lower and upper bounds that match every string starting with prefix, so the index is used"""
+    prefix = prefix.casefold()
+    return prefix, prefix + "\uffff"
+
+class StaleRecordError(Exception):
+    """Raised when a save was based on an older version of the record than the one on disk"""
+
+    def __init__(self, filename, expected_version, current_version):
+        super().__init__(
+            f"{filename} has changed since it was loaded (version {expected_version}, now {current_version})"
+        )
+        self.filename = filename
+        self.expected_version = expected_version
+        self.current_version = current_version
+
+def record_version(patient_record):
+    """Version number of a record; records saved before versioning count as version 0"""
+    if not patient_record:
+        return 0
+    try:
+        return int(patient_record.get("version") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+def _current_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+# Read once at import: setting the umask to read it isn't safe while other threads create files
+_UMASK = _current_umask()
+
+def _replacement_mode(filepath):
+    """
+    Permissions for a temp file about to replace filepath: the current file's, or what
+    open() would give a new file (mkstemp makes them private to the owner)
+    """
+    try:
+        return stat.S_IMODE(os.stat(filepath).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+def _write_atomic(filepath, data):
+    """
+    Write JSON to a temp file in the same folder, fsync it and rename it into place,
+    so readers and crashes only ever see the old or the new complete file
+    """
+    directory = os.path.dirname(filepath) or "."
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix="." + os.path.basename(filepath) + ".", suffix=".tmp")
+    try:
+        os.chmod(temp_path, _replacement_mode(filepath))
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, filepath)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+    # Make the rename itself durable
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+class PatientStore:
+    """
+    JSON patient records plus a SQLite index of filename, name, diagnosis and update time
+    """
+
+    def __init__(self, data_dir="saved_data", index_path=None, history_max_bytes=262144):
+        self.data_dir = data_dir
+        self.index_path = index_path or os.path.join(data_dir, INDEX_FILENAME)
+        self.history_max_bytes = history_max_bytes
+        self._write_lock = threading.Lock()
+        self._record_locks = {}
+        self._record_locks_guard = threading.Lock()
+
+        os.makedirs(os.path.join(data_dir, LOCK_DIRNAME), exist_ok=True)
+        os.makedirs(os.path.join(data_dir, HISTORY_DIRNAME), exist_ok=True)
+        created = not os.path.exists(self.index_path)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS patients ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "filename TEXT NOT NULL UNIQUE, "
+                "name_key TEXT NOT NULL, "
+                "diagnosis TEXT NOT NULL, "
+                "diagnosis_key TEXT NOT NULL, "
+                "updated_at TEXT NOT NULL, "
+                "mtime REAL NOT NULL, "
+                "details_hash TEXT)"
+            )
+            # Indexes made before the advice history have no details hashes yet
+            columns = {row["name"] for row in db.execute("PRAGMA table_info(patients)")}
+            if "details_hash" not in columns:
+                db.execute("ALTER TABLE patients ADD COLUMN details_hash TEXT")
+                db.execute("UPDATE patients SET mtime = -1")
+                created = True
+            db.execute("CREATE INDEX IF NOT EXISTS patients_name ON patients (name_key)")
+            db.execute("CREATE INDEX IF NOT EXISTS patients_diagnosis ON patients (diagnosis_key)")
+            db.execute("CREATE INDEX IF NOT EXISTS patients_updated ON patients (updated_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS patients_details ON patients (details_hash)")
+
+        # First run against an existing folder: index the files already there
+        if created:
+            self.import_directory()
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.index_path, timeout=30)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def path_for(self, filename):
+        """Full path of a record file"""
+        return os.path.join(self.data_dir, normalize_filename(filename))
+
+    def _index(self, db, filename, patient_record, mtime):
+        name = filename[:-len('.json')]
+        diagnosis = str(patient_record.get("diagnosis") or "")
+        updated_at = patient_record.get("timestamp") or datetime.fromtimestamp(mtime).isoformat()
+        db.execute(
+            "INSERT INTO patients (filename, name_key, diagnosis, diagnosis_key, updated_at, mtime, details_hash) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(filename) DO UPDATE SET name_key = excluded.name_key, diagnosis = excluded.diagnosis, "
+            "diagnosis_key = excluded.diagnosis_key, updated_at = excluded.updated_at, mtime = excluded.mtime, "
+            "details_hash = excluded.details_hash",
+            (filename, name.casefold(), diagnosis, diagnosis.casefold(), updated_at, mtime, details_hash(patient_record))
+        )
+
+    @contextmanager
+    def _record_lock(self, filename):
+        """
+        Hold the lock for one record: a thread lock within this process plus a
+        lock file shared with other processes where the platform supports it
+        """
+        with self._record_locks_guard:
+            lock = self._record_locks.setdefault(filename, threading.Lock())
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.data_dir, LOCK_DIRNAME, filename + ".lock"), 'a') as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def save(self, filename, patient_record, expected_version=None):
+        """
+        Atomically write a record and update the index; returns (filename, new version)
+
+        With expected_version, the save only goes ahead if the record on disk is
+        still at that version (0 for a record that does not exist yet), and
+        StaleRecordError is raised otherwise.
+        """
+        filename = normalize_filename(filename)
+        filepath = self.path_for(filename)
+
+        with self._record_lock(filename):
+            current_version = record_version(self.load(filename))
+            if expected_version is not None and int(expected_version) != current_version:
+                raise StaleRecordError(filename, expected_version, current_version)
+
+            version = current_version + 1
+            _write_atomic(filepath, dict(patient_record, version=version))
+            with self._write_lock, self._connect() as db:
+                self._index(db, filename, patient_record, os.path.getmtime(filepath))
+
+        return filename, version
+
+    def load(self, filename):
+        """
+        Read a record, or return None if there is no such file
+        """
+        try:
+            with open(self.path_for(filename), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def list(self, offset=0, limit=100, sort="updated", descending=None):
+        """
+        One page of records from the index, as dicts of filename, diagnosis and updated_at
+        """
+        column, default_descending = SORT_COLUMNS[sort]
+        direction = "DESC" if (default_descending if descending is None else descending) else "ASC"
+        with self._connect() as db:
+            rows = db.execute(
+                f"SELECT filename, diagnosis, updated_at FROM patients ORDER BY {column} {direction}, filename LIMIT ? OFFSET ?",
+                (limit, offset)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def find(self, prefix, limit=50):
+        """
+        Records whose name or diagnosis starts with prefix (case-insensitive), newest first
+        """
+        low, high = _prefix_range(prefix.strip())
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT filename, diagnosis, updated_at FROM patients "
+                "WHERE (name_key >= ? AND name_key < ?) OR (diagnosis_key >= ? AND diagnosis_key < ?) "
+                "ORDER BY updated_at DESC LIMIT ?",
+                (low, high, low, high, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self):
+        """Number of indexed records"""
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+
+    def filenames_for_details(self, patient_details_hash):
+        """Filenames of the records saved with these patient details (a PatientRecord's details_hash)"""
+        with self._connect() as db:
+            rows = db.execute("SELECT filename FROM patients WHERE details_hash = ? ORDER BY filename", (patient_details_hash,)).fetchall()
+        return [row["filename"] for row in rows]
+
+    def _history_path(self, filename, archived=False):
+        name = normalize_filename(filename)[:-len('.json')]
+        return os.path.join(self.data_dir, HISTORY_DIRNAME, name + (".jsonl.gz" if archived else ".jsonl"))
+
+    def _history_lock(self, filename):
+        return self._record_lock(HISTORY_DIRNAME + "-" + normalize_filename(filename))
+
+    def append_history(self, filename, entry):
+        """
+        Append one generated advice entry to a record's history
+
+        Once the history passes history_max_bytes it is compacted (see compact_history).
+        """
+        path = self._history_path(filename)
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._history_lock(filename):
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            if self.history_max_bytes and os.path.getsize(path) > self.history_max_bytes:
+                self._compact_history(filename)
+
+    def _read_history(self, path, opener=open):
+        entries = []
+        try:
+            with opener(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue  # half-written line from a crash
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def history(self, filename, include_archived=False):
+        """
+        Advice entries for a record, oldest first
+
+        With include_archived, entries moved to the archive by compaction are merged in
+        by timestamp.
+        """
+        entries = self._read_history(self._history_path(filename))
+        if include_archived:
+            entries = self._read_history(self._history_path(filename, archived=True), gzip.open) + entries
+            entries.sort(key=lambda entry: entry.get("timestamp", ""))
+        return entries
+
+    def latest_advice(self, filename, patient_details_hash=None):
+        """
+        The newest entry for each persona's general advice (not answers to questions), by persona
+
+        With patient_details_hash, only advice generated for those patient details counts,
+        so advice from before the record was edited isn't brought back.
+        """
+        latest = {}
+        for entry in self.history(filename):
+            if entry.get("question") or (patient_details_hash and entry.get("details_hash") != patient_details_hash):
+                continue
+            latest[entry["persona"]] = entry
+        return latest
+
+    def compact_history(self, filename):
+        """
+        Move the oldest entries to the gzipped archive until the history is within half
+        of history_max_bytes; returns the number of entries archived
+
+        The newest general advice of each persona always stays, for latest_advice.
+        Compacting to half the limit means the history is only rewritten after
+        another half-limit of advice has been appended.
+        """
+        with self._history_lock(filename):
+            return self._compact_history(filename)
+
+    def _compact_history(self, filename):
+        entries = self.history(filename)
+        lines = [json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries]
+        sizes = [len(line.encode("utf-8")) for line in lines]
+        newest = {}
+        for position, entry in enumerate(entries):
+            if not entry.get("question"):
+                newest[entry.get("persona")] = position
+        kept = set(newest.values())
+
+        # Then the newest of the rest, while they fit
+        room = (self.history_max_bytes or 0) // 2 - sum(sizes[position] for position in kept)
+        for position in range(len(entries) - 1, -1, -1):
+            if position in kept:
+                continue
+            if sizes[position] > room:
+                break
+            kept.add(position)
+            room -= sizes[position]
+
+        archived = [position for position in range(len(entries)) if position not in kept]
+        if not archived:
+            return 0
+
+        # Archive first: a crash in between leaves entries in both files, never in neither
+        with gzip.open(self._history_path(filename, archived=True), 'at', encoding='utf-8') as f:
+            for position in archived:
+                f.write(lines[position])
+        path = self._history_path(filename)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix="." + os.path.basename(path) + ".", suffix=".tmp")
+        os.chmod(temp_path, _replacement_mode(path))
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for position in sorted(kept):
+                f.write(lines[position])
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        return len(archived)
+
+    def import_directory(self):
+        """
+        Bring the index in line with the JSON files on disk
+
+        New or changed files are (re)indexed and entries whose file is gone are
+        removed. Returns the number of files indexed.
+        """
+        imported = 0
+        seen = set()
+        with self._write_lock, self._connect() as db:
+            known = {row["filename"]: row["mtime"] for row in db.execute("SELECT filename, mtime FROM patients")}
+            with os.scandir(self.data_dir) as entries:
+                for entry in entries:
+                    if not entry.is_file() or not entry.name.endswith('.json') or entry.name.endswith(ADVICE_FILE_SUFFIX):
+                        continue
+                    seen.add(entry.name)
+                    mtime = entry.stat().st_mtime
+                    if known.get(entry.name) == mtime:
+                        continue
+                    try:
+                        with open(entry.path, 'r', encoding='utf-8') as f:
+                            patient_record = json.load(f)
+                    except (OSError, ValueError):
+                        continue
+                    self._index(db, entry.name, patient_record, mtime)
+                    imported += 1
+
+            for filename in set(known) - seen:
+                db.execute("DELETE FROM patients WHERE filename = ?", (filename,))
+
+        return imported
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the patient record index")
+    parser.add_argument("command", choices=["migrate", "list", "find"], help="migrate: index existing JSON files")
+    parser.add_argument("query", nargs="?", default="", help="Prefix to search for (find)")
+    parser.add_argument("--data-dir", default="saved_data", help="Folder of saved patient records")
+    parser.add_argument("--sort", choices=sorted(SORT_COLUMNS), default="updated")
+    parser.add_argument("--page", type=int, default=1)
+    parser.add_argument("--page-size", type=int, default=50)
+    args = parser.parse_args()
+
+    store = PatientStore(args.data_dir)
+    if args.command == "migrate":
+        imported = store.import_directory()
+        print(f"✅ Indexed {imported} new or changed records ({store.count()} in total)")
+        return
+
+    if args.command == "find":
+        rows = store.find(args.query, limit=args.page_size)
+    else:
+        rows = store.list(offset=(args.page - 1) * args.page_size, limit=args.page_size, sort=args.sort)
+    for row in rows:
+        print(f"{row['filename']:40} {row['diagnosis'][:40]:40} {row['updated_at']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Daily advice precompute for patients moving into a new recovery phase
+
+Patients move between recovery and treatment phases on dates that follow from
+their operation date and treatment start date, and their advice changes with
+the phase. Once a day, at an off-peak time, this finds the saved patients whose
+phase changes that day and regenerates their advice with batch_advice. Jobs
+run behind interactive users for the rate limit quota, with a bounded worker
+pool and a token budget per run, so when carers open the app in the morning
+the advice for the new phase is already cached.
+
+Advice is cached by recovery phase as of the day it is generated, so a run
+only precomputes the phase changes of the day it runs on. Dry runs can plan
+any day.
+
+Usage:
+    python phase_scheduler.py --dry-run                    # today's planned workload and cost
+    python phase_scheduler.py --dry-run --date 2025-03-01  # plan another day
+    python phase_scheduler.py                              # run today's precompute now
+    python phase_scheduler.py --serve                      # sidecar: run every day at PRECOMPUTE_AT
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import app
+import batch_advice
+import metrics
+import patient_store
+import prompts
+import recovery_phases
+import token_budget
+from patient_record import PatientRecord
+
+logger = logging.getLogger("carer.precompute")
+
+# Run the precompute inside the app process once a day at PRECOMPUTE_AT (local time, HH:MM)
+SCHEDULE_ENABLED = os.getenv("PRECOMPUTE_SCHEDULE", "false").lower() not in ("0", "false", "no", "off")
+PRECOMPUTE_AT = os.getenv("PRECOMPUTE_AT", "02:00")
+
+# Advice regenerated for each patient, workers running at once, requests per minute (0 for
+# no limit) and the most tokens one run may spend (0 for no limit)
+PRECOMPUTE_PERSONAS = tuple(
+    persona.strip() for persona in os.getenv("PRECOMPUTE_PERSONAS", "nursing,patient,carer").split(",") if persona.strip()
+)
+PRECOMPUTE_WORKERS = int(os.getenv("PRECOMPUTE_WORKERS", "2"))
+PRECOMPUTE_RPM = float(os.getenv("PRECOMPUTE_RPM", "30"))
+PRECOMPUTE_TOKEN_BUDGET = int(os.getenv("PRECOMPUTE_TOKEN_BUDGET", "200000"))
+
+# Prompt builder for each of batch_advice's advice types, for the token estimates
+MESSAGE_BUILDERS = {
+    "nursing": prompts.nursing_advice_messages,
+    "patient": prompts.patient_focused_messages,
+    "carer": prompts.carer_focused_messages,
+}
+
+# One patient to precompute: the record file, its phase changes as (phase, before, after),
+# and the estimated prompt and completion tokens for all of its advice
+Job = namedtuple("Job", "record_path changes prompt_tokens completion_tokens")
+
+def phase_changes(fields, day):
+    """
+    The phases that change on day for a patient's seven form fields, as (phase, before, after)
+
+    Records without valid operation and treatment dates have no phases to change.
+    """
+    _, _, diagnosis, operation_description, operation_date, _, treatment_start_date = fields
+    try:
+        before = recovery_phases.calculate_timeline(diagnosis, operation_description, operation_date, treatment_start_date, today=day - timedelta(days=1))
+        after = recovery_phases.calculate_timeline(diagnosis, operation_description, operation_date, treatment_start_date, today=day)
+    except (TypeError, ValueError):
+        return []
+    return [(phase, before[phase], after[phase]) for phase in ("operation_phase", "treatment_phase") if before[phase] != after[phase]]
+
+def estimate_tokens(fields, day, personas):
+    """
+    Estimated (prompt tokens, completion tokens) of one patient's advice on day
+
+    Completions are counted at their full length, so the estimate is an upper bound.
+    """
+    record = PatientRecord(*fields)
+    timeline = recovery_phases.calculate_timeline(
+        record.diagnosis, record.operation_description, record.operation_date, record.treatment_start_date, today=day
+    )
+    version = prompts.choose_version(record.content_hash)
+    prompt_fields = token_budget.fit_fields(record.form_fields(), app.OPENAI_MODEL)
+    prompt_tokens = sum(
+        token_budget.count_message_tokens(MESSAGE_BUILDERS[persona](*prompt_fields, timeline=timeline, version=version), app.OPENAI_MODEL)
+        for persona in personas
+    )
+    return prompt_tokens, app.ASSESSMENT_MAX_TOKENS * len(personas)
+
+def plan(data_dir="saved_data", day=None, personas=PRECOMPUTE_PERSONAS):
+    """Jobs for every saved patient whose phase changes on day (default today)"""
+    day = day or date.today()
+    jobs = []
+    for record_path in batch_advice.iter_records(data_dir):
+        try:
+            with open(record_path, 'r', encoding='utf-8') as f:
+                fields = app.patient_fields(json.load(f))
+            changes = phase_changes(fields, day)
+            if changes:
+                jobs.append(Job(record_path, changes, *estimate_tokens(fields, day, personas)))
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning("Skipping %s: %s", os.path.basename(record_path), e)
+    return jobs
+
+def workload(jobs, model=None):
+    """Totals for a list of jobs: patients, estimated tokens and estimated cost in US dollars"""
+    model = model or app.OPENAI_MODEL
+    prompt_tokens = sum(job.prompt_tokens for job in jobs)
+    completion_tokens = sum(job.completion_tokens for job in jobs)
+    return {
+        "patients": len(jobs),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "estimated_cost": round(metrics.estimate_cost(model, prompt_tokens, completion_tokens), 4),
+    }
+
+def within_budget(jobs, budget=PRECOMPUTE_TOKEN_BUDGET):
+    """Split jobs into (run, deferred): jobs in order until the next one would pass the token budget"""
+    if not budget:
+        return list(jobs), []
+    run, deferred = [], []
+    spent = 0
+    for job in jobs:
+        tokens = job.prompt_tokens + job.completion_tokens
+        if deferred or spent + tokens > budget:
+            deferred.append(job)
+        else:
+            spent += tokens
+            run.append(job)
+    return run, deferred
+
+def run(data_dir="saved_data", personas=PRECOMPUTE_PERSONAS, workers=PRECOMPUTE_WORKERS, rpm=PRECOMPUTE_RPM,
+        budget=PRECOMPUTE_TOKEN_BUDGET, log=print):
+    """
+    Regenerate today's advice for the patients whose phase changes today
+
+    Returns a summary of the run. Patients past the token budget are deferred: their
+    advice is generated when it is first asked for, as usual.
+    """
+    jobs, deferred = within_budget(plan(data_dir, date.today(), personas), budget)
+    pacer = batch_advice.RequestPacer(rpm)
+    summary = dict(workload(jobs), deferred=len(deferred), succeeded=0, failed=0)
+    for job in deferred:
+        log(f"⏭️  {os.path.basename(job.record_path)}: deferred, over the token budget")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [(job, pool.submit(batch_advice.process_record, job.record_path, personas, pacer)) for job in jobs]
+        for job, future in futures:
+            try:
+                calls, failures = future.result()
+            except Exception as e:
+                log(f"❌ {os.path.basename(job.record_path)}: {str(e)}")
+                summary["failed"] += 1
+                continue
+            if failures:
+                log(f"⚠️  {os.path.basename(job.record_path)}: {failures} of {calls} advice calls failed")
+                summary["failed"] += 1
+            else:
+                summary["succeeded"] += 1
+    return summary
+
+def next_run(at=PRECOMPUTE_AT, now=None):
+    """The next time of day at (HH:MM, local time) after now"""
+    now = now or datetime.now()
+    hour, minute = (int(part) for part in at.split(":"))
+    scheduled = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return scheduled if scheduled > now else scheduled + timedelta(days=1)
+
+# Lock file, in the patient store's lock folder, that holds the day of the last scheduled run
+RUN_LOCK_FILENAME = "phase_precompute.lock"
+_local_run_lock = threading.Lock()
+
+@contextmanager
+def _run_lock(data_dir):
+    """
+    Hold the lock shared by every scheduler on data_dir and yield its file
+
+    Where fcntl isn't available (Windows) the lock only covers this process.
+    """
+    lock_dir = os.path.join(data_dir, patient_store.LOCK_DIRNAME)
+    os.makedirs(lock_dir, exist_ok=True)
+    with _local_run_lock, open(os.path.join(lock_dir, RUN_LOCK_FILENAME), 'a+', encoding='utf-8') as lock_file:
+        if patient_store.fcntl is not None:
+            patient_store.fcntl.flock(lock_file.fileno(), patient_store.fcntl.LOCK_EX)
+        try:
+            yield lock_file
+        finally:
+            if patient_store.fcntl is not None:
+                patient_store.fcntl.flock(lock_file.fileno(), patient_store.fcntl.LOCK_UN)
+
+class DailyScheduler:
+    """
+    Runs the precompute once a day at a set time, in a daemon thread
+
+    Every app process with PRECOMPUTE_SCHEDULE on, and any --serve sidecar, wakes up
+    at the same time; a lock next to the patient records lets only the first of them
+    run each day's precompute.
+    """
+
+    def __init__(self, at=PRECOMPUTE_AT, **options):
+        next_run(at)  # check the time parses before starting
+        self.at = at
+        self.options = options
+        self.last_summary = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="phase-precompute", daemon=True)
+        self._thread.start()
+        logger.info("Advice precompute scheduled daily at %s", self.at)
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self):
+        self._thread.join()
+
+    def run_once(self, day=None):
+        """
+        Run the precompute for day (default today) unless a scheduler sharing the data
+        folder already has; returns the summary, or None if it was skipped
+        """
+        day = (day or date.today()).isoformat()
+        with _run_lock(self.options.get("data_dir", "saved_data")) as lock_file:
+            lock_file.seek(0)
+            if lock_file.read().strip() == day:
+                logger.info("Advice precompute for %s already ran", day)
+                return None
+            summary = run(log=logger.info, **self.options)
+            lock_file.truncate(0)
+            lock_file.write(day)
+            lock_file.flush()
+        return summary
+
+    def _loop(self):
+        while not self._stop.wait((next_run(self.at) - datetime.now()).total_seconds()):
+            try:
+                summary = self.run_once()
+                if summary is not None:
+                    self.last_summary = summary
+                    logger.info("Advice precompute finished: %s", summary)
+            except Exception:
+                logger.exception("Advice precompute failed")
+
+def start_from_env(data_dir=None):
+    """Start the in-process scheduler if PRECOMPUTE_SCHEDULE is on; returns it, or None"""
+    if not SCHEDULE_ENABLED:
+        return None
+    return DailyScheduler(data_dir=data_dir or os.getenv("PATIENT_DATA_DIR", "saved_data")).start()
+
+def print_plan(jobs, day):
+    print(f"🗓️  Phase changes on {day.isoformat()}")
+    print("=" * 50)
+    for job in jobs:
+        changes = "; ".join(f"{before} → {after}" for _, before, after in job.changes)
+        print(f"{os.path.basename(job.record_path):32} {changes}  (~{job.prompt_tokens + job.completion_tokens} tokens)")
+    totals = workload(jobs)
+    print("=" * 50)
+    print(f"   Patients: {totals['patients']}")
+    print(f"   Tokens: {totals['prompt_tokens']} prompt + up to {totals['completion_tokens']} completion")
+    print(f"   Estimated cost: up to ${totals['estimated_cost']:.4f} ({app.OPENAI_MODEL})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute advice for patients moving into a new recovery phase")
+    parser.add_argument("--data-dir", default=os.getenv("PATIENT_DATA_DIR", "saved_data"), help="Folder of saved patient records")
+    parser.add_argument("--personas", default=",".join(PRECOMPUTE_PERSONAS), help=f"Comma-separated advice types: {', '.join(MESSAGE_BUILDERS)}")
+    parser.add_argument("--workers", type=int, default=PRECOMPUTE_WORKERS, help="Number of patients processed at once")
+    parser.add_argument("--rpm", type=float, default=PRECOMPUTE_RPM, help="Maximum AI requests per minute (0 for no limit)")
+    parser.add_argument("--budget", type=int, default=PRECOMPUTE_TOKEN_BUDGET, help="Most tokens one run may spend (0 for no limit)")
+    parser.add_argument("--dry-run", action="store_true", help="Show the planned workload and estimated cost without calling the model")
+    parser.add_argument("--date", help="Day to plan, YYYY-MM-DD (dry runs only; default today)")
+    parser.add_argument("--serve", action="store_true", help=f"Keep running and precompute every day at PRECOMPUTE_AT ({PRECOMPUTE_AT})")
+    args = parser.parse_args()
+
+    personas = tuple(persona.strip() for persona in args.personas.split(",") if persona.strip())
+    unknown = [persona for persona in personas if persona not in MESSAGE_BUILDERS]
+    if unknown:
+        parser.error(f"Unknown advice type(s): {', '.join(unknown)}")
+    if args.date and not args.dry_run:
+        parser.error("--date only works with --dry-run: advice is cached by the phase on the day it is generated")
+    if args.serve and not (app.RESPONSE_CACHE_ENABLED and app.advice_cache.disk_path):
+        parser.error("--serve needs RESPONSE_CACHE_PATH: a sidecar's in-memory cache isn't shared with the app")
+
+    if args.dry_run:
+        day = datetime.strptime(args.date, "%Y-%m-%d").date() if args.date else date.today()
+        jobs = plan(args.data_dir, day, personas)
+        print_plan(jobs, day)
+        _, deferred = within_budget(jobs, args.budget)
+        if deferred:
+            print(f"   Over the token budget: {len(deferred)} patients would be deferred")
+        return
+
+    options = dict(data_dir=args.data_dir, personas=personas, workers=args.workers, rpm=args.rpm, budget=args.budget)
+    if args.serve:
+        logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(name)s %(levelname)s %(message)s")
+        DailyScheduler(**options).start().join()
+        return
+
+    summary = run(**options)
+    print("📊 Precompute Summary:")
+    print(f"   Patients: {summary['patients']} ({summary['deferred']} deferred over the token budget)")
+    print(f"   Succeeded: {summary['succeeded']}")
+    print(f"   Failed: {summary['failed']}")
+    print(f"   Estimated tokens: {summary['prompt_tokens']} prompt + up to {summary['completion_tokens']} completion")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+"""
+Chat prompts for each kind of advice
+
+Each builder turns the seven patient form fields (plus a question, for the
+Q&A views) into the messages sent to the model. They only need the recovery
+phase calculation, so batch jobs and tests can build prompts without loading
+the OpenAI client or the Gradio interface. Pass a PatientRecord's timeline to
+skip working the phases out again.
+
+Prompts come from versioned templates. Every version is split into a prefix
+(the system message and the patient information block) and a suffix with the
+view's instructions and any question. The prefix is rendered once per patient
+and reused for every view. "v1", the default, is the original layout with a
+different system message per view; in the "v2" layout the prefix is
+byte-for-byte the same for all of them, so servers that cache prompt prefixes
+can reuse it.
+Templates are checked when they are loaded, and more versions can be added
+from a JSON file and compared with an A/B split, without touching the handlers.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import string
+
+import recovery_phases
+
+# Values the system message and patient information block can use
+CONTEXT_FIELDS = (
+    "gender",
+    "age",
+    "diagnosis",
+    "operation_description",
+    "operation_phase",
+    "treatment_details",
+    "treatment_status",
+)
+
+# The advice views, named after the persona each one is cached and measured under
+# ("combined" asks for the first three in one JSON reply, see combined_advice.py, and
+# "sections" for some of the nursing advice sections, see advice_sections.py)
+VIEWS = ("nursing", "patient_advice", "carer_advice", "patient_question", "carer_question", "specific_advice", "combined", "sections")
+QUESTION_VIEWS = ("patient_question", "carer_question", "specific_advice")
+
+# Values each view's instructions can use
+INSTRUCTION_FIELDS = dict({view: ("question",) for view in QUESTION_VIEWS}, sections=("sections",))
+
+PATIENT_INFORMATION = """PATIENT INFORMATION:
+- Gender: {gender}
+- Age: {age} years
+- Primary Diagnosis: {diagnosis}
+- Operation: {operation_description}
+- Recovery Phase: {operation_phase}
+- Treatment Details: {treatment_details}
+- Treatment Status: {treatment_status}
+"""
+
+# What each view asks for, shared by both built-in versions
+_INSTRUCTIONS = {
+    "nursing": """Please provide advice in the following structure:
+
+1. **PATIENT STAGE ASSESSMENT**: What stage of recovery/treatment is this patient currently in? Consider whether treatment has started yet.
+
+2. **CARER EXPECTATIONS**: What should the carer expect during this stage? Focus on the current situation (pre-treatment, starting treatment, or ongoing treatment).
+
+3. **CARING GUIDANCE**: Specific ways the carer can help the patient, including:
+   - Daily care activities appropriate for current stage
+   - Monitoring signs to watch for
+   - Comfort measures
+   - Medication management (if applicable)
+   - Mobility and activity recommendations
+
+4. **WARNING SIGNS**: Red flags or symptoms that require immediate medical attention
+
+5. **RECOVERY TIMELINE**: Expected progression and milestones, considering treatment timing
+
+6. **EMOTIONAL SUPPORT**: How to provide psychological support to the patient
+
+IMPORTANT: Tailor your advice based on whether treatment has started, is starting today, or is scheduled for the future. Provide appropriate guidance for the current phase.
+""",
+    "patient_advice": """Please provide advice in the following structure:
+
+1. **YOUR RECOVERY JOURNEY**: Explain where you are in your recovery process and what this means
+
+2. **WHAT YOU CAN EXPECT**: What to expect during this stage of your recovery
+
+3. **HOW YOU CAN HELP YOURSELF**: Specific things you can do to support your own healing:
+   - Daily activities that promote recovery
+   - Self-care practices
+   - Things to monitor about your own condition
+   - Activities that are safe for you
+
+4. **RECOVERY TIMELINE**: What milestones you can look forward to
+
+5. **EMOTIONAL WELLBEING**: How to stay positive and manage any concerns
+
+6. **WHEN TO SEEK HELP**: Signs that indicate you should contact your healthcare team
+
+Please be encouraging, empowering, and speak directly to the patient using "you" language. Focus on what they can control and do for themselves.
+""",
+    "carer_advice": """Please provide advice in the following structure:
+
+1. **CARE STAGE ASSESSMENT**: What stage of care you're providing and what this means
+
+2. **YOUR CAREGIVING ROLE**: What you should expect as a carer during this stage
+
+3. **DAILY CARE ACTIVITIES**: Specific ways you can help the patient, including:
+   - Daily care tasks
+   - Monitoring responsibilities
+   - Comfort measures
+   - Medication management (if applicable)
+   - Mobility and activity support
+
+4. **WARNING SIGNS TO WATCH**: Red flags or symptoms that require immediate medical attention
+
+5. **CAREGIVER SELF-CARE**: How to take care of yourself while caring for the patient
+
+6. **EMOTIONAL SUPPORT**: How to provide psychological support to the patient
+
+Please be specific, practical, and empathetic. Focus on actionable guidance that a carer can implement immediately.
+""",
+    "patient_question": """PATIENT'S QUESTION:
+"{question}"
+
+Please provide:
+1. **DIRECT ANSWER**: Address the specific question with practical guidance
+2. **STEP-BY-STEP INSTRUCTIONS**: Clear, actionable steps the patient can follow
+3. **IMPORTANT CONSIDERATIONS**: Things to be aware of or monitor
+4. **WHEN TO SEEK HELP**: Signs that indicate the need for medical attention
+5. **ENCOURAGEMENT**: Positive reinforcement and reassurance
+
+IMPORTANT: Consider whether treatment has started yet when providing your advice. Tailor your response to the current phase (pre-treatment, starting treatment, or ongoing treatment).
+
+Be empathetic, encouraging, and speak directly to the patient using "you" language. Focus on what they can do to help themselves.
+""",
+    "carer_question": """CARER'S QUESTION:
+"{question}"
+
+Please provide:
+1. **DIRECT ANSWER**: Address the specific question with practical guidance
+2. **STEP-BY-STEP INSTRUCTIONS**: Clear, actionable steps the carer can follow
+3. **IMPORTANT CONSIDERATIONS**: Things to be aware of or monitor
+4. **WHEN TO SEEK HELP**: Signs that indicate the need for medical attention
+5. **ADDITIONAL TIPS**: Extra helpful information related to the question
+
+IMPORTANT: Consider whether treatment has started yet when providing your advice. Tailor your response to the current phase (pre-treatment, starting treatment, or ongoing treatment).
+
+Be empathetic, specific, and practical. Focus on what the carer can do right now to help their patient.
+""",
+    "specific_advice": """CARER'S SPECIFIC QUESTION:
+"{question}"
+
+Please provide:
+1. **DIRECT ANSWER**: Address the specific question with practical guidance appropriate for the current treatment phase
+2. **STEP-BY-STEP INSTRUCTIONS**: Clear, actionable steps the carer can follow
+3. **IMPORTANT CONSIDERATIONS**: Things to be aware of or monitor
+4. **WHEN TO SEEK HELP**: Signs that indicate the need for medical attention
+5. **ADDITIONAL TIPS**: Extra helpful information related to the question
+
+IMPORTANT: Consider whether treatment has started yet when providing your advice. Tailor your response to the current phase (pre-treatment, starting treatment, or ongoing treatment).
+
+Be empathetic, specific, and practical. Focus on what the carer can do right now to help their patient.
+""",
+    "combined": """Reply with one JSON object and nothing else. It must have exactly these keys:
+
+- "assessment": general nursing advice for the carer, an object with one string for each of "patient_stage_assessment" (what stage of recovery/treatment the patient is in, considering whether treatment has started yet), "carer_expectations" (what the carer should expect during this stage), "caring_guidance" (daily care activities, monitoring signs, comfort measures, medication management and mobility recommendations), "warning_signs" (red flags that require immediate medical attention), "recovery_timeline" (expected progression and milestones, considering treatment timing) and "emotional_support" (how to provide psychological support to the patient)
+- "patient_advice": a string of encouraging, empowering advice spoken directly to the patient using "you" language, covering their recovery journey, what they can expect, how they can help themselves, recovery milestones, emotional wellbeing and when to seek help
+- "carer_advice": a string of practical caregiving advice for the carer, covering the care stage, their caregiving role, daily care activities, warning signs to watch, caregiver self-care and emotional support
+
+Use Markdown inside the strings. Tailor all of the advice to whether treatment has started, is starting today, or is scheduled for the future.
+""",
+    "sections": """Please provide only these parts of the advice, in this order, starting each one on a new line with its numbered heading exactly as shown:
+
+{sections}
+
+IMPORTANT: Tailor your advice based on whether treatment has started, is starting today, or is scheduled for the future. Provide appropriate guidance for the current phase.
+""",
+}
+
+# v1: the original prompts, each with its own system message and opening line before the patient details
+_V1_SYSTEM = {
+    "nursing": "You are an experienced senior nurse with extensive clinical knowledge. Provide practical, evidence-based nursing advice for patient carers.",
+    "patient_advice": "You are an experienced senior nurse speaking directly to patients. Provide encouraging, empowering advice that helps patients take an active role in their recovery. Use 'you' language and be supportive.",
+    "carer_advice": "You are an experienced senior nurse providing guidance to carers. Provide practical, evidence-based caregiving advice. Be empathetic and specific in your guidance.",
+    "patient_question": "You are an experienced senior nurse speaking directly to patients. Provide encouraging, practical answers to patient questions. Use 'you' language and be supportive.",
+    "carer_question": "You are an experienced senior nurse providing guidance to carers. Provide practical, evidence-based caregiving advice. Be empathetic and specific in your guidance.",
+    "specific_advice": "You are an experienced senior nurse with extensive clinical knowledge. Provide practical, evidence-based nursing advice for patient carers. Be empathetic and specific in your guidance.",
+    "combined": "You are an experienced senior nurse with extensive clinical knowledge. Provide practical, evidence-based nursing advice for patients and their carers.",
+    "sections": "You are an experienced senior nurse with extensive clinical knowledge. Provide practical, evidence-based nursing advice for patient carers.",
+}
+_V1_OPENING = {
+    "nursing": "You are an experienced senior nurse with the knowledge of a senior consultant. Based on the following patient information, provide comprehensive nursing advice for the carer.",
+    "patient_advice": "You are an experienced senior nurse speaking directly to a patient. Based on the following patient information, provide encouraging, empowering advice that helps the patient understand their situation and take an active role in their recovery.",
+    "carer_advice": "You are an experienced senior nurse providing guidance to a carer. Based on the following patient information, provide comprehensive caregiving advice that helps the carer provide the best possible support.",
+    "patient_question": "You are an experienced senior nurse speaking directly to a patient. A patient is asking you a specific question about their care and recovery. Please provide a helpful, encouraging answer.",
+    "carer_question": "You are an experienced senior nurse providing guidance to a carer. A carer is asking you a specific question about providing care. Please provide detailed, practical guidance.",
+    "specific_advice": "You are an experienced senior nurse with the knowledge of a senior consultant. A carer is asking for specific advice about their patient. Please provide detailed, practical guidance.",
+    "combined": "You are an experienced senior nurse with the knowledge of a senior consultant. Based on the following patient information, provide nursing advice for the carer and for the patient.",
+    "sections": "You are an experienced senior nurse with the knowledge of a senior consultant. Based on the following patient information, provide nursing advice for the carer.",
+}
+
+# v2: one system message and the patient details first, then who the advice is for
+_V2_OPENING = {
+    "nursing": "Provide comprehensive nursing advice for the patient's carer.",
+    "patient_advice": "Speak directly to the patient. Provide encouraging, empowering advice that helps them understand their situation and take an active role in their recovery.",
+    "carer_advice": "Speak to the patient's carer. Provide comprehensive caregiving advice that helps the carer provide the best possible support.",
+    "patient_question": "Speak directly to the patient, who is asking a specific question about their care and recovery. Provide a helpful, encouraging answer.",
+    "carer_question": "Speak to the patient's carer, who is asking a specific question about providing care. Provide detailed, practical guidance.",
+    "specific_advice": "A carer is asking for specific advice about this patient. Provide detailed, practical guidance.",
+    "combined": "Provide the general nursing advice, the patient's advice and the carer's advice in one reply.",
+    "sections": "Provide comprehensive nursing advice for the patient's carer.",
+}
+
+TEMPLATES = {
+    "v1": {
+        "context": PATIENT_INFORMATION,
+        "views": {
+            view: {
+                "system": _V1_SYSTEM[view],
+                "intro": "\n" + _V1_OPENING[view] + "\n\n",
+                "instructions": "\n" + _INSTRUCTIONS[view],
+            }
+            for view in VIEWS
+        },
+    },
+    "v2": {
+        "system": "You are an experienced senior nurse with the knowledge of a senior consultant. Give practical, evidence-based and empathetic advice about the patient below, suited to their current recovery and treatment phase.",
+        "context": PATIENT_INFORMATION,
+        "views": {
+            view: {"instructions": "\n" + _V2_OPENING[view] + "\n\n" + _INSTRUCTIONS[view]}
+            for view in VIEWS
+        },
+    },
+}
+
+# Rendered prefixes kept for reuse (one per patient, phase and layout)
+PROMPT_PREFIX_CACHE_SIZE = int(os.getenv("PROMPT_PREFIX_CACHE_SIZE", "1024"))
+
+def _placeholders(text):
+    return {name for _, name, _, _ in string.Formatter().parse(text) if name is not None}
+
+def _check(version, view, part, text, allowed):
+    unknown = _placeholders(text) - set(allowed)
+    if unknown:
+        raise ValueError(f"Prompt {version}/{view} {part} uses unknown fields: {', '.join(sorted(unknown))}")
+
+class PromptTemplate:
+    """
+    One prompt version, checked and split into prefix and suffix templates when loaded
+    """
+
+    def __init__(self, version, spec):
+        self.version = version
+        self._views = {}
+        for view in VIEWS:
+            if view not in spec.get("views", {}):
+                raise ValueError(f"Prompt {version} has no template for {view}")
+            view_spec = spec["views"][view]
+            system = view_spec.get("system", spec.get("system", ""))
+            prefix = view_spec.get("intro", spec.get("intro", "")) + view_spec.get("context", spec.get("context", ""))
+            instructions = view_spec["instructions"]
+            _check(version, view, "system message", system, CONTEXT_FIELDS)
+            _check(version, view, "patient block", prefix, CONTEXT_FIELDS)
+            _check(version, view, "instructions", instructions, INSTRUCTION_FIELDS.get(view, ()))
+            self._views[view] = (system, prefix, instructions.format)
+
+    def shares_prefix(self):
+        """Whether all views start with the same system message and patient block"""
+        return len({(system, prefix) for system, prefix, _ in self._views.values()}) == 1
+
+    def messages(self, view, values, question=None, sections=None):
+        """Chat messages for one view; values are the CONTEXT_FIELDS in order"""
+        system, prefix, render_instructions = self._views[view]
+        system, prefix = _render_prefix(system, prefix, values)
+        return [
+            {"role": "system", "content": system},
+            {"role": "user", "content": prefix + render_instructions(question=question, sections=sections)}
+        ]
+
+@functools.lru_cache(maxsize=PROMPT_PREFIX_CACHE_SIZE)
+def _render_prefix(system, prefix, values):
+    fields = dict(zip(CONTEXT_FIELDS, values))
+    return system.format(**fields), prefix.format(**fields)
+
+def prefix_cache_stats():
+    """Hits and misses of the rendered prefix cache"""
+    info = _render_prefix.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize}
+
+compiled = {version: PromptTemplate(version, spec) for version, spec in TEMPLATES.items()}
+
+def load_templates(path):
+    """
+    Add or replace prompt versions from a JSON file
+
+    The file maps version names to the same layout as TEMPLATES: an optional
+    "system", "intro" and "context", and "views" with the "instructions" (and
+    optionally their own "system", "intro" or "context") for every view.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        specs = json.load(f)
+    loaded = {version: PromptTemplate(version, spec) for version, spec in specs.items()}
+    TEMPLATES.update(specs)
+    compiled.update(loaded)
+
+if os.getenv("PROMPT_TEMPLATES_FILE"):
+    load_templates(os.getenv("PROMPT_TEMPLATES_FILE"))
+
+# Version used when no A/B split applies
+PROMPT_VERSION = os.getenv("PROMPT_VERSION", "v1")
+
+def parse_split(text):
+    """Parse an A/B split such as "v2=90,v1=10" into [(version, weight)]"""
+    split = []
+    for part in (text or "").split(","):
+        if not part.strip():
+            continue
+        version, _, weight = part.partition("=")
+        version = version.strip()
+        if version not in compiled:
+            raise ValueError(f"Unknown prompt version in PROMPT_AB_SPLIT: {version}")
+        split.append((version, int(weight or 1)))
+    return split
+
+# Share of patients given each version, e.g. PROMPT_AB_SPLIT=v2=90,v1=10
+PROMPT_AB_SPLIT = parse_split(os.getenv("PROMPT_AB_SPLIT", ""))
+
+if PROMPT_VERSION not in compiled:
+    raise ValueError(f"Unknown PROMPT_VERSION: {PROMPT_VERSION}")
+
+def choose_version(patient_key=None):
+    """
+    Prompt version for a patient
+
+    With an A/B split set, each patient key (a PatientRecord's content hash) always
+    lands on the same version, so their cached advice stays consistent.
+    """
+    total = sum(weight for _, weight in PROMPT_AB_SPLIT)
+    if not total or patient_key is None:
+        return PROMPT_VERSION
+    bucket = int(hashlib.sha256(patient_key.encode("utf-8")).hexdigest()[:8], 16) % total
+    for version, weight in PROMPT_AB_SPLIT:
+        if bucket < weight:
+            return version
+        bucket -= weight
+    return PROMPT_VERSION
+
+def build_messages(view, fields, question=None, timeline=None, version=None, sections=None):
+    """
+    Chat messages for one view from the seven patient fields
+    """
+    gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date = fields
+    # Work out the recovery and treatment phases
+    if timeline is None:
+        timeline = recovery_phases.calculate_timeline(diagnosis, operation_description, operation_date, treatment_start_date)
+    template = compiled.get(version or PROMPT_VERSION)
+    if template is None:
+        raise ValueError(f"Unknown prompt version: {version}")
+    values = (gender, age, diagnosis, operation_description, timeline["operation_phase"], treatment_details, timeline["treatment_status"])
+    return template.messages(view, values, question, sections)
+
+def nursing_advice_messages(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, timeline=None, version=None):
+    """
+    Build the chat messages for get_nursing_advice
+    """
+    fields = (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date)
+    return build_messages("nursing", fields, timeline=timeline, version=version)
+
+def patient_focused_messages(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, timeline=None, version=None):
+    """
+    Build the chat messages for get_patient_focused_advice
+    """
+    fields = (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date)
+    return build_messages("patient_advice", fields, timeline=timeline, version=version)
+
+def carer_focused_messages(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, timeline=None, version=None):
+    """
+    Build the chat messages for get_carer_focused_advice
+    """
+    fields = (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date)
+    return build_messages("carer_advice", fields, timeline=timeline, version=version)
+
+def patient_question_messages(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, patient_question, timeline=None, version=None):
+    """
+    Build the chat messages for get_patient_question_answer
+    """
+    fields = (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date)
+    return build_messages("patient_question", fields, patient_question, timeline, version)
+
+def carer_question_messages(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, carer_question, timeline=None, version=None):
+    """
+    Build the chat messages for get_carer_question_answer
+    """
+    fields = (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date)
+    return build_messages("carer_question", fields, carer_question, timeline, version)
+
+def combined_advice_messages(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, timeline=None, version=None):
+    """
+    Build the chat messages for the combined nursing, patient and carer advice
+    """
+    fields = (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date)
+    return build_messages("combined", fields, timeline=timeline, version=version)
+
+def nursing_sections_messages(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, sections, timeline=None, version=None):
+    """
+    Build the chat messages for some sections of the general nursing advice
+
+    sections is the rendered list from advice_sections.instructions().
+    """
+    fields = (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date)
+    return build_messages("sections", fields, timeline=timeline, version=version, sections=sections)
+
+def specific_advice_messages(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, specific_question, timeline=None, version=None):
+    """
+    Build the chat messages for get_specific_advice
+    """
+    fields = (gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date)
+    return build_messages("specific_advice", fields, specific_question, timeline, version)
@@ -0,0 +1,240 @@
+"""
+Shared requests-per-minute and tokens-per-minute limiter for AI calls
+
+Every advice call (app, batch generator and demos) asks the limiter for
+permission before going upstream, with an estimated token cost: the prompt
+tokens plus max_tokens, which is how OpenAI counts a request against its
+limits. Two token buckets - one for requests, one for tokens - refill
+continuously up to the per-minute limits.
+
+The buckets and the queue of waiting callers live in a small SQLite file, so
+every thread and every app process on the host shares the same quota. Callers
+queue instead of failing and are admitted strictly in priority order (people
+using the app before background prefetching before batch jobs), first come
+first served within a priority.
+"""
+
+import asyncio
+import contextvars
+import os
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import token_budget
+
+# Lower numbers are admitted first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREFETCH = 1
+PRIORITY_BATCH = 2
+
+# Waiters that haven't checked in for this long belong to a crashed process and are dropped
+STALE_WAITER_SECONDS = 30.0
+
+_priority = contextvars.ContextVar("rate_limit_priority", default=PRIORITY_INTERACTIVE)
+
+class RateLimitTimeout(Exception):
+    """Raised when a caller could not be admitted before its timeout"""
+
+@contextmanager
+def use_priority(priority):
+    """Run the enclosed AI calls at the given priority (PRIORITY_BATCH for batch jobs, say)"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def current_priority():
+    """Priority of AI calls made from the current thread or task"""
+    return _priority.get()
+
+def estimate_request_tokens(messages, max_tokens, model="gpt-4"):
+    """Tokens a chat request counts against the TPM limit: prompt plus max_tokens"""
+    return token_budget.count_message_tokens(messages, model) + (max_tokens or 0)
+
+class RateLimiter:
+    """
+    Token buckets for requests and tokens per minute, shared through a SQLite file
+    """
+
+    def __init__(self, path, requests_per_minute=0, tokens_per_minute=0, poll_interval=0.25):
+        self.path = path
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.poll_interval = poll_interval
+        self.admitted = 0
+        self.waited_seconds = 0.0
+
+        if not self.enabled:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS waiters ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "priority INTEGER NOT NULL, "
+                "heartbeat REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS waiters_order ON waiters (priority, id)")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @property
+    def enabled(self):
+        return bool(self.requests_per_minute or self.tokens_per_minute)
+
+    def _limits(self):
+        return {"requests": self.requests_per_minute, "tokens": self.tokens_per_minute}
+
+    def _levels(self, db, now):
+        """Current bucket levels after refilling since their last update"""
+        levels = {}
+        for name, limit in self._limits().items():
+            if not limit:
+                continue
+            row = db.execute("SELECT level, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+            level, updated = row if row else (limit, now)
+            levels[name] = min(limit, level + (now - updated) * limit / 60.0)
+        return levels
+
+    def _try_admit(self, waiter_id, costs):
+        """
+        One attempt at admission: returns 0 if admitted, otherwise how long to wait before trying again
+        """
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("DELETE FROM waiters WHERE heartbeat < ?", (now - STALE_WAITER_SECONDS,))
+                db.execute("UPDATE waiters SET heartbeat = ? WHERE id = ?", (now, waiter_id))
+                head = db.execute("SELECT id FROM waiters ORDER BY priority, id LIMIT 1").fetchone()
+                if head and head[0] != waiter_id:
+                    db.execute("COMMIT")
+                    return self.poll_interval
+
+                levels = self._levels(db, now)
+                shortfall = 0.0
+                for name, level in levels.items():
+                    limit = self._limits()[name]
+                    missing = min(costs[name], limit) - level
+                    if missing > 0:
+                        shortfall = max(shortfall, missing * 60.0 / limit)
+                if shortfall:
+                    db.execute("COMMIT")
+                    return min(shortfall, self.poll_interval * 4)
+
+                for name, level in levels.items():
+                    cost = min(costs[name], self._limits()[name])
+                    db.execute(
+                        "INSERT INTO buckets (name, level, updated) VALUES (?, ?, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET level = excluded.level, updated = excluded.updated",
+                        (name, level - cost, now)
+                    )
+                db.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+                db.execute("COMMIT")
+                return 0
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def _enqueue(self, priority):
+        with self._connect() as db:
+            return db.execute(
+                "INSERT INTO waiters (priority, heartbeat) VALUES (?, ?)", (priority, time.time())
+            ).lastrowid
+
+    def _leave(self, waiter_id):
+        with self._connect() as db:
+            db.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+
+    def acquire(self, tokens=0, priority=None, timeout=None):
+        """
+        Wait until one request costing tokens fits both budgets, then take it
+
+        Callers are admitted in priority order (see use_priority). Raises
+        RateLimitTimeout if that takes longer than timeout seconds.
+        """
+        if not self.enabled:
+            return 0.0
+        priority = current_priority() if priority is None else priority
+        costs = {"requests": 1, "tokens": tokens}
+        started = time.monotonic()
+        waiter_id = self._enqueue(priority)
+        try:
+            while True:
+                wait_for = self._try_admit(waiter_id, costs)
+                if not wait_for:
+                    break
+                if timeout is not None and time.monotonic() - started + wait_for > timeout:
+                    raise RateLimitTimeout(f"Still waiting for AI quota after {time.monotonic() - started:.0f}s")
+                time.sleep(wait_for * random.uniform(0.8, 1.0))
+        except BaseException:
+            self._leave(waiter_id)
+            raise
+        return self._admitted(started)
+
+    async def aacquire(self, tokens=0, priority=None, timeout=None):
+        """
+        Async version of acquire; the database work runs on a worker thread
+        """
+        if not self.enabled:
+            return 0.0
+        priority = current_priority() if priority is None else priority
+        costs = {"requests": 1, "tokens": tokens}
+        started = time.monotonic()
+        waiter_id = await asyncio.to_thread(self._enqueue, priority)
+        try:
+            while True:
+                wait_for = await asyncio.to_thread(self._try_admit, waiter_id, costs)
+                if not wait_for:
+                    break
+                if timeout is not None and time.monotonic() - started + wait_for > timeout:
+                    raise RateLimitTimeout(f"Still waiting for AI quota after {time.monotonic() - started:.0f}s")
+                await asyncio.sleep(wait_for * random.uniform(0.8, 1.0))
+        except BaseException:
+            await asyncio.to_thread(self._leave, waiter_id)
+            raise
+        return self._admitted(started)
+
+    def _admitted(self, started):
+        waited = time.monotonic() - started
+        self.admitted += 1
+        self.waited_seconds += waited
+        return waited
+
+    def stats(self):
+        """Limits, current bucket levels and queue length (shared with other processes) plus local counts"""
+        levels, waiting = {}, 0
+        if self.enabled:
+            with self._connect() as db:
+                levels = self._levels(db, time.time())
+                waiting = db.execute("SELECT COUNT(*) FROM waiters").fetchone()[0]
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "requests_available": round(levels["requests"], 2) if "requests" in levels else None,
+            "tokens_available": round(levels["tokens"], 2) if "tokens" in levels else None,
+            "waiting": waiting,
+            "admitted": self.admitted,
+            "waited_seconds": round(self.waited_seconds, 3),
+        }
+
+def from_env():
+    """The limiter configured by RATE_LIMIT_RPM, RATE_LIMIT_TPM and RATE_LIMIT_DB"""
+    return RateLimiter(
+        os.getenv("RATE_LIMIT_DB", os.path.join("cache", "rate_limit.sqlite3")),
+        requests_per_minute=float(os.getenv("RATE_LIMIT_RPM", "0")),
+        tokens_per_minute=float(os.getenv("RATE_LIMIT_TPM", "0"))
+    )
@@ -0,0 +1,125 @@
+"""
+Recovery timeline engine
+
+Turns the operation and treatment start dates into discrete recovery phases
+("first week", "weeks 2-6", ...). Prompts and cache keys use the phase instead
+of the exact day count, so advice stays valid until the patient moves into the
+next phase rather than changing every midnight.
+"""
+
+import json
+import os
+import re
+from datetime import datetime, date
+
+# Keywords used to pick a diagnosis family from the diagnosis and operation text. They
+# match whole words (or their plurals), so "persistent" is not a stent.
+DIAGNOSIS_FAMILIES = {
+    "orthopaedic": ["hip", "knee", "arthroplasty", "fracture", "fractured", "joint", "spine", "spinal", "orthopaedic", "orthopedic", "shoulder"],
+    "cancer": ["cancer", "tumour", "tumor", "carcinoma", "lymphoma", "chemo", "chemotherapy", "radiotherapy", "oncology", "mastectomy", "lumpectomy"],
+    "cardiac": ["heart", "cardiac", "bypass", "cabg", "stent", "valve", "angioplasty", "pacemaker"],
+}
+
+# Phase boundaries per diagnosis family: (last day of the phase, label), counted from the
+# operation or treatment start. Anything after the last boundary is "over a year".
+PHASE_BOUNDARIES = {
+    "default": [(7, "first week"), (42, "weeks 2-6"), (84, "weeks 7-12"), (182, "months 3-6"), (365, "months 6-12")],
+    "orthopaedic": [(3, "first 3 days"), (14, "first 2 weeks"), (42, "weeks 3-6"), (84, "weeks 7-12"), (182, "months 3-6"), (365, "months 6-12")],
+    "cancer": [(7, "first week"), (21, "weeks 2-3"), (42, "weeks 4-6"), (91, "months 2-3"), (182, "months 4-6"), (365, "months 6-12")],
+    "cardiac": [(7, "first week"), (28, "weeks 2-4"), (56, "weeks 5-8"), (84, "weeks 9-12"), (182, "months 3-6"), (365, "months 6-12")],
+}
+
+# Buckets for events that haven't happened yet: (days until the event, label)
+UPCOMING_BOUNDARIES = [(7, "within the next week"), (28, "in 1-4 weeks")]
+
+def load_phase_config(path):
+    """
+    Merge diagnosis families and phase boundaries from a JSON file
+
+    The file may contain "families" (family -> keywords) and "phases"
+    (family -> list of [last_day, label] pairs).
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    DIAGNOSIS_FAMILIES.update(config.get("families", {}))
+    for family, boundaries in config.get("phases", {}).items():
+        PHASE_BOUNDARIES[family] = [(int(last_day), label) for last_day, label in boundaries]
+
+def diagnosis_family(diagnosis, operation_description=""):
+    """
+    Pick the diagnosis family whose keywords appear in the diagnosis or operation
+    """
+    text = f"{diagnosis or ''} {operation_description or ''}".lower()
+    for family, keywords in DIAGNOSIS_FAMILIES.items():
+        if re.search(_keyword_pattern(keywords), text):
+            return family
+    return "default"
+
+def _keyword_pattern(keywords):
+    """A regex matching any of the keywords as a whole word, optionally plural"""
+    alternatives = "|".join(re.escape(keyword.lower()) for keyword in keywords)
+    return rf"\b(?:{alternatives})s?\b"
+
+def _parse_date(value):
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+def phase_for_days(days, family="default"):
+    """
+    Label the phase for a number of days since an event (negative means upcoming)
+    """
+    if days < 0:
+        for days_until, label in UPCOMING_BOUNDARIES:
+            if -days <= days_until:
+                return label
+        return "in more than 4 weeks"
+
+    for last_day, label in PHASE_BOUNDARIES.get(family, PHASE_BOUNDARIES["default"]):
+        if days <= last_day:
+            return label
+    return "over a year"
+
+def calculate_timeline(diagnosis, operation_description, operation_date, treatment_start_date, today=None):
+    """
+    Work out the recovery and treatment phases for a patient
+
+    Raises ValueError if a date is not in YYYY-MM-DD format.
+    """
+    today = today or date.today()
+    op_date = _parse_date(operation_date)
+    treat_date = _parse_date(treatment_start_date)
+    family = diagnosis_family(diagnosis, operation_description)
+
+    days_since_op = (today - op_date).days
+    days_since_treatment = (today - treat_date).days
+
+    if days_since_op < 0:
+        operation_phase = f"pre-operation (surgery {phase_for_days(days_since_op, family)})"
+    else:
+        operation_phase = f"{phase_for_days(days_since_op, family)} after surgery"
+
+    # Keep the pre-treatment / today / ongoing wording the prompts rely on
+    if days_since_treatment < 0:
+        upcoming = phase_for_days(days_since_treatment, family)
+        treatment_phase = f"pre-treatment (starts {upcoming})"
+        treatment_status = f"Treatment starts {upcoming} (future)"
+    elif days_since_treatment == 0:
+        treatment_phase = "treatment starts today"
+        treatment_status = "Treatment starts today"
+    else:
+        treatment_phase = f"{phase_for_days(days_since_treatment, family)} of treatment"
+        treatment_status = f"Treatment ongoing ({treatment_phase})"
+
+    return {
+        "family": family,
+        "days_since_op": days_since_op,
+        "days_since_treatment": days_since_treatment,
+        "operation_phase": operation_phase,
+        "treatment_phase": treatment_phase,
+        "treatment_status": treatment_status,
+    }
+
+if os.getenv("RECOVERY_PHASES_FILE"):
+    load_phase_config(os.getenv("RECOVERY_PHASES_FILE"))
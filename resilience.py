@@ -0,0 +1,422 @@
+"""
+Retries, deadlines, circuit breaking and hedging around upstream AI calls
+
+Every advice request goes through one Resilience object:
+
+- Each call has a deadline covering all of its attempts, and each attempt's
+  HTTP timeout is the time left before that deadline
+- 429s, 5xx responses, timeouts and connection errors are retried with
+  jittered exponential backoff (honouring Retry-After)
+- A circuit breaker opens after repeated upstream failures and fails calls
+  immediately until a cool-down has passed, then lets one trial call through
+- Optionally, when an attempt is slower than a recent latency percentile, a
+  second identical request is sent and whichever answers first is used
+
+Streams are only retried or hedged until their first chunk arrives, so text
+already shown is never duplicated.
+"""
+
+import asyncio
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+_END = object()
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while the circuit breaker is open"""
+
+class DeadlineExceeded(Exception):
+    """Raised when a call has used up its deadline"""
+
+def is_retryable(error):
+    """Whether an error is worth retrying: rate limits, server errors, timeouts and dropped connections"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(error, TimeoutError):
+        return True
+    # httpx is only loaded once a client exists, and only then can its errors occur
+    httpx = sys.modules.get("httpx")
+    if httpx is not None and isinstance(error, httpx.TransportError):
+        return True
+    # openai's APIConnectionError / APITimeoutError
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+def retry_after(error):
+    """Seconds the server asked us to wait, if it said"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive upstream failures and stays open for reset_seconds
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError if calls should fail fast right now"""
+        with self._lock:
+            if self.state == self.OPEN:
+                wait_for = self._opened_at + self.reset_seconds - time.monotonic()
+                if wait_for > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(
+                        f"The AI service is failing, so requests are paused for another {wait_for:.0f}s"
+                    )
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+            if self.state == self.HALF_OPEN:
+                if self._trial_running:
+                    self.rejected += 1
+                    raise CircuitOpenError("The AI service is recovering; a trial request is already in progress")
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def reset(self):
+        """Close the breaker and forget earlier failures"""
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._trial_running = False
+
+    def release(self):
+        """End a trial call that neither succeeded nor failed upstream (e.g. a bad request)"""
+        with self._lock:
+            self._trial_running = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+class Resilience:
+    """
+    Shared retry, deadline, circuit breaker and hedging policy for upstream calls
+    """
+
+    def __init__(self, max_retries=3, deadline=60.0, base_delay=0.5, max_delay=8.0, breaker=None,
+                 hedge=False, hedge_percentile=0.95, hedge_min_delay=1.0, hedge_min_samples=20):
+        self.max_retries = max_retries
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self._latencies = deque(maxlen=200)
+        self._counts = {"calls": 0, "attempts": 0, "retries": 0, "failures": 0, "deadline_exceeded": 0,
+                        "hedges": 0, "hedge_wins": 0}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counts[name] += amount
+
+    def _backoff(self, attempt, error, remaining):
+        """Full-jitter exponential backoff, or Retry-After if the server gave one"""
+        delay = retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if delay >= remaining:
+            raise DeadlineExceeded(f"No reply within {self.deadline:.0f}s") from error
+        return delay
+
+    def hedge_delay(self):
+        """How long to wait before hedging, or None if hedging is off or there's too little history"""
+        if not self.hedge:
+            return None
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.hedge_min_samples:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile))
+        return max(self.hedge_min_delay, latencies[index])
+
+    def _record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def _attempts(self):
+        """
+        Yield (attempt number, seconds left, deadline) for each attempt, after checking the breaker
+        """
+        self._count("calls")
+        expires = time.monotonic() + self.deadline
+        for attempt in range(self.max_retries + 1):
+            remaining = expires - time.monotonic()
+            if remaining <= 0:
+                self._count("deadline_exceeded")
+                raise DeadlineExceeded(f"No reply within {self.deadline:.0f}s")
+            self.breaker.before_call()
+            self._count("attempts")
+            if attempt:
+                self._count("retries")
+            yield attempt, remaining, expires
+
+    def _failed(self, error, attempt, expires):
+        """
+        Record a failed attempt and return how long to wait before retrying (raises if it shouldn't be retried)
+        """
+        if not is_retryable(error):
+            self.breaker.release()
+            raise error
+        self.breaker.record_failure()
+        self._count("failures")
+        if attempt >= self.max_retries:
+            raise error
+        try:
+            return self._backoff(attempt, error, expires - time.monotonic())
+        except DeadlineExceeded:
+            self._count("deadline_exceeded")
+            raise
+
+    # Sync calls
+
+    def _executor_pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+            return self._executor
+
+    def _race(self, start, timeout):
+        """
+        Run start(timeout) and, if it's slow, a hedged copy; return the first successful result
+        """
+        delay = self.hedge_delay()
+        if delay is None or delay >= timeout:
+            return start(timeout)
+
+        pool = self._executor_pool()
+        first = pool.submit(start, timeout)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        self._count("hedges")
+        second = pool.submit(start, max(0.1, timeout - delay))
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winners = [future for future in done if future.exception() is None]
+            if winners:
+                winner = first if first in winners else winners[0]
+                if winner is second:
+                    self._count("hedge_wins")
+                for loser in (done | pending) - {winner}:
+                    loser.add_done_callback(_close_result)
+                return winner.result()
+            error = next(iter(done)).exception()
+        raise error
+
+    def call(self, fn):
+        """
+        Call fn(timeout) with retries, deadline, circuit breaker and hedging; return its result
+        """
+        for attempt, remaining, expires in self._attempts():
+            started = time.monotonic()
+            try:
+                result = self._race(fn, remaining)
+            except Exception as error:
+                time.sleep(self._failed(error, attempt, expires))
+                continue
+            self.breaker.record_success()
+            self._record_latency(time.monotonic() - started)
+            return result
+
+    def stream(self, open_stream):
+        """
+        Iterate open_stream(timeout), retrying and hedging until the first item arrives
+        """
+        def start(timeout):
+            stream = open_stream(timeout)
+            iterator = iter(stream)
+            return iterator, next(iterator, _END), stream
+
+        for attempt, remaining, expires in self._attempts():
+            started = time.monotonic()
+            try:
+                iterator, first, stream = self._race(start, remaining)
+            except Exception as error:
+                time.sleep(self._failed(error, attempt, expires))
+                continue
+            self.breaker.record_success()
+            self._record_latency(time.monotonic() - started)
+            break
+
+        if first is _END:
+            return
+        yield first
+        for item in iterator:
+            if time.monotonic() > expires:
+                _close(stream)
+                self._count("deadline_exceeded")
+                raise DeadlineExceeded(f"The reply took longer than {self.deadline:.0f}s")
+            yield item
+
+    # Async calls
+
+    async def _arace(self, start, timeout):
+        delay = self.hedge_delay()
+        if delay is None or delay >= timeout:
+            return await start(timeout)
+
+        first = asyncio.ensure_future(start(timeout))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        self._count("hedges")
+        second = asyncio.ensure_future(start(max(0.1, timeout - delay)))
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winners = [task for task in done if task.exception() is None]
+            if winners:
+                winner = first if first in winners else winners[0]
+                if winner is second:
+                    self._count("hedge_wins")
+                for loser in pending:
+                    loser.cancel()
+                for loser in set(winners) - {winner}:
+                    await _aclose_result(loser.result())
+                return winner.result()
+            error = next(iter(done)).exception()
+        raise error
+
+    async def acall(self, fn):
+        """
+        Async version of call - fn(timeout) returns an awaitable
+        """
+        for attempt, remaining, expires in self._attempts():
+            started = time.monotonic()
+            try:
+                result = await self._arace(fn, remaining)
+            except Exception as error:
+                await asyncio.sleep(self._failed(error, attempt, expires))
+                continue
+            self.breaker.record_success()
+            self._record_latency(time.monotonic() - started)
+            return result
+
+    async def astream(self, open_stream):
+        """
+        Async version of stream - open_stream(timeout) returns an awaitable async iterator
+        """
+        async def start(timeout):
+            stream = await open_stream(timeout)
+            iterator = stream.__aiter__()
+            try:
+                first = await iterator.__anext__()
+            except StopAsyncIteration:
+                first = _END
+            return iterator, first, stream
+
+        for attempt, remaining, expires in self._attempts():
+            started = time.monotonic()
+            try:
+                iterator, first, stream = await self._arace(start, remaining)
+            except Exception as error:
+                await asyncio.sleep(self._failed(error, attempt, expires))
+                continue
+            self.breaker.record_success()
+            self._record_latency(time.monotonic() - started)
+            break
+
+        if first is _END:
+            return
+        yield first
+        async for item in iterator:
+            if time.monotonic() > expires:
+                await _aclose(stream)
+                self._count("deadline_exceeded")
+                raise DeadlineExceeded(f"The reply took longer than {self.deadline:.0f}s")
+            yield item
+
+    def reset(self):
+        """Close the circuit breaker and forget recent latencies, e.g. after switching clients"""
+        self.breaker.reset()
+        with self._lock:
+            self._latencies.clear()
+
+    def stats(self):
+        """Retry, failure and hedging counts plus the circuit breaker state"""
+        with self._lock:
+            counts = dict(self._counts)
+        counts["breaker"] = self.breaker.stats()
+        return counts
+
+def _close(stream):
+    """Close a stream we no longer need so its connection is released"""
+    for target in (stream, getattr(stream, "response", None)):
+        close = getattr(target, "close", None)
+        if close:
+            try:
+                close()
+            except Exception:
+                pass
+
+async def _aclose(stream):
+    """Async version of _close"""
+    response = getattr(stream, "response", None)
+    close = getattr(response, "aclose", None)
+    if close:
+        try:
+            await close()
+        except Exception:
+            pass
+
+def _close_result(future):
+    """Done-callback for a losing hedged attempt: close its stream if it opened one"""
+    if future.exception() is None:
+        result = future.result()
+        if isinstance(result, tuple):
+            _close(result[2])
+
+async def _aclose_result(result):
+    """Close the stream of a losing hedged async attempt"""
+    if isinstance(result, tuple):
+        await _aclose(result[2])
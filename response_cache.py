@@ -0,0 +1,193 @@
+"""
+Response cache for AI advice
+
+Advice is cached on the persona, the normalized patient details, the question
+and the model settings, so reloading the same patient does not call the model
+again. Entries live in an in-memory LRU and, optionally, in a SQLite file that
+survives restarts.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+def normalize_text(value):
+    """Lower-case a field and collapse whitespace so trivial edits share a cache entry"""
+    if value is None:
+        return ""
+    return " ".join(str(value).split()).casefold()
+
+def normalize_patient(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date):
+    """
+    Normalize the patient fields that go into a prompt
+    """
+    try:
+        age = int(float(age))
+    except (TypeError, ValueError):
+        age = normalize_text(age)
+
+    return {
+        "gender": normalize_text(gender),
+        "age": age,
+        "diagnosis": normalize_text(diagnosis),
+        "operation_description": normalize_text(operation_description),
+        "operation_date": normalize_text(operation_date),
+        "treatment_details": normalize_text(treatment_details),
+        "treatment_start_date": normalize_text(treatment_start_date),
+    }
+
+def make_key(persona, patient, question, model, max_tokens, temperature, prompt_version=None):
+    """
+    Build a stable cache key from everything that affects the reply
+    """
+    payload = {
+        "persona": persona,
+        "patient": patient,
+        "question": normalize_text(question) if question else None,
+        "model": model,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+    }
+    if prompt_version:
+        payload["prompt_version"] = prompt_version
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+class ResponseCache:
+    """
+    Two-tier cache: an LRU dict in memory in front of an optional SQLite file
+    """
+
+    def __init__(self, max_entries=512, ttl_seconds=86400, disk_path=None, max_disk_entries=10000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        if disk_path:
+            directory = os.path.dirname(disk_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._connect() as db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                    "created_at REAL NOT NULL, last_used REAL NOT NULL)"
+                )
+
+    @contextmanager
+    def _connect(self):
+        """
+        Open a connection to the cache file for the calling thread, commit on success
+        and always close it
+        """
+        db = sqlite3.connect(self.disk_path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _expired(self, created_at, now):
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def get(self, key):
+        """
+        Return the cached reply for key, or None on a miss
+        """
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def get_entry(self, key, count=True):
+        """
+        Return (cached reply, time it was stored) for key, or None on a miss
+
+        Only the memory tier is read under the lock; the disk tier is read on this
+        thread's own connection so a slow file never holds up other lookups. Callers
+        that keep their own hit counts pass count=False so a lookup is counted once.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if not self._expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self.hits += count
+                    return value, created_at
+                del self._memory[key]
+            if not self.disk_path:
+                self.misses += count
+                return None
+
+        row = self._read_disk(key, now)
+        with self._lock:
+            if row is None:
+                self.misses += count
+                return None
+            self._remember(key, row[0], row[1])
+            self.hits += count
+            return row
+
+    def _read_disk(self, key, now):
+        """The unexpired (value, created_at) row for key from the cache file, or None"""
+        with self._connect() as db:
+            row = db.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and not self._expired(row[1], now):
+                db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                return row[0], row[1]
+            if row:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+
+    def set(self, key, value):
+        """
+        Store a reply in memory and, if enabled, on disk
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+        if not self.disk_path:
+            return
+
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            if self.ttl_seconds is not None:
+                db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            # Drop the least recently used rows once the file is over its limit
+            db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,)
+            )
+
+    def _remember(self, key, value, created_at):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        """Remove every cached reply"""
+        with self._lock:
+            self._memory.clear()
+        if self.disk_path:
+            with self._connect() as db:
+                db.execute("DELETE FROM responses")
+
+    def stats(self):
+        """Hit/miss counts and current size of the memory tier"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._memory)}
@@ -0,0 +1,140 @@
+"""
+Similarity cache for free-text patient and carer questions
+
+Carers often ask the same thing in different words ("can she shower yet",
+"when can she have a shower"). Questions are turned into TF-IDF vectors
+locally - no network, no extra packages - and an earlier answer is reused when
+a new question is similar enough and was asked about the same patient context.
+"""
+
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+
+STOPWORDS = {
+    "a", "about", "am", "an", "and", "any", "anything", "are", "as", "at", "be", "been", "being",
+    "can", "could", "did", "do", "does", "doing", "for", "from", "get", "go", "going", "had", "has",
+    "have", "he", "her", "hers", "him", "his", "how", "i", "if", "in", "into", "is", "it", "its",
+    "just", "let", "may", "me", "might", "my", "now", "of", "ok", "okay", "on", "or", "our", "please",
+    "she", "should", "so", "some", "than", "that", "the", "their", "them", "then", "there", "they",
+    "this", "to", "us", "was", "we", "were", "what", "when", "which", "while", "who", "will", "with",
+    "would", "yet", "you", "your", "allowed", "safe", "alright",
+}
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+def _stem(word):
+    """Very small suffix stripper so 'showering' and 'shower' match"""
+    for suffix, min_length in (("ing", 6), ("ed", 5), ("es", 5), ("s", 4)):
+        if word.endswith(suffix) and len(word) >= min_length and not word.endswith("ss"):
+            return word[:-len(suffix)]
+    return word
+
+def tokenize(question):
+    """
+    Turn a question into content terms: words without stopwords plus adjacent word pairs
+    """
+    words = [_stem(word.strip("'")) for word in _WORD.findall((question or "").lower())]
+    words = [word for word in words if word and word not in STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+class SemanticQuestionCache:
+    """
+    Per-context TF-IDF index of answered questions
+    """
+
+    def __init__(self, threshold=0.8, max_per_scope=200):
+        self.threshold = threshold
+        self.max_per_scope = max_per_scope
+        self.hits = 0
+        self.misses = 0
+        self._scopes = {}
+        self._document_frequency = Counter()
+        self._documents = 0
+        self._lock = threading.Lock()
+
+    def _idf(self, term):
+        return math.log((1 + self._documents) / (1 + self._document_frequency[term])) + 1
+
+    def _vector(self, terms):
+        counts = Counter(terms)
+        vector = {term: count * self._idf(term) for term, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return vector, norm
+
+    def lookup(self, scope, question):
+        """
+        Return (answer, matched question, similarity) for the closest earlier question,
+        or None if nothing in this scope passes the threshold
+        """
+        terms = tokenize(question)
+        with self._lock:
+            entries = self._scopes.get(scope)
+            if not terms or not entries:
+                self.misses += 1
+                return None
+
+            query, query_norm = self._vector(terms)
+            best = None
+            for asked, (entry_terms, answer) in entries.items():
+                vector, norm = self._vector(entry_terms)
+                if not norm:
+                    continue
+                dot = sum(weight * vector.get(term, 0.0) for term, weight in query.items())
+                score = dot / (query_norm * norm)
+                if best is None or score > best[2]:
+                    best = (answer, asked, score)
+
+            if best and best[2] >= self.threshold:
+                entries.move_to_end(best[1])
+                self.hits += 1
+                return best
+
+            self.misses += 1
+            return None
+
+    def add(self, scope, question, answer):
+        """
+        Remember the answer to a question in this scope
+        """
+        terms = tokenize(question)
+        if not terms:
+            return
+        with self._lock:
+            entries = self._scopes.setdefault(scope, OrderedDict())
+            if question in entries:
+                entries[question] = (terms, answer)
+                entries.move_to_end(question)
+                return
+
+            entries[question] = (terms, answer)
+            self._count(terms, 1)
+            while len(entries) > self.max_per_scope:
+                _, (old_terms, _) = entries.popitem(last=False)
+                self._count(old_terms, -1)
+
+    def _count(self, terms, change):
+        self._documents += change
+        for term in set(terms):
+            self._document_frequency[term] += change
+            if self._document_frequency[term] <= 0:
+                del self._document_frequency[term]
+
+    def clear(self):
+        """Forget every question"""
+        with self._lock:
+            self._scopes.clear()
+            self._document_frequency.clear()
+            self._documents = 0
+
+    def stats(self):
+        """Hit/miss counts, hit rate and number of indexed questions"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "questions": sum(len(entries) for entries in self._scopes.values()),
+            }
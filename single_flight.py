@@ -0,0 +1,220 @@
+"""
+Single-flight coalescing of identical AI requests
+
+When the same prompt is already being generated (a double click, or a family
+opening the app on several devices), later callers attach to the request in
+flight instead of sending their own. Every caller sees the same partial text
+as it streams in and the same final reply or error. If the caller running the
+request goes away (a closed tab), the first caller still waiting starts it
+again as the new leader and the rest follow that run.
+
+SingleFlight is for the threaded handlers and AsyncSingleFlight for the async
+ones.
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+
+def fingerprint(request):
+    """
+    Stable hash of a chat completion request (model, messages and sampling settings)
+    """
+    request = {name: value for name, value in request.items() if name != "stream"}
+    encoded = json.dumps(request, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+class FlightCancelled(Exception):
+    """Raised in followers when the request's leader gave up; they start it again"""
+
+class _Flight:
+    """Latest text of one in-flight request, shared by everyone waiting on it"""
+
+    def __init__(self):
+        self.text = None
+        self.version = 0
+        self.done = False
+        self.error = None
+
+class _Stats:
+    def __init__(self):
+        self.leaders = 0
+        self.followers = 0
+
+    def stats(self):
+        """How many requests went upstream and how many were coalesced onto them"""
+        return {"upstream": self.leaders, "coalesced": self.followers, "in_flight": len(self._flights)}
+
+class SingleFlight(_Stats):
+    """
+    Coalesces identical requests made from several threads
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def stream(self, key, produce):
+        """
+        Yield the text produced by produce() - a generator function - sharing one run per key
+
+        A follower whose leader is cancelled starts the request again, so the text
+        it yields may start over.
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+                    self.leaders += 1
+                else:
+                    self.followers += 1
+
+            if leader:
+                yield from self._lead(key, flight, produce)
+                return
+            try:
+                yield from self._follow(flight)
+                return
+            except FlightCancelled:
+                continue
+
+    def call(self, key, fn):
+        """
+        Return fn(), sharing one call between identical concurrent callers
+        """
+        result = None
+        for result in self.stream(key, lambda: iter([fn()])):
+            pass
+        return result
+
+    def _lead(self, key, flight, produce):
+        error = None
+        try:
+            for text in produce():
+                with self._lock:
+                    flight.text = text
+                    flight.version += 1
+                    self._changed.notify_all()
+                yield text
+        except Exception as e:
+            error = e
+            raise
+        except BaseException:
+            error = FlightCancelled("The original request was cancelled")
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.error = error
+                flight.done = True
+                self._changed.notify_all()
+
+    def _follow(self, flight):
+        seen = 0
+        while True:
+            with self._lock:
+                while flight.version == seen and not flight.done:
+                    self._changed.wait()
+                text, version, done, error = flight.text, flight.version, flight.done, flight.error
+
+            if version != seen:
+                seen = version
+                yield text
+            if done:
+                if error:
+                    raise error
+                return
+
+class AsyncSingleFlight(_Stats):
+    """
+    Coalesces identical requests made from async handlers on one event loop
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._flights = {}
+
+    async def stream(self, key, produce):
+        """
+        Async version of SingleFlight.stream - produce() is an async generator function
+        """
+        while True:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                flight.changed = asyncio.Condition()
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+            if leader:
+                async for text in self._lead(key, flight, produce):
+                    yield text
+                return
+            try:
+                async for text in self._follow(flight):
+                    yield text
+                return
+            except FlightCancelled:
+                continue
+
+    async def call(self, key, fn):
+        """
+        Async version of SingleFlight.call - fn() returns an awaitable
+        """
+        async def produce():
+            yield await fn()
+
+        result = None
+        async for result in self.stream(key, produce):
+            pass
+        return result
+
+    async def _lead(self, key, flight, produce):
+        error = None
+        try:
+            async for text in produce():
+                flight.text = text
+                flight.version += 1
+                async with flight.changed:
+                    flight.changed.notify_all()
+                yield text
+        except Exception as e:
+            error = e
+            raise
+        except BaseException:
+            error = FlightCancelled("The original request was cancelled")
+            raise
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.error = error
+            flight.done = True
+            # Wake followers from a separate task so this also works while being cancelled
+            asyncio.ensure_future(self._notify(flight))
+
+    async def _notify(self, flight):
+        async with flight.changed:
+            flight.changed.notify_all()
+
+    async def _follow(self, flight):
+        seen = 0
+        while True:
+            async with flight.changed:
+                await flight.changed.wait_for(lambda: flight.version != seen or flight.done)
+            text, version, done, error = flight.text, flight.version, flight.done, flight.error
+
+            if version != seen:
+                seen = version
+                yield text
+            if done:
+                if error:
+                    raise error
+                return
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark for the app
+
+Each sample runs a fresh Python process and times one import path:
+
+- core: `import app`, all that tests, batch jobs and prompt building need
+- ui: `import app` and build the Gradio interface, as `python app.py` does
+  before it starts serving
+
+Reports min/median/max seconds per path and which heavy libraries each path
+loaded, and can write the results as JSON to compare runs.
+
+Usage:
+    python startup_benchmark.py --runs 5
+    python startup_benchmark.py --output startup.json --compare startup_before.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Code timed in a fresh interpreter for each path
+PATHS = {
+    "core": "import app",
+    "ui": "import app; app.app",
+}
+
+# Libraries worth knowing about when they are loaded at startup
+HEAVY_MODULES = ("gradio", "openai", "httpx", "fastapi")
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+{code}
+seconds = time.perf_counter() - started
+print(json.dumps({{"seconds": seconds, "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+def measure(path, runs=3):
+    """Time one import path in runs fresh processes and return a summary"""
+    code = _PROBE.format(code=PATHS[path], heavy=HEAVY_MODULES)
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    samples = []
+    loaded = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        samples.append(result["seconds"])
+        loaded = result["loaded"]
+    return {
+        "runs": runs,
+        "min": round(min(samples), 3),
+        "median": round(statistics.median(samples), 3),
+        "max": round(max(samples), 3),
+        "loaded": loaded,
+    }
+
+def run_benchmark(paths=tuple(PATHS), runs=3):
+    """Measure every import path"""
+    return {path: measure(path, runs) for path in paths}
+
+def print_report(results, baseline=None):
+    for path, result in results.items():
+        line = f"   {path:<5} median {result['median']:.3f}s (min {result['min']:.3f}s, max {result['max']:.3f}s)"
+        if baseline and path in baseline:
+            line += f"  was {baseline[path]['median']:.3f}s"
+        print(line)
+        print(f"         loads: {', '.join(result['loaded']) or 'none of ' + ', '.join(HEAVY_MODULES)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import time of the app")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh processes per import path")
+    parser.add_argument("--paths", default=",".join(PATHS), help=f"Comma-separated import paths: {', '.join(PATHS)}")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    paths = [path.strip() for path in args.paths.split(",") if path.strip()]
+    unknown = [path for path in paths if path not in PATHS]
+    if unknown:
+        parser.error(f"Unknown import path(s): {', '.join(unknown)}")
+
+    print("🏥 Carer App Startup Benchmark")
+    print("=" * 50)
+    results = run_benchmark(paths, args.runs)
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Test script for the advice history kept with each patient in the store
+"""
+
+import asyncio
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import app
+import patient_store
+import testkit
+import token_budget
+import ui
+from patient_record import PatientRecord
+
+sample_patient = (
+    "Female",
+    48,
+    "Breast cancer",
+    "Left mastectomy",
+    "2024-03-04",
+    "Tamoxifen, radiotherapy",
+    "2024-04-01",
+)
+
+# The sample patient's record in each test's store
+FILENAME = "history_patient.json"
+
+@contextmanager
+def fresh_store(fake, history_max_bytes=262144):
+    """A fresh store in a temp folder holding the sample patient, with a fake client and no response cache"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = patient_store.PatientStore(directory, history_max_bytes=history_max_bytes)
+        with testkit.patched(fake, store=store, RESPONSE_CACHE_ENABLED=False, SEMANTIC_CACHE_ENABLED=False):
+            app.save_patient_data(*sample_patient, FILENAME)
+            yield store
+
+def test_generated_advice_is_recorded():
+    """Each generated reply is appended with its persona, prompt version, model, tokens and latency"""
+    print("🗂️  Testing advice history...")
+    with fresh_store(testkit.FakeCompletions()) as store:
+        app.get_nursing_advice(*sample_patient)
+        list(app.stream_carer_focused_advice(*sample_patient))
+        app.get_patient_question_answer(*sample_patient, "Can I drive yet?")
+        history = store.history(FILENAME)
+
+    assert [entry["persona"] for entry in history] == ["nursing", "carer_advice", "patient_question"]
+    assert history[2]["question"] == "Can I drive yet?"
+    for entry in history:
+        assert entry["model"] == app.OPENAI_MODEL
+        assert entry["prompt_version"] in app.prompts.compiled
+        assert entry["prompt_tokens"] > 0 and entry["completion_tokens"] > 0
+        assert entry["latency_seconds"] >= 0 and entry["timestamp"]
+    print(f"✅ {len(history)} replies recorded with their metadata")
+
+def test_history_follows_the_saved_record():
+    """Advice goes to every record saved with its details; edited records only bring back advice for their new details"""
+    with fresh_store(testkit.FakeCompletions()) as store:
+        app.save_patient_data(*sample_patient, "same_details")
+        app.get_patient_focused_advice(*sample_patient)
+        unsaved = ("Male",) + sample_patient[1:]
+        app.get_patient_focused_advice(*unsaved)
+
+        # Edit the record: its history stays with it, but the old advice no longer applies
+        versions = ui.load_patient_form(FILENAME, {})[-1]
+        edited = sample_patient[:5] + ("Tamoxifen only",) + sample_patient[6:]
+        ui.save_patient_form(*edited, FILENAME, versions)
+        after_edit = ui.load_patient_form(FILENAME, {})[9]
+        app.get_patient_focused_advice(*edited)
+        history, same_details = store.history(FILENAME), store.history("same_details.json")
+        reloaded = ui.load_patient_form(FILENAME, {})[9]
+        files = os.listdir(os.path.join(store.data_dir, patient_store.HISTORY_DIRNAME))
+
+    assert [entry["advice"] for entry in history] == ["Advice from call 1", "Advice from call 3"]
+    assert [entry["advice"] for entry in same_details] == ["Advice from call 1"]
+    assert history[0]["details_hash"] == PatientRecord(*sample_patient).details_hash
+    assert sorted(files) == ["history_patient.jsonl", "same_details.jsonl"]  # nothing for the unsaved details
+    assert after_edit == ""
+    assert reloaded.endswith("Advice from call 3")
+    print("✅ History is kept per saved record")
+
+def test_long_fields_keep_their_history():
+    """A record with free text over the prompt budget still gets its advice history back"""
+    long_details = "Daily dressing changes and physiotherapy. " * 200
+    patient = sample_patient[:5] + (long_details,) + sample_patient[6:]
+    assert token_budget.count_tokens(long_details) > token_budget.FIELD_TOKENS
+    fake = testkit.FakeCompletions()
+    with fresh_store(fake) as store:
+        app.save_patient_data(*patient, "long_details")
+        app.get_nursing_advice(*patient)
+        history = store.history("long_details.json")
+        saved = app.saved_advice("long_details.json", *patient)
+
+    assert token_budget.TRIM_MARKER in fake.calls[0]["messages"][-1]["content"]
+    assert [entry["advice"] for entry in history] == ["Advice from call 1"]
+    assert saved[0].endswith("Advice from call 1")
+    print("✅ Trimmed prompts keep the history of the saved record")
+
+def test_load_brings_back_latest_advice():
+    """Loading a saved patient fills the advice boxes from the history without an AI call"""
+    fake = testkit.FakeCompletions()
+    with fresh_store(fake):
+        app.get_patient_focused_advice(*sample_patient)
+        app.get_patient_focused_advice(*sample_patient)
+        calls = len(fake.calls)
+        outputs = ui.load_patient_form(FILENAME, {})
+        assert len(fake.calls) == calls
+
+    nursing, patient, carer = outputs[8:11]
+    assert nursing == carer == ""
+    assert patient.startswith("🗂️ Saved advice from") and patient.endswith("Advice from call 2")
+    print("✅ Loading a patient restores its latest advice")
+
+def test_coalesced_callers_record_once():
+    """Callers sharing one upstream call add one history entry between them"""
+    fake = testkit.FakeCompletions(delay=0.1)
+    with fresh_store(fake) as store:
+        threads = [threading.Thread(target=app.get_patient_focused_advice, args=sample_patient) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        history = store.history(FILENAME)
+
+    assert len(fake.calls) == 1
+    assert [entry["advice"] for entry in history] == ["Advice from call 1"]
+    print("✅ Coalesced callers record the shared reply once")
+
+def test_async_handlers_write_history_off_the_event_loop():
+    """Async handlers append to the history from a worker thread, not the event loop"""
+    writers = []
+
+    async def advise():
+        await app.aget_carer_focused_advice(*sample_patient)
+        return threading.current_thread()
+
+    with fresh_store(testkit.AsyncFakeCompletions()) as store:
+        append_history = store.append_history
+
+        def recording(*args):
+            writers.append(threading.current_thread())
+            return append_history(*args)
+
+        store.append_history = recording
+        loop_thread = asyncio.run(advise())
+        history = store.history(FILENAME)
+
+    assert len(history) == 1 and len(writers) == 1
+    assert writers[0] is not loop_thread
+    print("✅ Async handlers don't block the event loop on history writes")
+
+def test_errors_are_not_recorded():
+    """Failed calls leave no history"""
+    with fresh_store(testkit.FakeCompletions(error=ConnectionError("offline"))) as store:
+        app.get_carer_focused_advice(*sample_patient)
+        assert store.history(FILENAME) == []
+    print("✅ Errors are not recorded")
+
+def test_history_is_compacted():
+    """Past the size limit, older entries move to a gzipped archive and the latest stay"""
+    with fresh_store(testkit.FakeCompletions(), history_max_bytes=1000) as store:
+        for _ in range(6):
+            app.get_patient_focused_advice(*sample_patient)
+        app.get_carer_focused_advice(*sample_patient)
+        live = store.history(FILENAME)
+        everything = store.history(FILENAME, include_archived=True)
+        live_size = os.path.getsize(os.path.join(store.data_dir, patient_store.HISTORY_DIRNAME, "history_patient.jsonl"))
+        latest = store.latest_advice(FILENAME)
+
+    print(f"   {len(live)} live entries ({live_size} bytes), {len(everything)} in total")
+    assert len(everything) == 7
+    assert len(live) < len(everything)
+    assert latest["patient_advice"]["advice"] == "Advice from call 6"
+    assert latest["carer_advice"]["advice"] == "Advice from call 7"
+    assert [entry["advice"] for entry in everything] == [f"Advice from call {n}" for n in range(1, 8)]
+    print("✅ History is compacted past its size limit")
+
+def test_history_stays_under_its_size_limit():
+    """Distinct questions can't grow the history past its limit"""
+    with fresh_store(testkit.FakeCompletions(), history_max_bytes=2000) as store:
+        path = os.path.join(store.data_dir, patient_store.HISTORY_DIRNAME, "history_patient.jsonl")
+        app.get_carer_focused_advice(*sample_patient)
+        sizes = []
+        for n in range(40):
+            app.get_carer_question_answer(*sample_patient, f"Question number {n}?")
+            sizes.append(os.path.getsize(path))
+        everything = store.history(FILENAME, include_archived=True)
+        latest = store.latest_advice(FILENAME)
+
+    print(f"   Largest live history: {max(sizes)} bytes")
+    assert max(sizes) <= 2000
+    assert len(everything) == 41
+    assert [entry["question"] for entry in everything[1:]] == [f"Question number {n}?" for n in range(40)]
+    assert latest["carer_advice"]["advice"] == "Advice from call 1"
+    print("✅ History with every question different stays under its size limit")
+
+if __name__ == "__main__":
+    test_generated_advice_is_recorded()
+    test_history_follows_the_saved_record()
+    test_long_fields_keep_their_history()
+    test_load_brings_back_latest_advice()
+    test_coalesced_callers_record_once()
+    test_async_handlers_write_history_off_the_event_loop()
+    test_errors_are_not_recorded()
+    test_history_is_compacted()
+    test_history_stays_under_its_size_limit()
+    print("\n🎉 Advice history tests complete!")
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Test script for section-level caching of the general nursing advice
+"""
+
+from datetime import date, timedelta
+
+import advice_sections
+import app
+import response_cache
+import testkit
+from patient_record import PatientRecord
+
+today = date.today()
+
+def days_ago(days):
+    return (today - timedelta(days=days)).isoformat()
+
+sample_patient = (
+    "Female",
+    72,
+    "Hip fracture",
+    "Dynamic hip screw fixation",
+    days_ago(20),
+    "Physiotherapy, calcium and vitamin D",
+    days_ago(18),
+)
+# Same patient with the treatment start date moved into the future
+moved_start = sample_patient[:6] + ((today + timedelta(days=3)).isoformat(),)
+
+def section_caching(fake):
+    """Section caching on and a fake client"""
+    return testkit.patched(fake, SECTION_CACHE_ENABLED=True, RESPONSE_CACHE_ENABLED=True)
+
+def test_split_and_stitch():
+    """Replies split into sections by heading and stitch back in order"""
+    reply = "Here you go.\n\n4. **WARNING SIGNS**: Fever.\n\n1. **PATIENT STAGE ASSESSMENT**: Early recovery.\nStill sore."
+    sections = advice_sections.split(reply)
+    assert sections == {"warning_signs": "Fever.", "patient_stage_assessment": "Early recovery.\nStill sore."}
+    stitched = advice_sections.stitch(sections)
+    assert stitched.startswith("1. **PATIENT STAGE ASSESSMENT**: Early recovery.")
+    assert advice_sections.split(stitched) == sections
+    print("✅ Sections split and stitch by heading")
+
+def test_keys_follow_declared_dependencies():
+    """Moving the treatment start date only changes the keys of sections that depend on it"""
+    before = advice_sections.section_keys(PatientRecord(*sample_patient), "gpt-4", 0.7)
+    after = advice_sections.section_keys(PatientRecord(*moved_start), "gpt-4", 0.7)
+    changed = sorted(key for key in before if before[key] != after[key])
+    print(f"   Changed sections: {', '.join(changed)}")
+    for section in advice_sections.SECTIONS:
+        assert (section.key in changed) == ("treatment_status" in section.depends_on)
+    print("✅ Section keys follow their declared dependencies")
+
+def test_section_lookups_are_counted_once():
+    """Section lookups count as section cache hits and misses, not as response cache ones too"""
+    cache = response_cache.ResponseCache()
+    sections = advice_sections.SectionCache(cache)
+    keys = advice_sections.section_keys(PatientRecord(*sample_patient), "gpt-4", 0.7)
+    sections.store(keys, {"warning_signs": "Fever."})
+    cached, missing, _ = sections.lookup(keys)
+    assert cached == {"warning_signs": "Fever."}
+    assert sections.stats() == {"hits": 1, "misses": len(missing)}
+    assert cache.stats()["hits"] == cache.stats()["misses"] == 0
+    print("✅ Section lookups are counted once")
+
+def test_only_affected_sections_are_regenerated():
+    """After an edit, unchanged sections come from the cache and the rest from one smaller call"""
+    print("🧩 Testing partial regeneration...")
+    fake = testkit.FakeCompletions(testkit.sections_reply())
+    with section_caching(fake):
+        first = app.get_nursing_advice(*sample_patient)
+        second = app.get_nursing_advice(*moved_start)
+    assert len(fake.calls) == 2
+    assert first.count("from call 1") == len(advice_sections.SECTIONS)
+    assert "caring_guidance from call 1" in second
+    assert "recovery_timeline from call 2" in second and "warning_signs from call 2" in second
+    assert fake.calls[1]["max_tokens"] < fake.calls[0]["max_tokens"]
+    assert "**CARING GUIDANCE**" not in fake.calls[1]["messages"][-1]["content"]
+    assert list(advice_sections.split(second)) == [section.key for section in advice_sections.SECTIONS]
+    print("✅ Only the affected sections were asked for again")
+
+def test_stream_shows_cached_sections_first():
+    """Streaming shows the unchanged sections straight away, then fills in the new ones"""
+    with section_caching(testkit.FakeCompletions(testkit.sections_reply())):
+        app.get_nursing_advice(*sample_patient)
+        updates = list(app.stream_nursing_advice(*moved_start))
+    cached = advice_sections.split(updates[0])
+    assert set(cached) == {section.key for section in advice_sections.SECTIONS if "treatment_status" not in section.depends_on}
+    assert len(advice_sections.split(updates[-1])) == len(advice_sections.SECTIONS)
+    print(f"✅ {len(cached)} cached sections shown first, {len(updates) - 1} streamed updates after")
+
+def test_reply_without_headings_is_shown_as_is():
+    """A reply the sections can't be found in is passed through rather than dropped"""
+    with section_caching(testkit.FakeCompletions("Plain advice.")):
+        assert app.get_nursing_advice(*sample_patient) == "Plain advice."
+    print("✅ Unstructured replies are passed through")
+
+if __name__ == "__main__":
+    test_split_and_stitch()
+    test_keys_follow_declared_dependencies()
+    test_section_lookups_are_counted_once()
+    test_only_affected_sections_are_regenerated()
+    test_stream_shows_cached_sections_first()
+    test_reply_without_headings_is_shown_as_is()
+    print("\n🎉 Section cache tests complete!")
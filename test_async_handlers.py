@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test script for the async advice handlers and pooled async client
+"""
+
+import asyncio
+
+import app
+import testkit
+
+sample_patient = (
+    "Male",
+    72,
+    "Knee replacement surgery",
+    "Total knee arthroplasty (left knee)",
+    "2024-01-05",
+    "Physical therapy 2x weekly, pain management",
+    "2024-01-07",
+)
+
+def test_async_advice_runs_concurrently():
+    """Many async requests should be in flight at once without threads"""
+    print("⚡ Testing concurrent async advice...")
+    fake = testkit.AsyncFakeCompletions("Keep moving.", delay=0.05)
+
+    async def run_many():
+        # Different ages so the requests are not coalesced into one
+        patients = [sample_patient[:1] + (20 + i,) + sample_patient[2:] for i in range(50)]
+        return await asyncio.gather(*[app.aget_carer_focused_advice(*patient) for patient in patients])
+
+    with testkit.patched(fake):
+        results = asyncio.run(run_many())
+
+    print(f"   Max requests in flight: {fake.max_active}")
+    assert all(result == "Keep moving." for result in results)
+    assert fake.max_active == 50
+    print("✅ Async advice requests share the event loop")
+
+def test_async_streaming():
+    """The async streaming handlers yield growing text"""
+    async def collect():
+        return [text async for text in app.astream_patient_question_answer(*sample_patient, "How do I reduce swelling?")]
+
+    with testkit.patched(testkit.AsyncFakeCompletions("Ice the knee.")):
+        updates = asyncio.run(collect())
+
+    assert updates == ["Ice ", "Ice the ", "Ice the knee."]
+    print("✅ Async streaming yields partial text")
+
+def test_async_errors_are_reported():
+    """Errors come back as the usual message instead of raising"""
+    bad_patient = sample_patient[:4] + ("05/01/2024",) + sample_patient[5:]
+    advice = asyncio.run(app.aget_patient_focused_advice(*bad_patient))
+    assert advice.startswith("❌ Error getting patient advice:")
+    print("✅ Async errors are reported")
+
+def test_handler_selection():
+    """The UI picks the variant matching the streaming and async switches"""
+    original = (app.STREAM_RESPONSES, app.ASYNC_HANDLERS)
+    try:
+        app.STREAM_RESPONSES, app.ASYNC_HANDLERS = True, True
+        assert app._advice_handler("carer_focused_advice") is app.astream_carer_focused_advice
+        app.STREAM_RESPONSES, app.ASYNC_HANDLERS = False, True
+        assert app._advice_handler("carer_focused_advice") is app.aget_carer_focused_advice
+        app.STREAM_RESPONSES, app.ASYNC_HANDLERS = True, False
+        assert app._advice_handler("carer_focused_advice") is app.stream_carer_focused_advice
+        app.STREAM_RESPONSES, app.ASYNC_HANDLERS = False, False
+        assert app._advice_handler("carer_focused_advice") is app.get_carer_focused_advice
+    finally:
+        app.STREAM_RESPONSES, app.ASYNC_HANDLERS = original
+    print("✅ Handler selection follows the configuration")
+
+if __name__ == "__main__":
+    test_async_advice_runs_concurrently()
+    test_async_streaming()
+    test_async_errors_are_reported()
+    test_handler_selection()
+    print("\n🎉 Async handler tests complete!")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test script for the batch advice generator
+"""
+
+import json
+import os
+import tempfile
+
+import batch_advice
+import testkit
+
+def failing_for(diagnosis):
+    """Batch advice, except for the patient with `diagnosis`"""
+    def reply(kwargs, number):
+        if diagnosis in kwargs["messages"][-1]["content"]:
+            raise RuntimeError("upstream unavailable")
+        return "Batch advice"
+    return reply
+
+def write_records(directory, count):
+    for i in range(count):
+        record = {
+            "gender": "Female",
+            "age": 40 + i,
+            "diagnosis": f"Condition {i}",
+            "operation": {"description": "Operation", "date": "2024-01-10"},
+            "treatment": {"details": "Treatment", "start_date": "2024-01-12"},
+        }
+        with open(os.path.join(directory, f"patient_{i}.json"), 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+
+def run_with(fake, directory, **kwargs):
+    with testkit.patched(fake):
+        return batch_advice.run_batch(data_dir=directory, workers=3, rpm=0, use_cache=False, log=lambda message: None, **kwargs)
+
+def test_batch_writes_advice_next_to_records():
+    """Every record gets an advice file with each requested persona"""
+    print("📦 Testing batch generation...")
+    with tempfile.TemporaryDirectory() as directory:
+        write_records(directory, 6)
+        fake = testkit.FakeCompletions("Batch advice")
+        summary = run_with(fake, directory)
+        print(f"   Summary: {summary}")
+
+        assert summary["records"] == 6 and summary["succeeded"] == 6 and summary["failed"] == 0
+        assert len(fake.calls) == 12
+        with open(os.path.join(directory, "patient_0.advice.json"), 'r', encoding='utf-8') as f:
+            output = json.load(f)
+        assert set(output["advice"]) == {"patient", "carer"}
+        assert output["advice"]["carer"]["advice"] == "Batch advice"
+    print("✅ Advice written next to each record")
+
+def test_batch_resumes_from_checkpoint():
+    """A second run skips finished records and retries failed ones"""
+    with tempfile.TemporaryDirectory() as directory:
+        write_records(directory, 4)
+        first = run_with(testkit.FakeCompletions(failing_for("Condition 2")), directory)
+        assert first["succeeded"] == 3 and first["failed"] == 1
+
+        fake = testkit.FakeCompletions("Batch advice")
+        second = run_with(fake, directory)
+        print(f"   Resumed run: {second}")
+        assert second["skipped"] == 3 and second["succeeded"] == 1
+        assert len(fake.calls) == 2
+        # Advice files are never picked up as patient records
+        assert second["records"] == 4
+    print("✅ Interrupted runs resume where they stopped")
+
+if __name__ == "__main__":
+    test_batch_writes_advice_next_to_records()
+    test_batch_resumes_from_checkpoint()
+    print("\n🎉 Batch advice tests complete!")
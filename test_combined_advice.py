@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Test script for generating the nursing, patient and carer advice in one call
+"""
+
+import asyncio
+import json
+
+import app
+import combined_advice
+import testkit
+
+sample_patient = (
+    "Male",
+    59,
+    "Colorectal cancer",
+    "Laparoscopic right hemicolectomy",
+    "2024-04-08",
+    "Oral chemotherapy cycles, stoma care",
+    "2024-05-06",
+)
+
+document = {
+    "assessment": {key: f"{heading.title()} for this week." for key, heading in combined_advice.ASSESSMENT_SECTIONS},
+    "patient_advice": "You are doing well. Walk a little more each day.",
+    "carer_advice": "Help with stoma bag changes and watch for fever.",
+}
+
+def combined_reply(reply):
+    """`reply` for combined requests and plain text for any other"""
+    return lambda kwargs, number: reply if "JSON object" in kwargs["messages"][-1]["content"] else "Separate advice."
+
+def combined(fake):
+    """Combined mode on and a fake client"""
+    return testkit.patched(fake, COMBINED_ADVICE=True)
+
+def test_schema_checks():
+    """Documents missing a section, or with empty text, are rejected"""
+    combined_advice.validate(document)
+    broken = json.loads(json.dumps(document))
+    del broken["assessment"]["warning_signs"]
+    for bad in (broken, dict(document, carer_advice=" "), ["not", "an", "object"]):
+        try:
+            combined_advice.validate(bad)
+        except combined_advice.InvalidAdvice as e:
+            print(f"   Rejected: {e}")
+        else:
+            raise AssertionError(f"{bad} should be rejected")
+    assert combined_advice.parse("```json\n" + json.dumps(document) + "\n```") == document
+    print("✅ Replies are checked against the schema")
+
+def test_three_views_from_one_call():
+    """The nursing, patient and carer views all come from a single upstream call"""
+    print("🧩 Testing combined advice...")
+    fake = testkit.FakeCompletions(combined_reply(json.dumps(document)))
+    with combined(fake):
+        nursing = app.get_nursing_advice(*sample_patient)
+        patient = app.get_patient_focused_advice(*sample_patient)
+        carer = "".join(app.stream_carer_focused_advice(*sample_patient))
+    assert len(fake.calls) == 1
+    assert nursing.startswith("1. **PATIENT STAGE ASSESSMENT**: Patient Stage Assessment for this week.")
+    assert "6. **EMOTIONAL SUPPORT**" in nursing
+    assert patient == document["patient_advice"]
+    assert carer == document["carer_advice"]
+    print("✅ One upstream call serves all three views")
+
+def test_async_views_share_one_call():
+    """Async handlers running together share the same combined call"""
+    fake = testkit.AsyncFakeCompletions(combined_reply(json.dumps(document)))
+
+    async def all_views():
+        return await asyncio.gather(
+            app.aget_nursing_advice(*sample_patient),
+            app.aget_patient_focused_advice(*sample_patient),
+            app.aget_carer_focused_advice(*sample_patient),
+        )
+
+    with combined(fake):
+        views = asyncio.run(all_views())
+    assert len(fake.calls) == 1
+    assert views[1] == document["patient_advice"]
+    print("✅ Async views share the combined call")
+
+def test_invalid_reply_falls_back_to_separate_call():
+    """A reply that doesn't match the schema falls back to the view's own prompt"""
+    fake = testkit.FakeCompletions(combined_reply("Sorry, here is some advice in prose."))
+    with combined(fake):
+        advice = app.get_carer_focused_advice(*sample_patient, use_cache=False)
+    assert advice == "Separate advice."
+    assert len(fake.calls) == 2
+    print("✅ Invalid combined replies fall back to separate calls")
+
+def test_questions_are_not_combined():
+    """Question answers still get their own call"""
+    with combined(testkit.FakeCompletions(combined_reply(json.dumps(document)))):
+        answer = app.get_carer_question_answer(*sample_patient, "Can he shower with the stoma?")
+    assert answer == "Separate advice."
+    print("✅ Questions keep their own calls")
+
+if __name__ == "__main__":
+    test_schema_checks()
+    test_three_views_from_one_call()
+    test_async_views_share_one_call()
+    test_invalid_reply_falls_back_to_separate_call()
+    test_questions_are_not_combined()
+    print("\n🎉 Combined advice tests complete!")
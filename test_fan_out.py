@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Test script for generating every advice view in parallel on submit
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import app
+import fan_out
+import testkit
+from testkit import sample_patient
+
+def persona_reply(kwargs, number):
+    """A reply that differs for each persona's system prompt"""
+    return f"Advice for persona {len(kwargs['messages'][0]['content'])}."
+
+def counting_jobs(names, release):
+    def job():
+        yield "one"
+        release.wait(5)
+        yield "one two"
+    return {name: job for name in names}
+
+def test_late_followers_see_partial_and_final_text():
+    """Following a view shows what is already there, then the rest"""
+    pool = fan_out.FanOutPool(max_concurrent=2)
+    release = threading.Event()
+    fan = pool.start(("patient",), counting_jobs(["a", "b"], release))
+
+    time.sleep(0.1)
+    assert fan.peek("a") == ("one", False)
+    updates = fan.follow("a")
+    assert next(updates) == "one"
+    release.set()
+    assert list(updates) == ["one two"]
+    assert fan.result("b") == "one two"
+    assert fan.matches(("patient",), "a") and not fan.matches(("other",))
+    print("✅ Followers attach to generations in progress")
+
+class NoWorkerThreads(ThreadPoolExecutor):
+    """An executor that fails anything handed to it"""
+
+    def submit(self, *args, **kwargs):
+        raise AssertionError("async followers should not need a worker thread")
+
+def test_async_followers_wait_on_the_event_loop():
+    """Async followers are woken by the generation instead of each holding a worker thread"""
+    pool = fan_out.FanOutPool(max_concurrent=1)
+    release = threading.Event()
+    fan = pool.start(("patient",), counting_jobs(["a"], release))
+
+    async def follow_all():
+        asyncio.get_running_loop().set_default_executor(NoWorkerThreads())
+
+        async def follow():
+            return [text async for text in fan.afollow("a")]
+
+        followers = asyncio.gather(*(follow() for _ in range(5)))
+        await asyncio.sleep(0.05)
+        release.set()
+        return await asyncio.wait_for(followers, 5)
+
+    assert asyncio.run(follow_all()) == [["one", "one two"]] * 5
+    assert not fan._waiters
+    print("✅ Async followers wait on the event loop")
+
+def test_pool_caps_concurrent_fan_outs():
+    """When the cap is reached no new fan-out starts until one finishes"""
+    pool = fan_out.FanOutPool(max_concurrent=1)
+    release = threading.Event()
+    first = pool.start(("one",), counting_jobs(["a", "b"], release))
+    assert pool.start(("two",), counting_jobs(["a"], release)) is None
+
+    release.set()
+    first.result("a")
+    first.result("b")
+    time.sleep(0.05)
+    assert pool.start(("three",), counting_jobs(["a"], release)) is not None
+    assert pool.stats()["skipped"] == 1
+    print("✅ Concurrent fan-outs are capped")
+
+def test_cancelled_generation_stops():
+    """Cancelling stops a generation and followers are told"""
+    pool = fan_out.FanOutPool(max_concurrent=1)
+    release = threading.Event()
+    fan = pool.start(("one",), counting_jobs(["a"], release))
+    time.sleep(0.05)
+    fan.cancel()
+    release.set()
+    try:
+        fan.result("a")
+        assert False, "expected the generation to be cancelled"
+    except fan_out.FanOutCancelled:
+        pass
+    print("✅ Cancelled generations stop")
+
+def test_submit_generates_all_views_in_parallel():
+    """Submitting starts every advice view at once and the tabs reuse them"""
+    print("🔀 Testing parallel advice on submit...")
+    fake = testkit.FakeCompletions(persona_reply, delay=0.15)
+    with testkit.patched(fake, ASYNC_HANDLERS=False, PREFETCH_ADVICE=True):
+        started = time.perf_counter()
+        updates = list(app.submit_patient_info(*sample_patient))
+        session_fan_out = updates[-1][3]
+        status, json_output, advice, _ = updates[-1]
+
+        patient_advice = list(app._prefetched_handler("patient_focused_advice")(*sample_patient, session_fan_out))[-1]
+        carer_advice = list(app._prefetched_handler("carer_focused_advice")(*sample_patient, session_fan_out))[-1]
+        elapsed = time.perf_counter() - started
+
+    print(f"   {len(fake.calls)} upstream calls, up to {fake.max_active} at once, {elapsed:.2f}s")
+    assert status.startswith("✅") and '"diagnosis"' in json_output
+    assert advice.startswith("Advice for persona")
+    assert patient_advice.startswith("Advice for persona") and carer_advice.startswith("Advice for persona")
+    assert len(fake.calls) == 3
+    assert fake.max_active == 3
+    assert updates[0][3] is session_fan_out  # handed to the session before the advice finishes
+    print("✅ Advice views are generated together and shown from the session")
+
+def test_changed_patient_is_not_served_from_fan_out():
+    """The tabs only reuse the fan-out for the same patient details"""
+    fake = testkit.FakeCompletions(persona_reply)
+    with testkit.patched(fake, ASYNC_HANDLERS=False, PREFETCH_ADVICE=True):
+        session_fan_out = list(app.submit_patient_info(*sample_patient))[-1][3]
+        session_fan_out.result("patient_focused_advice")
+        calls = len(fake.calls)
+        changed = ("Male",) + sample_patient[1:]
+        list(app._prefetched_handler("patient_focused_advice")(*changed, session_fan_out))
+
+    assert len(fake.calls) == calls + 1
+    print("✅ Changed patient details generate fresh advice")
+
+if __name__ == "__main__":
+    test_late_followers_see_partial_and_final_text()
+    test_async_followers_wait_on_the_event_loop()
+    test_pool_caps_concurrent_fan_outs()
+    test_cancelled_generation_stops()
+    test_submit_generates_all_views_in_parallel()
+    test_changed_patient_is_not_served_from_fan_out()
+    print("\n🎉 Fan-out tests complete!")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Test script for the end-to-end load benchmark
+"""
+
+import json
+import os
+
+import load_benchmark
+import mock_openai_server
+
+def test_percentiles_and_summary():
+    """Percentiles interpolate and errors are counted per event"""
+    assert load_benchmark.percentile([], 0.5) is None
+    assert load_benchmark.percentile([5], 0.99) == 5
+    assert load_benchmark.percentile([1, 2, 3, 4], 0.5) == 2.5
+    assert abs(load_benchmark.percentile(list(range(1, 101)), 0.95) - 95.05) < 1e-9
+
+    samples = [
+        {"event": "load", "ok": True, "latency": 0.1, "ttft": None},
+        {"event": "load", "ok": False, "latency": 5.0, "ttft": None},
+        {"event": "carer_question", "ok": True, "latency": 1.0, "ttft": 0.2},
+    ]
+    events, overall = load_benchmark.summarize(samples, elapsed=2.0)
+    assert events["load"]["error_rate"] == 0.5
+    assert events["load"]["latency"]["max"] == 0.1
+    assert events["load"]["time_to_first_token"] is None
+    assert events["carer_question"]["time_to_first_token"]["p50"] == 0.2
+    assert overall["count"] == 3 and overall["throughput_per_second"] == 1.5
+    print("✅ Percentiles and summaries are correct")
+
+def test_small_offline_run():
+    """A short run against the local app and mock model covers every scripted event"""
+    print("🏋️  Running a small offline load test...")
+    environment = {name: os.environ.get(name) for name in ("OPENAI_API_KEY", "OPENAI_BASE_URL", "PATIENT_DATA_DIR")}
+    results = load_benchmark.run_benchmark(
+        users=2,
+        iterations=1,
+        scripts={"new_patient": 1},
+        mock_config=mock_openai_server.MockConfig(response_words=20),
+        seed=1,
+        log=lambda message: None
+    )
+    load_benchmark.print_report(results)
+
+    assert set(results["events"]) == {"submit", "save", "patient_advice", "carer_question", "load"}
+    assert results["overall"]["errors"] == 0, results["sample_errors"]
+    assert results["events"]["carer_question"]["time_to_first_token"]["p50"] is not None
+    assert results["mock_server"]["requests"] >= 6
+    json.dumps(results)
+    assert {name: os.environ.get(name) for name in environment} == environment
+    print("✅ Offline load test completed without errors")
+
+if __name__ == "__main__":
+    test_percentiles_and_summary()
+    test_small_offline_run()
+    print("\n🎉 Load benchmark tests complete!")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test script for the Prometheus metrics and the /metrics route
+"""
+
+import asyncio
+import inspect
+from types import SimpleNamespace
+
+import gradio as gr
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app
+import metrics
+import testkit
+
+sample_patient = (
+    "Female",
+    58,
+    "Rotator cuff repair",
+    "Arthroscopic repair of the right rotator cuff",
+    "2024-02-01",
+    "Sling for four weeks, physiotherapy afterwards",
+    "2024-02-03",
+)
+
+def test_registry_renders_prometheus_text():
+    """Counters, histograms and collected values come out in the text exposition format"""
+    registry = metrics.Registry()
+    calls = registry.counter("demo_calls_total", "Demo calls", ("handler",))
+    latency = registry.histogram("demo_latency_seconds", "Demo latency", ("handler",), buckets=(0.1, 1.0))
+    registry.collect("demo_queue", "Demo queue", lambda: 3)
+    calls.inc("save")
+    calls.inc("save")
+    latency.observe(0.05, "save")
+    latency.observe(5.0, "save")
+
+    text = registry.render()
+    print(text)
+    assert "# TYPE demo_calls_total counter" in text
+    assert 'demo_calls_total{handler="save"} 2' in text
+    assert 'demo_latency_seconds_bucket{handler="save",le="0.1"} 1' in text
+    assert 'demo_latency_seconds_bucket{handler="save",le="+Inf"} 2' in text
+    assert 'demo_latency_seconds_count{handler="save"} 2' in text
+    assert "demo_queue 3" in text
+    print("✅ Metrics render in the Prometheus format")
+
+def test_instrument_keeps_handler_kind():
+    """Wrapped handlers stay sync, generator or async so Gradio treats them the same way"""
+    def plain(x):
+        return x + 1
+
+    def generator(x):
+        yield x
+        yield x + 1
+
+    async def coroutine(x):
+        return x * 2
+
+    def broken():
+        raise ValueError("bad input")
+
+    assert metrics.instrument("t_plain", plain)(1) == 2
+    assert list(metrics.instrument("t_generator", generator)(1)) == [1, 2]
+    assert asyncio.run(metrics.instrument("t_coroutine", coroutine)(2)) == 4
+    try:
+        metrics.instrument("t_broken", broken)()
+    except ValueError:
+        pass
+
+    assert inspect.isgeneratorfunction(metrics.instrument("t_generator", generator))
+    assert inspect.iscoroutinefunction(metrics.instrument("t_coroutine", coroutine))
+    assert metrics.handler_calls.value("t_generator") == 1
+    assert metrics.handler_latency.count("t_coroutine") == 1
+    assert metrics.handler_errors.value("t_broken", "ValueError") == 1
+    print("✅ Handlers are instrumented without changing how they run")
+
+def test_advice_calls_record_tokens_latency_and_cost():
+    """AI calls record latency, first-token time, tokens and an estimated cost"""
+    print("💷 Testing upstream metrics...")
+    metrics.registry.clear()
+    usage = SimpleNamespace(prompt_tokens=400, completion_tokens=100)
+    with testkit.patched(testkit.FakeCompletions("Keep the sling on when walking outside.", usage=usage)):
+        app.get_nursing_advice(*sample_patient, use_cache=False)
+        list(app.stream_patient_focused_advice(*sample_patient, use_cache=False))
+
+    assert metrics.upstream_calls.value("nursing") == 1
+    assert metrics.prompt_tokens.value("nursing") == 400
+    assert metrics.completion_tokens.value("nursing") == 100
+    expected = metrics.estimate_cost(app.OPENAI_MODEL, 400, 100)
+    assert abs(metrics.cost_dollars.value("nursing") - expected) < 1e-9
+    assert metrics.time_to_first_token.count("patient_advice") == 1
+    assert metrics.upstream_latency.count("patient_advice") == 1
+    print(f"   Estimated cost of the assessment: ${expected:.4f}")
+    print("✅ Tokens, cost and latency are recorded")
+
+def test_metrics_route_next_to_gradio():
+    """/metrics is served alongside the Gradio app and includes the collected stats"""
+    print("📈 Testing the /metrics route...")
+    server = gr.mount_gradio_app(metrics.add_route(FastAPI()), app.app, path="/")
+    with TestClient(server) as http:
+        response = http.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "carer_handler_calls_total" in response.text
+        assert 'carer_cache_lookups_total{cache="response",result="hit"}' in response.text
+        assert "carer_circuit_breaker_open 0" in response.text
+        assert http.get("/").status_code == 200
+    print("✅ /metrics is mounted next to the app")
+
+if __name__ == "__main__":
+    test_registry_renders_prometheus_text()
+    test_instrument_keeps_handler_kind()
+    test_advice_calls_record_tokens_latency_and_cost()
+    test_metrics_route_next_to_gradio()
+    print("\n🎉 Metrics tests complete!")
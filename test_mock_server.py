@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Test script for the local OpenAI-compatible mock server
+"""
+
+import asyncio
+import time
+
+import httpx
+from openai import OpenAI, AsyncOpenAI, RateLimitError, InternalServerError
+
+import app
+import mock_openai_server
+import testkit
+from testkit import sample_patient
+
+def start(**settings):
+    return mock_openai_server.serve_in_background(mock_openai_server.MockConfig(**settings))
+
+def test_latency_specs():
+    """Every latency distribution parses and never goes negative"""
+    for spec in ("fixed:0.2", "uniform:0.1,0.3", "normal:0.1,0.5", "lognormal:-1,0.5", "exponential:0.2"):
+        sample = mock_openai_server.parse_latency(spec)
+        assert all(sample() >= 0 for _ in range(100)), spec
+    for spec in ("gamma:1", "uniform:1", "fixed:abc"):
+        try:
+            mock_openai_server.parse_latency(spec)
+            assert False, f"{spec} should be rejected"
+        except ValueError:
+            pass
+    print("✅ Latency specs parse")
+
+def test_completion_and_stream_with_openai_client():
+    """The real openai client can complete and stream against the mock"""
+    print("🧪 Testing the mock server with the OpenAI client...")
+    server = start(responses=["Canned reply for {model} (request {request})"])
+    try:
+        client = OpenAI(api_key="mock", base_url=server.base_url, max_retries=0)
+        response = client.chat.completions.create(model="gpt-4", messages=[{"role": "user", "content": "Hello"}])
+        assert response.choices[0].message.content == "Canned reply for gpt-4 (request 1)"
+        assert response.usage.total_tokens > 0
+
+        chunks = client.chat.completions.create(model="gpt-4", messages=[{"role": "user", "content": "Hello"}], stream=True)
+        text = "".join(chunk.choices[0].delta.content or "" for chunk in chunks)
+        assert text == "Canned reply for gpt-4 (request 2)"
+        assert server.state.stats()["streamed"] == 1
+    finally:
+        server.shutdown()
+    print("✅ Completions and streaming work")
+
+def test_latency_and_token_rate():
+    """Time to first token and generation speed follow the configuration"""
+    server = start(latency="fixed:0.2", tokens_per_second=200, response_words=50)
+    try:
+        client = OpenAI(api_key="mock", base_url=server.base_url, max_retries=0)
+        started = time.perf_counter()
+        chunks = client.chat.completions.create(model="gpt-4", messages=[{"role": "user", "content": "Hi"}], stream=True)
+        first_token = None
+        pieces = 0
+        for chunk in chunks:
+            if chunk.choices[0].delta.content:
+                first_token = first_token or time.perf_counter() - started
+                pieces += 1
+        total = time.perf_counter() - started
+        print(f"   First token after {first_token:.2f}s, {pieces} chunks in {total:.2f}s")
+        assert 0.2 <= first_token < 1.0
+        assert total >= 0.2 + pieces / 200 * 0.8
+    finally:
+        server.shutdown()
+    print("✅ Latency and tokens per second are applied")
+
+def test_error_and_rate_limit_injection():
+    """Injected 429s and 500s surface as the usual openai exceptions"""
+    server = start(rate_limit_rate=1.0)
+    try:
+        client = OpenAI(api_key="mock", base_url=server.base_url, max_retries=0)
+        try:
+            client.chat.completions.create(model="gpt-4", messages=[{"role": "user", "content": "Hi"}])
+            assert False, "expected a 429"
+        except RateLimitError:
+            pass
+    finally:
+        server.shutdown()
+
+    server = start(error_rate=1.0)
+    try:
+        client = OpenAI(api_key="mock", base_url=server.base_url, max_retries=0)
+        try:
+            client.chat.completions.create(model="gpt-4", messages=[{"role": "user", "content": "Hi"}])
+            assert False, "expected a 500"
+        except InternalServerError:
+            pass
+        assert server.state.stats()["errors"] == 1
+    finally:
+        server.shutdown()
+    print("✅ Error and 429 injection work")
+
+def test_app_against_mock_server():
+    """The app's sync and async advice paths run end to end against the mock"""
+    print("🏥 Testing the app against the mock server...")
+    server = start(template="Mock advice: {question}", response_words=30)
+    clients = {
+        "client": OpenAI(api_key="mock", base_url=server.base_url, max_retries=0),
+        "async_client": AsyncOpenAI(api_key="mock", base_url=server.base_url, max_retries=0, http_client=httpx.AsyncClient()),
+    }
+    try:
+        with testkit.patched(**clients):
+            advice = app.get_patient_focused_advice(*sample_patient, use_cache=False)
+            assert advice.startswith("Mock advice:"), advice
+
+            updates = list(app.stream_carer_focused_advice(*sample_patient, use_cache=False))
+            assert updates[-1].startswith("Mock advice:") and len(updates) > 1
+
+            async def ask():
+                return await app.aget_nursing_advice(*sample_patient, use_cache=False)
+
+            assert asyncio.run(ask()).startswith("Mock advice:")
+    finally:
+        server.shutdown()
+    print("✅ The app works fully offline against the mock")
+
+if __name__ == "__main__":
+    test_latency_specs()
+    test_completion_and_stream_with_openai_client()
+    test_latency_and_token_rate()
+    test_error_and_rate_limit_injection()
+    test_app_against_mock_server()
+    print("\n🎉 Mock server tests complete!")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test script for the PatientRecord model
+"""
+
+import dataclasses
+from datetime import date, timedelta
+
+import app
+import prompts
+import recovery_phases
+from patient_record import PatientRecord
+
+today = date.today()
+
+def days_ago(days):
+    return (today - timedelta(days=days)).isoformat()
+
+sample_patient = (
+    "Female",
+    67.0,
+    "Total knee replacement",
+    "Right total knee arthroplasty",
+    days_ago(10),
+    "Physiotherapy twice daily, anticoagulants",
+    days_ago(9),
+)
+
+def test_fields_are_checked_and_parsed():
+    """Dates are parsed once, age becomes an int and text is trimmed"""
+    record = PatientRecord(" Female ", *sample_patient[1:])
+    assert record.gender == "Female"
+    assert record.age == 67
+    assert record.operation_day == today - timedelta(days=10)
+    assert record.timeline["days_since_op"] == 10
+    assert record.form_fields()[4] == days_ago(10)
+
+    for bad in (sample_patient[:4] + ("15/01/2024",) + sample_patient[5:], ("Female", "old") + sample_patient[2:], ("Female", 200) + sample_patient[2:]):
+        try:
+            PatientRecord(*bad)
+        except ValueError as e:
+            print(f"   Rejected: {e}")
+        else:
+            raise AssertionError(f"{bad} should be rejected")
+
+    partial = PatientRecord("Male", "", "Hip fracture", "", "", "", "")
+    assert partial.age is None and partial.timeline is None
+    print("✅ Fields are validated and dates parsed once")
+
+def test_record_is_frozen_and_compact():
+    """Records can't be changed after they are built and have no per-instance dict"""
+    record = PatientRecord(*sample_patient)
+    try:
+        record.age = 30
+    except dataclasses.FrozenInstanceError:
+        pass
+    else:
+        raise AssertionError("PatientRecord should be frozen")
+    assert not hasattr(record, "__dict__")
+    assert record == PatientRecord(*sample_patient)
+    print("✅ Records are frozen and use __slots__")
+
+def test_content_hash_follows_what_the_prompt_sees():
+    """The hash ignores formatting and day-to-day date changes within a phase"""
+    record = PatientRecord(*sample_patient)
+    same = PatientRecord("female", 67, "Total  knee replacement", *sample_patient[3:5], "physiotherapy twice daily, anticoagulants", days_ago(9))
+    next_day = PatientRecord(*sample_patient[:4], days_ago(11), sample_patient[5], days_ago(10))
+    other = PatientRecord(*sample_patient[:2], "Hip fracture", *sample_patient[3:])
+    assert record.content_hash == same.content_hash == next_day.content_hash
+    assert record.content_hash != other.content_hash
+    assert app._cache_key("carer_advice", sample_patient, 1500) == app._cache_key("carer_advice", sample_patient, 1500, record)
+    print("✅ Content hash is stable and cheap to reuse")
+
+def test_timeline_is_shared_with_prompts():
+    """Prompts built from a record's timeline match ones that work it out themselves"""
+    record = PatientRecord(*sample_patient)
+    original = recovery_phases.calculate_timeline
+    recovery_phases.calculate_timeline = None
+    try:
+        reused = prompts.carer_focused_messages(*record.form_fields(), timeline=record.timeline)
+    finally:
+        recovery_phases.calculate_timeline = original
+    assert reused == prompts.carer_focused_messages(*record.form_fields())
+    print("✅ Prompt building reuses the record's timeline")
+
+def test_saved_layout_round_trips():
+    """to_dict() gives the saved JSON layout and from_dict() reads it back"""
+    record = PatientRecord(*sample_patient)
+    saved = record.to_dict()
+    assert saved["operation"] == {"description": "Right total knee arthroplasty", "date": days_ago(10)}
+    assert saved["age"] == 67
+    assert PatientRecord.from_dict(saved) == record
+    assert app.patient_fields(saved) == record.form_fields()
+    print("✅ Records round-trip through the saved layout")
+
+if __name__ == "__main__":
+    test_fields_are_checked_and_parsed()
+    test_record_is_frozen_and_compact()
+    test_content_hash_follows_what_the_prompt_sees()
+    test_timeline_is_shared_with_prompts()
+    test_saved_layout_round_trips()
+    print("\n🎉 Patient record tests complete!")
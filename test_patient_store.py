@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Test script for the indexed patient store
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import patient_store
+
+def make_record(diagnosis, timestamp):
+    return {
+        "timestamp": timestamp,
+        "gender": "Female",
+        "age": 60,
+        "diagnosis": diagnosis,
+        "operation": {"description": "Operation", "date": "2024-01-10"},
+        "treatment": {"details": "Treatment", "start_date": "2024-01-12"},
+    }
+
+def test_save_load_and_index():
+    """Saved records can be loaded back and appear in the index"""
+    print("🗂️  Testing save and load through the store...")
+    with tempfile.TemporaryDirectory() as directory:
+        store = patient_store.PatientStore(directory)
+        filename, version = store.save("patient_jane", make_record("Hip replacement", "2025-01-01T10:00:00"))
+
+        assert filename == "patient_jane.json"
+        assert version == 1
+        assert os.path.exists(os.path.join(directory, "patient_jane.json"))
+        assert store.load("patient_jane.json")["diagnosis"] == "Hip replacement"
+        assert store.load("missing.json") is None
+        assert store.count() == 1
+    print("✅ Records are saved, loaded and indexed")
+
+def test_sorted_paged_listing_and_prefix_search():
+    """Listing is sorted and paged; search matches name or diagnosis prefixes"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = patient_store.PatientStore(directory)
+        store.save("brown_anne", make_record("Knee replacement", "2025-01-03T10:00:00"))
+        store.save("adams_bob", make_record("Breast cancer", "2025-01-01T10:00:00"))
+        store.save("clark_cat", make_record("Hip fracture", "2025-01-02T10:00:00"))
+
+        newest = [row["filename"] for row in store.list()]
+        by_name = [row["filename"] for row in store.list(sort="name")]
+        second_page = [row["filename"] for row in store.list(offset=1, limit=1, sort="name")]
+        print(f"   Newest first: {newest}")
+        assert newest == ["brown_anne.json", "clark_cat.json", "adams_bob.json"]
+        assert by_name == ["adams_bob.json", "brown_anne.json", "clark_cat.json"]
+        assert second_page == ["brown_anne.json"]
+
+        assert [row["filename"] for row in store.find("BR")] == ["brown_anne.json", "adams_bob.json"]
+        assert [row["filename"] for row in store.find("hip")] == ["clark_cat.json"]
+    print("✅ Sorted, paged listing and prefix search work")
+
+def test_migration_imports_existing_files():
+    """Existing JSON files are indexed on first open and by import_directory"""
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(3):
+            with open(os.path.join(directory, f"old_{i}.json"), 'w', encoding='utf-8') as f:
+                json.dump(make_record(f"Condition {i}", f"2024-01-0{i + 1}T10:00:00"), f)
+        with open(os.path.join(directory, "old_0.advice.json"), 'w', encoding='utf-8') as f:
+            json.dump({"advice": {}}, f)
+
+        store = patient_store.PatientStore(directory)
+        assert store.count() == 3
+
+        os.remove(os.path.join(directory, "old_1.json"))
+        with open(os.path.join(directory, "new.json"), 'w', encoding='utf-8') as f:
+            json.dump(make_record("New condition", "2024-02-01T10:00:00"), f)
+        assert store.import_directory() == 1
+        assert sorted(row["filename"] for row in store.list()) == ["new.json", "old_0.json", "old_2.json"]
+    print("✅ Migration imports existing records")
+
+def test_old_index_gains_details_hashes():
+    """An index made before the advice history is upgraded so records can be found by their details"""
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "old.json"), 'w', encoding='utf-8') as f:
+            json.dump(make_record("Hip replacement", "2024-01-11T10:00:00"), f)
+        db = sqlite3.connect(os.path.join(directory, patient_store.INDEX_FILENAME))
+        db.execute(
+            "CREATE TABLE patients (id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT NOT NULL UNIQUE, "
+            "name_key TEXT NOT NULL, diagnosis TEXT NOT NULL, diagnosis_key TEXT NOT NULL, "
+            "updated_at TEXT NOT NULL, mtime REAL NOT NULL)"
+        )
+        db.execute("INSERT INTO patients (filename, name_key, diagnosis, diagnosis_key, updated_at, mtime) "
+                   "VALUES ('old.json', 'old', 'Hip replacement', 'hip replacement', '2024-01-11T10:00:00', ?)",
+                   (os.path.getmtime(os.path.join(directory, "old.json")),))
+        db.commit()
+        db.close()
+
+        store = patient_store.PatientStore(directory)
+        details = patient_store.details_hash(make_record("Hip replacement", None))
+        assert details and store.filenames_for_details(details) == ["old.json"]
+        assert store.count() == 1
+    print("✅ Old indexes are upgraded with details hashes")
+
+def test_listing_is_fast_with_many_records():
+    """The first page comes from the index without scanning the folder"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = patient_store.PatientStore(directory)
+        with store._connect() as db:
+            for i in range(20000):
+                store._index(db, f"patient_{i:05d}.json", make_record("Condition", f"2024-01-01T{i % 24:02d}:00:00"), 0.0)
+
+        start = time.perf_counter()
+        page = store.list(limit=100)
+        matches = store.find("patient_1999")
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"   Page + search over 20000 records: {elapsed_ms:.1f} ms")
+        assert len(page) == 100 and len(matches) == 10
+        assert elapsed_ms < 500
+    print("✅ Listing stays fast with many records")
+
+def test_stale_save_is_refused():
+    """A save based on an older version is refused instead of overwriting newer data"""
+    print("🔒 Testing optimistic versioning...")
+    with tempfile.TemporaryDirectory() as directory:
+        store = patient_store.PatientStore(directory)
+        _, version = store.save("shared", make_record("Hip replacement", "2025-01-01T10:00:00"), expected_version=0)
+        loaded_by_a = loaded_by_b = version
+
+        _, version = store.save("shared", make_record("Hip replacement, day 2", "2025-01-02T10:00:00"), expected_version=loaded_by_a)
+        assert version == 2
+        try:
+            store.save("shared", make_record("Stale edit", "2025-01-02T11:00:00"), expected_version=loaded_by_b)
+            assert False, "stale save should have been refused"
+        except patient_store.StaleRecordError as e:
+            assert e.current_version == 2
+
+        record = store.load("shared.json")
+        assert record["diagnosis"] == "Hip replacement, day 2" and record["version"] == 2
+    print("✅ Stale saves are detected")
+
+def test_form_save_never_overwrites_unloaded_files():
+    """Saving from the form under a name this session hasn't loaded only creates the file"""
+    import app
+    import ui
+
+    sample = ("Female", 60, "Hip replacement", "Operation", "2024-01-10", "Treatment", "2024-01-12")
+    original = app.store
+    with tempfile.TemporaryDirectory() as directory:
+        app.store = patient_store.PatientStore(directory)
+        try:
+            status, _, versions_a = ui.save_patient_form(*sample, "shared", {})
+            assert status.startswith("✅") and versions_a == {"shared.json": 1}
+
+            # A second session that never loaded the file can't overwrite it
+            edited = sample[:2] + ("Edited elsewhere",) + sample[3:]
+            status, _, versions_b = ui.save_patient_form(*edited, "shared", {})
+            print(f"   Refused: {status}")
+            assert "already exists" in status and versions_b == {}
+            assert app.store.load("shared.json")["diagnosis"] == "Hip replacement"
+
+            # After loading, it can save over it
+            versions_b = ui.load_patient_form("shared.json", versions_b)[-1]
+            status, _, _ = ui.save_patient_form(*edited, "shared", versions_b)
+            assert status.startswith("✅")
+            assert app.store.load("shared.json")["diagnosis"] == "Edited elsewhere"
+        finally:
+            app.store = original
+    print("✅ Form saves only overwrite files the session has loaded")
+
+def test_failed_write_keeps_previous_record():
+    """A crash while writing leaves the previous file intact and no temp files behind"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = patient_store.PatientStore(directory)
+        store.save("patient", make_record("Original", "2025-01-01T10:00:00"))
+
+        class Unserializable:
+            pass
+
+        broken = make_record("Half written", "2025-01-02T10:00:00")
+        broken["treatment"]["details"] = Unserializable()
+        try:
+            store.save("patient", broken)
+            assert False, "save should have failed"
+        except TypeError:
+            pass
+
+        assert store.load("patient.json")["diagnosis"] == "Original"
+        assert [name for name in os.listdir(directory) if name.endswith(".tmp")] == []
+    print("✅ Interrupted writes never truncate a record")
+
+def test_saves_keep_file_permissions():
+    """New records get the usual permissions and saves keep whatever a record already has"""
+    if os.name != "posix":
+        return
+    umask = os.umask(0)
+    os.umask(umask)
+    with tempfile.TemporaryDirectory() as directory:
+        store = patient_store.PatientStore(directory)
+        path = os.path.join(directory, "patient.json")
+        store.save("patient", make_record("Original", "2025-01-01T10:00:00"))
+        assert oct(os.stat(path).st_mode & 0o777) == oct(0o666 & ~umask)
+
+        os.chmod(path, 0o640)
+        store.save("patient", make_record("Updated", "2025-01-02T10:00:00"))
+        assert oct(os.stat(path).st_mode & 0o777) == oct(0o640)
+    print("✅ Saves keep record permissions")
+
+def test_concurrent_saves_and_loads_stress():
+    """Many threads saving and loading the same files never see a corrupt or lost update"""
+    print("🏋️  Stress testing concurrent saves and loads...")
+    with tempfile.TemporaryDirectory() as directory:
+        store = patient_store.PatientStore(directory)
+        filenames = ["alpha.json", "beta.json", "gamma.json"]
+        for filename in filenames:
+            store.save(filename, dict(make_record("writer -1", "2025-01-01T10:00:00"), age=-1, counter=0))
+
+        writers, saves_per_writer = 8, 40
+        stop = threading.Event()
+        problems = []
+        conflicts = [0]
+
+        def write(writer):
+            for i in range(saves_per_writer):
+                filename = filenames[(writer + i) % len(filenames)]
+                # Optimistic read-modify-write: retry on conflict, never lose an increment
+                while True:
+                    current = store.load(filename)
+                    record = dict(make_record(f"writer {writer}", "2025-01-01T10:00:00"), age=writer, counter=current["counter"] + 1)
+                    try:
+                        store.save(filename, record, expected_version=current["version"])
+                        break
+                    except patient_store.StaleRecordError:
+                        conflicts[0] += 1
+
+        def read():
+            while not stop.is_set():
+                for filename in filenames:
+                    try:
+                        record = store.load(filename)
+                    except ValueError as e:
+                        problems.append(f"{filename}: {e}")
+                        continue
+                    if record["diagnosis"] != f"writer {record['age']}":
+                        problems.append(f"{filename}: mixed record {record}")
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        threads = [threading.Thread(target=write, args=(writer,)) for writer in range(writers)]
+        for thread in readers + threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stop.set()
+        for thread in readers:
+            thread.join()
+
+        total = sum(store.load(filename)["counter"] for filename in filenames)
+        print(f"   {writers * saves_per_writer} saves, {conflicts[0]} conflicts retried, {len(problems)} problems")
+        assert problems == []
+        assert total == writers * saves_per_writer
+        assert sum(store.load(filename)["version"] - 1 for filename in filenames) == total
+        assert store.count() == len(filenames)
+        assert [name for name in os.listdir(directory) if name.endswith(".tmp")] == []
+    print("✅ No corruption or lost updates under concurrency")
+
+if __name__ == "__main__":
+    test_save_load_and_index()
+    test_sorted_paged_listing_and_prefix_search()
+    test_migration_imports_existing_files()
+    test_old_index_gains_details_hashes()
+    test_listing_is_fast_with_many_records()
+    test_stale_save_is_refused()
+    test_form_save_never_overwrites_unloaded_files()
+    test_failed_write_keeps_previous_record()
+    test_saves_keep_file_permissions()
+    test_concurrent_saves_and_loads_stress()
+    print("\n🎉 Patient store tests complete!")
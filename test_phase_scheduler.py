@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Test script for the daily advice precompute of patients changing recovery phase
+"""
+
+import json
+import os
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+import app
+import patient_store
+import phase_scheduler
+import response_cache
+import testkit
+
+today = date.today()
+
+def days_ago(days):
+    return (today - timedelta(days=days)).isoformat()
+
+def record(diagnosis, operation_days_ago, treatment_days_ago):
+    return {
+        "gender": "Female",
+        "age": 70,
+        "diagnosis": diagnosis,
+        "operation": {"description": "Total hip replacement", "date": days_ago(operation_days_ago) if operation_days_ago is not None else ""},
+        "treatment": {"details": "Physiotherapy", "start_date": days_ago(treatment_days_ago) if treatment_days_ago is not None else ""},
+    }
+
+# Orthopaedic phases: "first 2 weeks" runs to day 14, so day 15 starts "weeks 3-6"
+RECORDS = {
+    "crosses_operation_phase": record("Hip arthritis", 15, 20),
+    "treatment_starts_today": record("Hip arthritis", 30, 0),
+    "same_phase": record("Hip arthritis", 20, 20),
+    "no_dates": record("Hip arthritis", None, None),
+}
+
+def write_records(directory):
+    for name, patient_record in RECORDS.items():
+        with open(os.path.join(directory, f"{name}.json"), 'w', encoding='utf-8') as f:
+            json.dump(patient_record, f)
+
+def planned_names(jobs):
+    return sorted(os.path.basename(job.record_path)[:-len(".json")] for job in jobs)
+
+def test_phase_changes():
+    """Only patients whose operation or treatment phase changes today are found"""
+    fields = app.patient_fields(RECORDS["crosses_operation_phase"])
+    changes = phase_scheduler.phase_changes(fields, today)
+    print(f"   Changes: {changes}")
+    assert changes == [("operation_phase", "first 2 weeks after surgery", "weeks 3-6 after surgery")]
+    assert phase_scheduler.phase_changes(app.patient_fields(RECORDS["same_phase"]), today) == []
+    assert phase_scheduler.phase_changes(app.patient_fields(RECORDS["no_dates"]), today) == []
+    print("✅ Phase boundary crossings are found from the dates")
+
+def test_dry_run_plans_without_calls():
+    """A dry run lists the patients, tokens and cost, and makes no AI calls"""
+    print("🗓️  Testing precompute planning...")
+    fake = testkit.FakeCompletions("Precomputed advice")
+    with testkit.patched(fake), tempfile.TemporaryDirectory() as directory:
+        write_records(directory)
+        jobs = phase_scheduler.plan(directory, today, ("patient", "carer"))
+        phase_scheduler.print_plan(jobs, today)
+    assert planned_names(jobs) == ["crosses_operation_phase", "treatment_starts_today"]
+    assert all(job.prompt_tokens > 0 and job.completion_tokens == 2 * app.ASSESSMENT_MAX_TOKENS for job in jobs)
+    totals = phase_scheduler.workload(jobs, "gpt-4")
+    assert totals["patients"] == 2 and totals["estimated_cost"] > 0
+    assert len(fake.calls) == 0
+
+    # Planning another day finds that day's crossings instead
+    with tempfile.TemporaryDirectory() as directory:
+        write_records(directory)
+        assert planned_names(phase_scheduler.plan(directory, today + timedelta(days=1))) == ["treatment_starts_today"]
+    print("✅ Dry run shows the workload without calling the model")
+
+def test_token_budget_defers_the_rest():
+    """Jobs past the token budget are deferred, in order"""
+    jobs = [phase_scheduler.Job(f"p{n}.json", [], 400, 600) for n in range(5)]
+    run, deferred = phase_scheduler.within_budget(jobs, 2500)
+    assert len(run) == 2 and len(deferred) == 3
+    assert phase_scheduler.within_budget(jobs, 0) == (jobs, [])
+    print("✅ Token budget caps each run")
+
+def test_run_precomputes_advice():
+    """A run regenerates advice for today's crossings only, with a bounded pool"""
+    fake = testkit.FakeCompletions("Precomputed advice")
+    with tempfile.TemporaryDirectory() as directory:
+        write_records(directory)
+        with testkit.patched(fake, store=patient_store.PatientStore(directory), RESPONSE_CACHE_ENABLED=False):
+            summary = phase_scheduler.run(directory, ("patient", "carer"), workers=2, rpm=0, budget=0, log=lambda message: None)
+        advice_files = sorted(name for name in os.listdir(directory) if name.endswith(app.ADVICE_FILE_SUFFIX))
+    print(f"   Summary: {summary}")
+    assert summary["patients"] == 2 and summary["succeeded"] == 2 and summary["deferred"] == 0
+    assert len(fake.calls) == 4
+    assert advice_files == ["crosses_operation_phase.advice.json", "treatment_starts_today.advice.json"]
+    print("✅ Advice is precomputed for patients changing phase")
+
+def test_schedulers_share_each_days_run():
+    """Schedulers on the same records (one per app process, say) run each day's precompute once"""
+    fake = testkit.FakeCompletions("Precomputed advice")
+    options = dict(personas=("patient",), workers=1, rpm=0, budget=0)
+    with tempfile.TemporaryDirectory() as directory:
+        write_records(directory)
+        with testkit.patched(fake, store=patient_store.PatientStore(directory), RESPONSE_CACHE_ENABLED=False):
+            first = phase_scheduler.DailyScheduler(data_dir=directory, **options).run_once()
+            second = phase_scheduler.DailyScheduler(data_dir=directory, **options).run_once()
+            calls = len(fake.calls)
+            tomorrow = phase_scheduler.DailyScheduler(data_dir=directory, **options).run_once(today + timedelta(days=1))
+    assert first["succeeded"] == 2
+    assert second is None and calls == 2
+    assert tomorrow is not None
+    print("✅ Only one scheduler runs each day's precompute")
+
+def test_serve_needs_a_disk_cache():
+    """The sidecar refuses to start when its cache wouldn't be shared with the app"""
+    argv = sys.argv
+    sys.argv = ["phase_scheduler.py", "--serve"]
+    try:
+        with testkit.patched(advice_cache=response_cache.ResponseCache()):
+            phase_scheduler.main()
+        assert False, "expected --serve to refuse to start"
+    except SystemExit as e:
+        assert e.code == 2
+    finally:
+        sys.argv = argv
+    print("✅ --serve needs RESPONSE_CACHE_PATH")
+
+def test_next_run():
+    """The scheduler runs at the next occurrence of its time of day"""
+    assert phase_scheduler.next_run("02:00", datetime(2025, 3, 1, 1, 30)) == datetime(2025, 3, 1, 2, 0)
+    assert phase_scheduler.next_run("02:00", datetime(2025, 3, 1, 2, 0)) == datetime(2025, 3, 2, 2, 0)
+    print("✅ Daily run time is worked out")
+
+if __name__ == "__main__":
+    test_phase_changes()
+    test_dry_run_plans_without_calls()
+    test_token_budget_defers_the_rest()
+    test_run_precomputes_advice()
+    test_schedulers_share_each_days_run()
+    test_serve_needs_a_disk_cache()
+    test_next_run()
+    print("\n🎉 Phase precompute tests complete!")
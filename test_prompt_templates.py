@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Test script for the versioned prompt templates
+"""
+
+import json
+import os
+import tempfile
+
+import app
+import prompts
+from patient_record import PatientRecord
+
+sample_patient = (
+    "Female",
+    81,
+    "Stroke",
+    "Thrombectomy",
+    "2024-05-02",
+    "Speech therapy and physiotherapy",
+    "2024-05-04",
+)
+
+def all_views(version):
+    """Messages for every view of one version"""
+    record = PatientRecord(*sample_patient)
+    fields = record.form_fields()
+    return {
+        view: prompts.build_messages(view, fields, "Can she drink thin liquids?" if view in prompts.QUESTION_VIEWS else None, record.timeline, version)
+        for view in prompts.VIEWS
+    }
+
+def test_v2_prefix_is_shared_by_every_view():
+    """All six views start with the same bytes, and only the suffix differs"""
+    views = all_views("v2")
+    system = {messages[0]["content"] for messages in views.values()}
+    prefixes = {messages[1]["content"].split("\n\n")[0] for messages in views.values()}
+    assert len(system) == 1 and len(prefixes) == 1
+    assert prompts.compiled["v2"].shares_prefix()
+    assert not prompts.compiled["v1"].shares_prefix()
+    assert "Can she drink thin liquids?" in views["carer_question"][1]["content"]
+    print(f"✅ One prefix of {len(next(iter(system))) + len(next(iter(prefixes)))} characters is shared by all views")
+
+def test_prefix_is_rendered_once_per_patient():
+    """Building more views for the same patient reuses the rendered prefix"""
+    all_views("v2")
+    before = prompts.prefix_cache_stats()
+    all_views("v2")
+    after = prompts.prefix_cache_stats()
+    assert after["hits"] - before["hits"] == len(prompts.VIEWS)
+    assert after["misses"] == before["misses"]
+    print("✅ The prefix is rendered once and reused")
+
+def test_v1_keeps_the_original_layout():
+    """v1 reproduces the original prompts, one system message per view"""
+    messages = prompts.patient_focused_messages(*sample_patient, version="v1")
+    assert messages[0]["content"].startswith("You are an experienced senior nurse speaking directly to patients.")
+    assert messages[1]["content"].startswith("\nYou are an experienced senior nurse speaking directly to a patient.")
+    assert "- Operation: Thrombectomy\n" in messages[1]["content"]
+    if not os.getenv("PROMPT_VERSION") and not prompts.PROMPT_AB_SPLIT:
+        assert prompts.choose_version("any-patient") == "v1"
+        assert prompts.patient_focused_messages(*sample_patient) == messages
+    print("✅ v1 matches the original prompts and is the default")
+
+def test_templates_load_from_file_and_are_checked():
+    """Extra versions come from JSON, and unknown fields are rejected when loading"""
+    spec = {"v3": {"system": "Nurse.", "context": prompts.PATIENT_INFORMATION,
+                   "views": {view: {"instructions": "\nAnswer: {question}\n" if view in prompts.QUESTION_VIEWS else "\nAdvise.\n"} for view in prompts.VIEWS}}}
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "templates.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(spec, f)
+        prompts.load_templates(path)
+        try:
+            messages = prompts.carer_question_messages(*sample_patient, "Is she safe alone?", version="v3")
+            assert messages[0]["content"] == "Nurse."
+            assert messages[1]["content"].endswith("Answer: Is she safe alone?\n")
+
+            spec["v3"]["views"]["nursing"]["instructions"] = "\nAdvise about {medication}.\n"
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(spec, f)
+            try:
+                prompts.load_templates(path)
+            except ValueError as e:
+                print(f"   Rejected: {e}")
+            else:
+                raise AssertionError("Unknown template fields should be rejected")
+        finally:
+            prompts.TEMPLATES.pop("v3", None)
+            prompts.compiled.pop("v3", None)
+    print("✅ Template files are loaded and checked")
+
+def test_ab_split_is_stable_per_patient():
+    """Each patient always lands on the same version, and the version is part of the cache key"""
+    original = prompts.PROMPT_AB_SPLIT
+    prompts.PROMPT_AB_SPLIT = prompts.parse_split("v2=1,v1=1")
+    try:
+        keys = [f"patient-{n}" for n in range(200)]
+        versions = [prompts.choose_version(key) for key in keys]
+        assert versions == [prompts.choose_version(key) for key in keys]
+        assert 60 < versions.count("v1") < 140
+        print(f"   v1: {versions.count('v1')}, v2: {versions.count('v2')}")
+
+        record = PatientRecord(*sample_patient)
+        cache_keys = {}
+        for version in ("v1", "v2"):
+            prompts.PROMPT_AB_SPLIT = prompts.parse_split(f"{version}=1")
+            cache_keys[version] = app._cache_key("nursing", sample_patient, 1500, record)
+    finally:
+        prompts.PROMPT_AB_SPLIT = original
+    assert cache_keys["v1"] != cache_keys["v2"]
+    print("✅ A/B split is stable per patient")
+
+if __name__ == "__main__":
+    test_v2_prefix_is_shared_by_every_view()
+    test_prefix_is_rendered_once_per_patient()
+    test_v1_keeps_the_original_layout()
+    test_templates_load_from_file_and_are_checked()
+    test_ab_split_is_stable_per_patient()
+    print("\n🎉 Prompt template tests complete!")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Test script for the Gradio queue lanes and limits
+"""
+
+import os
+
+import app
+import testkit
+import ui
+
+AI_EVENTS = ("submit", "patient_advice", "patient_question", "carer_advice", "carer_question")
+LOCAL_EVENTS = ("save", "load", "search_saved_files", "clear_form")
+
+def _events():
+    """Each event's (concurrency ID, limit), keyed by API name"""
+    return {fn.api_name: (fn.concurrency_id, fn.concurrency_limit) for fn in app.app.fns.values()}
+
+def test_env_limits(monkeypatch):
+    """Limits come from the environment, with "none" meaning no limit"""
+    monkeypatch.setenv("TEST_QUEUE_LIMIT", "3")
+    assert ui._env_limit("TEST_QUEUE_LIMIT", 8) == 3
+    monkeypatch.setenv("TEST_QUEUE_LIMIT", "none")
+    assert ui._env_limit("TEST_QUEUE_LIMIT", 8) is None
+    monkeypatch.delenv("TEST_QUEUE_LIMIT")
+    assert ui._env_limit("TEST_QUEUE_LIMIT", 8) == 8
+    print("✅ Queue limits are read from the environment")
+
+def test_each_ai_event_has_its_own_lane():
+    """AI events each get their own concurrency ID; quick local events share one"""
+    print("🚦 Checking queue lanes...")
+    events = _events()
+    for name, (concurrency_id, limit) in sorted(events.items()):
+        print(f"   {name:<17} lane={concurrency_id:<17} limit={limit}")
+
+    assert set(events) == set(AI_EVENTS + LOCAL_EVENTS)
+    ai_lanes = {events[name][0] for name in AI_EVENTS}
+    assert len(ai_lanes) == len(AI_EVENTS)
+    assert all(events[name] == (events[name][0], ui.LLM_CONCURRENCY_LIMIT) for name in AI_EVENTS)
+    assert {events[name] for name in LOCAL_EVENTS} == {("local", ui.LOCAL_CONCURRENCY_LIMIT)}
+    if not os.getenv("LLM_CONCURRENCY_LIMIT"):
+        assert ui.LLM_CONCURRENCY_LIMIT == (16 if app.ASYNC_HANDLERS else 4)
+    assert not ai_lanes & {"local"}
+    print("✅ Saves and loads never queue behind AI calls")
+
+def test_queue_is_bounded():
+    """The queue has a maximum size so overload gets a busy reply instead of a long wait"""
+    assert app.app._queue.max_size == ui.QUEUE_MAX_SIZE
+    assert ui.QUEUE_MAX_SIZE and ui.QUEUE_MAX_SIZE > 0
+    print(f"✅ Queue holds at most {ui.QUEUE_MAX_SIZE} waiting requests")
+
+if __name__ == "__main__":
+    with testkit.environment() as environment:
+        test_env_limits(environment)
+    test_each_ai_event_has_its_own_lane()
+    test_queue_is_bounded()
+    print("\n🎉 Queue configuration tests complete!")
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Test script for the shared requests/tokens per minute rate limiter
+"""
+
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+import app
+import rate_limiter
+import testkit
+
+sample_patient = (
+    "Male",
+    72,
+    "Knee replacement surgery",
+    "Total knee arthroplasty (left knee)",
+    "2024-01-15",
+    "Physical therapy twice weekly",
+    "2024-01-17",
+)
+
+def make_limiter(directory, **limits):
+    return rate_limiter.RateLimiter(os.path.join(directory, "rate_limit.sqlite3"), poll_interval=0.02, **limits)
+
+def test_disabled_limiter_is_free():
+    """With no limits set, acquiring never waits or touches the disk"""
+    with tempfile.TemporaryDirectory() as directory:
+        limiter = make_limiter(directory)
+        assert not limiter.enabled
+        assert limiter.acquire(10**6) == 0.0
+        assert not os.listdir(directory)
+        print("✅ Disabled limiter admits everything")
+
+def test_token_budget_is_enforced():
+    """Once the minute's tokens are spent, the next call waits for the bucket to refill"""
+    print("🪣 Testing the tokens per minute bucket...")
+    with tempfile.TemporaryDirectory() as directory:
+        limiter = make_limiter(directory, tokens_per_minute=6000)
+        assert limiter.acquire(6000) < 0.5
+        waited = limiter.acquire(100)
+        print(f"   Waited {waited:.2f}s for 100 tokens at 100 tokens/s")
+        assert 0.7 < waited < 3
+        assert limiter.stats()["admitted"] == 2
+        print("✅ Token budget holds callers back until it refills")
+
+def test_requests_per_minute_and_timeout():
+    """The request bucket limits calls, and a caller that can't be admitted in time gives up"""
+    with tempfile.TemporaryDirectory() as directory:
+        limiter = make_limiter(directory, requests_per_minute=2)
+        limiter.acquire()
+        limiter.acquire()
+        try:
+            limiter.acquire(timeout=0.3)
+            assert False, "expected a timeout"
+        except rate_limiter.RateLimitTimeout:
+            pass
+        assert limiter.stats()["waiting"] == 0
+        print("✅ Requests per minute are limited and timeouts leave the queue")
+
+def test_priority_order():
+    """Interactive callers are admitted before batch callers that queued earlier"""
+    print("🚦 Testing priority admission...")
+    with tempfile.TemporaryDirectory() as directory:
+        limiter = make_limiter(directory, tokens_per_minute=6000)
+        limiter.acquire(6000)
+        admitted = []
+
+        def caller(name, priority):
+            with rate_limiter.use_priority(priority):
+                limiter.acquire(30)
+            admitted.append(name)
+
+        threads = [threading.Thread(target=caller, args=(f"batch-{i}", rate_limiter.PRIORITY_BATCH)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)
+        interactive = threading.Thread(target=caller, args=("interactive", rate_limiter.PRIORITY_INTERACTIVE))
+        interactive.start()
+        for thread in threads + [interactive]:
+            thread.join(timeout=10)
+        print(f"   Admission order: {admitted}")
+        assert admitted == ["interactive", "batch-0", "batch-1"]
+        print("✅ Higher priority callers go first, FIFO within a priority")
+
+def _spend(path, calls, tokens):
+    limiter = rate_limiter.RateLimiter(path, tokens_per_minute=60000, poll_interval=0.02)
+    for _ in range(calls):
+        limiter.acquire(tokens)
+
+def test_budget_is_shared_between_processes():
+    """Separate processes draw from the same bucket"""
+    print("🔀 Testing the bucket across processes...")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "rate_limit.sqlite3")
+        rate_limiter.RateLimiter(path, tokens_per_minute=60000).acquire(60000)
+        started = time.monotonic()
+        workers = [multiprocessing.Process(target=_spend, args=(path, 2, 500)) for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(timeout=30)
+        elapsed = time.monotonic() - started
+        print(f"   2 processes x 2 calls x 500 tokens at 1000 tokens/s took {elapsed:.2f}s")
+        assert all(worker.exitcode == 0 for worker in workers)
+        assert elapsed > 1.7
+        print("✅ Processes share one quota")
+
+def test_app_calls_pass_through_limiter():
+    """Advice calls take a request and their estimated tokens from the shared quota"""
+    print("🔌 Testing the limiter in the advice calls...")
+    fake = testkit.FakeCompletions("Keep the knee moving.")
+    with tempfile.TemporaryDirectory() as directory:
+        with testkit.patched(fake, rate_limit=make_limiter(directory, requests_per_minute=600, tokens_per_minute=600000)):
+            advice = app.get_nursing_advice(*sample_patient, use_cache=False)
+            stats = app.rate_limit.stats()
+
+    assert advice == "Keep the knee moving."
+    cost = rate_limiter.estimate_request_tokens(fake.calls[0]["messages"], fake.calls[0]["max_tokens"])
+    print(f"   Estimated cost {cost} tokens, {stats['tokens_available']} left")
+    assert stats["admitted"] == 1
+    assert cost > app.ASSESSMENT_MAX_TOKENS
+    assert stats["tokens_available"] < 600000 - cost + 1000
+    print("✅ Advice calls are admitted by the rate limiter")
+
+if __name__ == "__main__":
+    test_disabled_limiter_is_free()
+    test_token_budget_is_enforced()
+    test_requests_per_minute_and_timeout()
+    test_priority_order()
+    test_budget_is_shared_between_processes()
+    test_app_calls_pass_through_limiter()
+    print("\n🎉 Rate limiter tests complete!")
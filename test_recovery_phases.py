@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test script for the recovery phase timeline engine
+"""
+
+from datetime import date, timedelta
+
+import app
+import recovery_phases
+
+today = date(2025, 9, 5)
+
+def days_ago(days):
+    return (today - timedelta(days=days)).strftime("%Y-%m-%d")
+
+def test_diagnosis_families():
+    """Diagnosis text picks the matching family"""
+    assert recovery_phases.diagnosis_family("Hip replacement surgery") == "orthopaedic"
+    assert recovery_phases.diagnosis_family("Breast cancer - grade 2 hormonal") == "cancer"
+    assert recovery_phases.diagnosis_family("Angina", "Coronary artery bypass") == "cardiac"
+    assert recovery_phases.diagnosis_family("Appendicitis") == "default"
+    print("✅ Diagnosis families detected")
+
+def test_keywords_match_whole_words():
+    """Keywords inside longer words don't pick a family"""
+    assert recovery_phases.diagnosis_family("Persistent cough") == "default"
+    assert recovery_phases.diagnosis_family("Heartburn", "Upper endoscopy") == "default"
+    assert recovery_phases.diagnosis_family("Chipped tooth", "Dental crown") == "default"
+    assert recovery_phases.diagnosis_family("Kneecap bruising") == "default"
+    assert recovery_phases.diagnosis_family("Coronary artery disease", "Two stents fitted") == "cardiac"
+    assert recovery_phases.diagnosis_family("Fractured wrist") == "orthopaedic"
+    assert recovery_phases.diagnosis_family("Bowel cancer", "Chemotherapy") == "cancer"
+    print("✅ Keywords only match whole words")
+
+def test_phases_are_stable_within_a_bucket():
+    """Every day inside a phase gives the same timeline text"""
+    print("📅 Testing phase buckets...")
+    labels = {
+        recovery_phases.calculate_timeline("Appendicitis", "Appendectomy", days_ago(days), days_ago(days - 2), today=today)["operation_phase"]
+        for days in range(8, 43)
+    }
+    print(f"   Days 8-42: {labels}")
+    assert labels == {"weeks 2-6 after surgery"}
+
+    timeline = recovery_phases.calculate_timeline("Appendicitis", "Appendectomy", days_ago(43), days_ago(43), today=today)
+    assert timeline["operation_phase"] == "weeks 7-12 after surgery"
+    print("✅ Phases only change at their boundaries")
+
+def test_treatment_status_wording():
+    """Pre-treatment, starting today and ongoing are all described"""
+    future = recovery_phases.calculate_timeline("Hip replacement", "", days_ago(10), days_ago(-5), today=today)
+    starting = recovery_phases.calculate_timeline("Hip replacement", "", days_ago(7), days_ago(0), today=today)
+    ongoing = recovery_phases.calculate_timeline("Hip replacement", "", days_ago(15), days_ago(3), today=today)
+    print(f"   {future['treatment_status']} | {starting['treatment_status']} | {ongoing['treatment_status']}")
+    assert future["treatment_status"] == "Treatment starts within the next week (future)"
+    assert starting["treatment_status"] == "Treatment starts today"
+    assert ongoing["treatment_status"] == "Treatment ongoing (first 3 days of treatment)"
+    assert future["operation_phase"] == "first 2 weeks after surgery"
+    print("✅ Treatment status wording is correct")
+
+def test_family_boundaries_can_be_configured():
+    """Per-family boundaries change where phases start"""
+    original = dict(recovery_phases.PHASE_BOUNDARIES)
+    try:
+        recovery_phases.PHASE_BOUNDARIES["orthopaedic"] = [(10, "early recovery")]
+        assert recovery_phases.phase_for_days(9, "orthopaedic") == "early recovery"
+        assert recovery_phases.phase_for_days(11, "orthopaedic") == "over a year"
+        assert recovery_phases.phase_for_days(9, "default") == "weeks 2-6"
+    finally:
+        recovery_phases.PHASE_BOUNDARIES.clear()
+        recovery_phases.PHASE_BOUNDARIES.update(original)
+    print("✅ Phase boundaries are configurable per family")
+
+def test_cache_key_survives_day_rollover():
+    """The same patient keeps its cache key from one day to the next within a phase"""
+    patient = ("Female", 54, "Appendicitis", "Appendectomy", days_ago(20), "Antibiotics", days_ago(18))
+    original_calculate = recovery_phases.calculate_timeline
+    keys = []
+    try:
+        for offset in range(3):
+            recovery_phases.calculate_timeline = lambda *args, offset=offset: original_calculate(*args, today=today + timedelta(days=offset))
+            keys.append(app._cache_key("carer_advice", patient, 1500))
+    finally:
+        recovery_phases.calculate_timeline = original_calculate
+    assert len(set(keys)) == 1
+    print("✅ Cache key is stable across days in the same phase")
+
+if __name__ == "__main__":
+    test_diagnosis_families()
+    test_keywords_match_whole_words()
+    test_phases_are_stable_within_a_bucket()
+    test_treatment_status_wording()
+    test_family_boundaries_can_be_configured()
+    test_cache_key_survives_day_rollover()
+    print("\n🎉 Recovery phase tests complete!")
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Test script for retries, deadlines, circuit breaking and hedging of AI calls
+"""
+
+import asyncio
+import time
+
+from openai import OpenAI
+
+import app
+import mock_openai_server
+import resilience
+import testkit
+from testkit import sample_patient
+
+class UpstreamError(Exception):
+    """Looks like an openai status error"""
+
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+def flaky(failures, result="ok"):
+    """A call that fails with the given status codes before succeeding"""
+    calls = []
+
+    def call(timeout):
+        calls.append(timeout)
+        if len(calls) <= len(failures):
+            raise UpstreamError(failures[len(calls) - 1])
+        return result
+    return call, calls
+
+def quick(**settings):
+    settings.setdefault("base_delay", 0.01)
+    return resilience.Resilience(**settings)
+
+def test_retries_rate_limits_and_server_errors():
+    """429 and 5xx responses are retried with backoff until one succeeds"""
+    print("🔁 Testing retries...")
+    policy = quick(max_retries=3)
+    call, calls = flaky([429, 503])
+    assert policy.call(call) == "ok"
+    assert len(calls) == 3
+    assert policy.stats()["retries"] == 2
+
+    call, calls = flaky([400])
+    try:
+        policy.call(call)
+        assert False, "a bad request should not be retried"
+    except UpstreamError:
+        pass
+    assert len(calls) == 1
+    print("✅ Transient errors are retried, others are not")
+
+def test_deadline_covers_all_attempts():
+    """A call gives up once its deadline has passed, even with retries left"""
+    policy = quick(max_retries=10, deadline=0.3, base_delay=0.2, max_delay=0.2)
+
+    def slow_failure(timeout):
+        assert timeout <= 0.3
+        time.sleep(0.1)
+        raise UpstreamError(500)
+
+    started = time.monotonic()
+    try:
+        policy.call(slow_failure)
+        assert False, "expected the deadline to be exceeded"
+    except (resilience.DeadlineExceeded, UpstreamError):
+        pass
+    assert time.monotonic() - started < 0.6
+    print("✅ Deadlines bound the total time of a call")
+
+def test_circuit_breaker_fails_fast_then_recovers():
+    """After repeated failures calls fail without reaching upstream, then a trial call closes the breaker"""
+    print("⚡ Testing the circuit breaker...")
+    breaker = resilience.CircuitBreaker(failure_threshold=3, reset_seconds=0.2)
+    policy = quick(max_retries=0, breaker=breaker)
+    call, calls = flaky([500] * 3)
+    for _ in range(3):
+        try:
+            policy.call(call)
+        except UpstreamError:
+            pass
+    assert breaker.stats()["state"] == "open"
+
+    try:
+        policy.call(call)
+        assert False, "expected the breaker to reject the call"
+    except resilience.CircuitOpenError:
+        pass
+    assert len(calls) == 3
+
+    time.sleep(0.25)
+    assert policy.call(call) == "ok"
+    assert breaker.stats() == {"state": "closed", "consecutive_failures": 0, "opened": 1, "rejected": 1}
+    print("✅ The breaker opens, fails fast and closes again")
+
+def test_streams_retry_only_before_first_chunk():
+    """A stream that fails before any text is retried; one that fails midway is not"""
+    policy = quick(max_retries=2)
+    opened = []
+
+    def open_stream(timeout):
+        opened.append(timeout)
+        if len(opened) == 1:
+            raise UpstreamError(502)
+
+        def chunks():
+            yield "a"
+            yield "b"
+            if len(opened) == 2:
+                raise RuntimeError("connection dropped")
+        return chunks()
+
+    received = []
+    try:
+        for chunk in policy.stream(open_stream):
+            received.append(chunk)
+        assert False, "expected the midway failure to surface"
+    except RuntimeError:
+        pass
+    assert received == ["a", "b"] and len(opened) == 2
+    print("✅ Streams are only retried before their first chunk")
+
+def test_hedged_request_wins_when_first_is_slow():
+    """A slow attempt gets a hedged twin and the faster answer is used"""
+    print("🏇 Testing hedged requests...")
+    policy = quick(hedge=True, hedge_min_delay=0.05, hedge_min_samples=5)
+    for _ in range(5):
+        policy._record_latency(0.05)
+    starts = []
+
+    def call(timeout):
+        starts.append(time.monotonic())
+        if len(starts) == 1:
+            time.sleep(1.0)
+            return "slow"
+        return "fast"
+
+    started = time.monotonic()
+    assert policy.call(call) == "fast"
+    assert time.monotonic() - started < 0.5
+    assert policy.stats()["hedges"] == 1 and policy.stats()["hedge_wins"] == 1
+
+    async def acall():
+        attempts = []
+
+        async def slow_then_fast(timeout):
+            attempts.append(timeout)
+            if len(attempts) == 1:
+                await asyncio.sleep(1.0)
+                return "slow"
+            return "fast"
+        return await policy.acall(slow_then_fast)
+
+    assert asyncio.run(acall()) == "fast"
+    print("✅ Hedged requests cut tail latency")
+
+def test_app_survives_flaky_upstream():
+    """With half the upstream requests failing, advice still comes back"""
+    print("🏥 Testing the app against a flaky mock server...")
+    server = mock_openai_server.serve_in_background(
+        mock_openai_server.MockConfig(error_rate=0.5, response_words=20, seed=7)
+    )
+    client = OpenAI(api_key="mock", base_url=server.base_url, max_retries=0)
+    upstream = quick(max_retries=6, breaker=resilience.CircuitBreaker(failure_threshold=50))
+    try:
+        with testkit.patched(client=client, upstream=upstream):
+            for age in range(60, 66):
+                patient = sample_patient[:1] + (age,) + sample_patient[2:]
+                advice = app.get_patient_focused_advice(*patient, use_cache=False)
+                assert not advice.startswith("❌"), advice
+            streamed = list(app.stream_carer_focused_advice(*sample_patient, use_cache=False))
+            assert not streamed[-1].startswith("❌")
+        stats = upstream.stats()
+    finally:
+        server.shutdown()
+
+    print(f"   {stats['attempts']} attempts for {stats['calls']} calls, {stats['retries']} retries")
+    assert stats["retries"] > 0 and server.state.stats()["errors"] == stats["retries"]
+    print("✅ Advice is delivered despite upstream errors")
+
+if __name__ == "__main__":
+    test_retries_rate_limits_and_server_errors()
+    test_deadline_covers_all_attempts()
+    test_circuit_breaker_fails_fast_then_recovers()
+    test_streams_retry_only_before_first_chunk()
+    test_hedged_request_wins_when_first_is_slow()
+    test_app_survives_flaky_upstream()
+    print("\n🎉 Resilience tests complete!")
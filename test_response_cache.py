@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Test script for the advice response cache
+"""
+
+import asyncio
+import os
+import tempfile
+import threading
+
+import app
+import response_cache
+import testkit
+
+sample_patient = (
+    "Female",
+    54,
+    "Breast cancer - grade 2 hormonal",
+    "Removed 21mm tumor from left breast",
+    "2025-07-05",
+    "Chemo followed by radiotherapy",
+    "2025-10-01",
+)
+
+def test_keys_ignore_trivial_differences():
+    """Case and whitespace changes should map to the same key"""
+    a = response_cache.normalize_patient(*sample_patient)
+    b = response_cache.normalize_patient("female ", "54", "Breast  cancer - grade 2 HORMONAL", *sample_patient[3:])
+    assert response_cache.make_key("carer_advice", a, None, "gpt-4", 1500, 0.7) == \
+        response_cache.make_key("carer_advice", b, None, "gpt-4", 1500, 0.7)
+    assert response_cache.make_key("carer_advice", a, None, "gpt-4", 1500, 0.7) != \
+        response_cache.make_key("patient_advice", a, None, "gpt-4", 1500, 0.7)
+    assert response_cache.make_key("carer_question", a, "Can she shower?", "gpt-4", 1200, 0.7) != \
+        response_cache.make_key("carer_question", a, "Can she drive?", "gpt-4", 1200, 0.7)
+    print("✅ Cache keys are normalized")
+
+def test_lru_eviction_and_ttl():
+    """The memory tier keeps the most recently used entries and drops expired ones"""
+    cache = response_cache.ResponseCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    assert cache.get("a") == "A"
+    cache.set("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+
+    expired = response_cache.ResponseCache(ttl_seconds=0)
+    expired.set("a", "A")
+    assert expired.get("a") is None
+    print("✅ LRU eviction and TTL work")
+
+def test_disk_tier_survives_restart():
+    """A new cache pointed at the same file sees earlier replies"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cache", "responses.sqlite3")
+        first = response_cache.ResponseCache(disk_path=path, max_disk_entries=2)
+        first.set("a", "A")
+        first.set("b", "B")
+        first.set("c", "C")
+
+        second = response_cache.ResponseCache(disk_path=path)
+        assert second.get("c") == "C"
+        assert second.get("a") is None
+        print("✅ Disk cache survives a restart and is size limited")
+
+def test_disk_reads_leave_memory_hits_alone():
+    """A slow read of the cache file doesn't hold up lookups served from memory"""
+    with tempfile.TemporaryDirectory() as directory:
+        cache = response_cache.ResponseCache(disk_path=os.path.join(directory, "responses.sqlite3"))
+        cache.set("a", "A")
+        reading, release = threading.Event(), threading.Event()
+        read_disk = cache._read_disk
+
+        def slow_read(key, now):
+            reading.set()
+            release.wait(5)
+            return read_disk(key, now)
+
+        cache._read_disk = slow_read
+        missed = []
+        reader = threading.Thread(target=lambda: missed.append(cache.get("b")))
+        reader.start()
+        try:
+            assert reading.wait(5)
+            assert cache.get("a") == "A"
+        finally:
+            release.set()
+            reader.join(5)
+        assert missed == [None]
+    print("✅ Memory hits don't wait for disk reads")
+
+def test_async_lookups_read_disk_off_the_loop():
+    """Async handlers read a disk-backed cache in a worker thread, not on the event loop"""
+    with tempfile.TemporaryDirectory() as directory:
+        cache = response_cache.ResponseCache(disk_path=os.path.join(directory, "responses.sqlite3"))
+        readers = []
+        read_disk = cache._read_disk
+
+        def tracked_read(key, now):
+            readers.append(threading.current_thread())
+            return read_disk(key, now)
+
+        cache._read_disk = tracked_read
+        fake = testkit.AsyncFakeCompletions("Advice #{number}")
+        with testkit.patched(fake, advice_cache=cache):
+            first = asyncio.run(app.aget_carer_focused_advice(*sample_patient))
+            cache._memory.clear()
+            second = asyncio.run(app.aget_carer_focused_advice(*sample_patient))
+
+    assert first == second == "Advice #1"
+    assert len(fake.calls) == 1
+    assert readers and threading.main_thread() not in readers
+    print("✅ Async lookups read the disk cache off the event loop")
+
+def test_app_reuses_cached_advice():
+    """The second identical request is served from cache unless bypassed"""
+    fake = testkit.FakeCompletions("Advice #{number}")
+    with testkit.patched(fake):
+        first = app.get_carer_focused_advice(*sample_patient)
+        second = app.get_carer_focused_advice(*sample_patient)
+        streamed = list(app.stream_carer_focused_advice(*sample_patient))
+        bypassed = app.get_carer_focused_advice(*sample_patient, use_cache=False)
+
+    assert first == second == "Advice #1"
+    assert streamed == ["Advice #1"]
+    assert bypassed == "Advice #2"
+    assert len(fake.calls) == 2
+    print(f"✅ Cached advice reused: {app.advice_cache.stats()}")
+
+if __name__ == "__main__":
+    test_keys_ignore_trivial_differences()
+    test_lru_eviction_and_ttl()
+    test_disk_tier_survives_restart()
+    test_disk_reads_leave_memory_hits_alone()
+    test_async_lookups_read_disk_off_the_loop()
+    test_app_reuses_cached_advice()
+    print("\n🎉 Response cache tests complete!")
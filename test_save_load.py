@@ -52,7 +52,7 @@ def test_save_load_functionality():
         print(f"✅ Save Result: {status}")
         
         # Check if file was created
-        filepath = os.path.join("saved_data", f"{filename}.json")
+        filepath = os.path.join(app.get_store().data_dir, f"{filename}.json")
         if os.path.exists(filepath):
             print(f"✅ File created successfully: {filepath}")
             
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Test script for the similarity cache on patient and carer questions
+"""
+
+import time
+
+import app
+import semantic_cache
+import testkit
+from testkit import sample_patient
+
+def test_reworded_questions_match():
+    """Different wordings of the same question share an answer"""
+    cache = semantic_cache.SemanticQuestionCache(threshold=0.8)
+    cache.add("patient-1", "Can she shower yet?", "Showering advice")
+    cache.add("patient-1", "Can she drive yet?", "Driving advice")
+
+    match = cache.lookup("patient-1", "When can she have a shower")
+    print(f"   Match: {match}")
+    assert match and match[0] == "Showering advice"
+    assert cache.lookup("patient-1", "Is she allowed to climb stairs?") is None
+    print("✅ Reworded questions reuse earlier answers")
+
+def test_scopes_are_kept_apart():
+    """A question about one patient never answers another patient's question"""
+    cache = semantic_cache.SemanticQuestionCache(threshold=0.8)
+    cache.add("patient-1", "Can she shower yet?", "Showering advice")
+    assert cache.lookup("patient-2", "Can she shower yet?") is None
+    print("✅ Answers are scoped to the patient context")
+
+def test_threshold_and_stats():
+    """The threshold is tunable and hits/misses are counted"""
+    strict = semantic_cache.SemanticQuestionCache(threshold=1.01)
+    strict.add("p", "Can she shower yet?", "Showering advice")
+    assert strict.lookup("p", "Can she shower yet?") is None
+
+    cache = semantic_cache.SemanticQuestionCache(threshold=0.8)
+    cache.add("p", "Can she shower yet?", "Showering advice")
+    cache.lookup("p", "when can she shower")
+    cache.lookup("p", "what should she eat")
+    stats = cache.stats()
+    print(f"   Stats: {stats}")
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["questions"] == 1
+    print("✅ Threshold and statistics work")
+
+def test_lookup_is_fast():
+    """Looking up among a full scope takes milliseconds"""
+    cache = semantic_cache.SemanticQuestionCache(threshold=0.8, max_per_scope=200)
+    for i in range(200):
+        cache.add("p", f"question number {i} about wound dressing and medication {i * 7}", f"answer {i}")
+    start = time.perf_counter()
+    cache.lookup("p", "how often should the wound dressing be changed")
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"   Lookup over 200 questions: {elapsed_ms:.2f} ms")
+    assert elapsed_ms < 100
+    print("✅ Lookups are fast")
+
+def test_app_answers_reworded_question_from_cache():
+    """The carer Q&A reuses an answer for a reworded question"""
+    fake = testkit.FakeCompletions("Answer #{number}")
+    with testkit.patched(fake):
+        first = app.get_carer_question_answer(*sample_patient, "Can she shower yet?")
+        second = app.get_carer_question_answer(*sample_patient, "When can she have a shower?")
+        other = app.get_carer_question_answer(*sample_patient, "Can she drive yet?")
+
+    assert first == "Answer #1"
+    assert second.endswith("Answer #1") and "Can she shower yet?" in second
+    assert other == "Answer #2"
+    assert len(fake.calls) == 2
+    print("✅ Reworded carer question answered from cache")
+
+if __name__ == "__main__":
+    test_reworded_questions_match()
+    test_scopes_are_kept_apart()
+    test_threshold_and_stats()
+    test_lookup_is_fast()
+    test_app_answers_reworded_question_from_cache()
+    print("\n🎉 Semantic cache tests complete!")
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Test script for coalescing identical concurrent advice requests
+"""
+
+import asyncio
+import threading
+import time
+
+import app
+import single_flight
+import testkit
+from testkit import sample_patient
+
+def slow_tokens(tokens, delay=0.02):
+    """Generator function that yields growing text slowly, like a model stream"""
+    def produce():
+        text = ""
+        for token in tokens:
+            time.sleep(delay)
+            text += token
+            yield text
+    return produce
+
+def test_threads_share_one_stream():
+    """Concurrent threads with the same key see the same partial text from one run"""
+    print("🔗 Testing threaded coalescing...")
+    flights = single_flight.SingleFlight()
+    runs = []
+    results = [None] * 5
+
+    def produce():
+        runs.append(1)
+        yield from slow_tokens(["Rest ", "and ", "hydrate."])()
+
+    def caller(i):
+        results[i] = list(flights.stream("same-prompt", produce))
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(5)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.005)
+    for thread in threads:
+        thread.join()
+
+    print(f"   Upstream runs: {len(runs)}, stats: {flights.stats()}")
+    assert len(runs) == 1
+    assert all(result[-1] == "Rest and hydrate." for result in results)
+    assert flights.stats() == {"upstream": 1, "coalesced": 4, "in_flight": 0}
+    print("✅ One upstream run served every caller")
+
+def test_errors_reach_every_caller():
+    """A failure in the shared run is raised in every waiting caller"""
+    flights = single_flight.SingleFlight()
+    errors = []
+
+    def produce():
+        time.sleep(0.05)
+        raise RuntimeError("rate limited")
+        yield
+
+    def caller():
+        try:
+            flights.call("same-prompt", lambda: next(produce()))
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=caller) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == ["rate limited"] * 3
+    print("✅ Errors are shared with every caller")
+
+def test_async_callers_share_one_request():
+    """Concurrent async handlers coalesce onto one streamed request"""
+    flights = single_flight.AsyncSingleFlight()
+    runs = []
+
+    async def produce():
+        runs.append(1)
+        text = ""
+        for token in ["Ice ", "the ", "knee."]:
+            await asyncio.sleep(0.01)
+            text += token
+            yield text
+
+    async def caller():
+        return [text async for text in flights.stream("same-prompt", produce)]
+
+    async def run_all():
+        return await asyncio.gather(*[caller() for _ in range(10)])
+
+    results = asyncio.run(run_all())
+    assert len(runs) == 1
+    assert all(result[-1] == "Ice the knee." for result in results)
+    assert results[0] == ["Ice ", "Ice the ", "Ice the knee."]
+    print("✅ Async callers share one streamed request")
+
+def test_followers_take_over_from_a_cancelled_leader():
+    """When the leader's caller goes away, a follower runs the request again for everyone still waiting"""
+    flights = single_flight.SingleFlight()
+    runs = []
+    release = threading.Event()
+
+    def produce():
+        runs.append(1)
+        yield "Rest "
+        release.wait(5)
+        yield "Rest and hydrate."
+
+    leader = flights.stream("same-prompt", produce)
+    assert next(leader) == "Rest "
+    results = []
+    followers = [threading.Thread(target=lambda: results.append(list(flights.stream("same-prompt", produce)))) for _ in range(2)]
+    for thread in followers:
+        thread.start()
+    time.sleep(0.05)
+    leader.close()
+    time.sleep(0.05)  # both followers are back, one running the request and one following it
+    release.set()
+    for thread in followers:
+        thread.join()
+
+    assert len(runs) == 2
+    assert [result[-1] for result in results] == ["Rest and hydrate."] * 2
+    print("✅ A cancelled leader hands the request to a follower")
+
+def test_async_followers_take_over_from_a_cancelled_leader():
+    """Async followers also carry on when the leader's caller goes away"""
+    flights = single_flight.AsyncSingleFlight()
+    runs = []
+
+    async def run_all():
+        release = asyncio.Event()
+
+        async def produce():
+            runs.append(1)
+            yield "Rest "
+            await release.wait()
+            yield "Rest and hydrate."
+
+        async def follower():
+            return [text async for text in flights.stream("same-prompt", produce)]
+
+        leader = flights.stream("same-prompt", produce)
+        assert await leader.__anext__() == "Rest "
+        tasks = [asyncio.ensure_future(follower()) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        await leader.aclose()
+        await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    results = asyncio.run(run_all())
+    assert len(runs) == 2
+    assert [result[-1] for result in results] == ["Rest and hydrate."] * 2
+    print("✅ Async followers carry on after a cancelled leader")
+
+def test_double_click_makes_one_upstream_call():
+    """Two identical blocking advice requests at once send only one request"""
+    fake = testkit.FakeCompletions("Shared advice", delay=0.1)
+    results = []
+    with testkit.patched(fake):
+        threads = [
+            threading.Thread(target=lambda: results.append(app.get_patient_focused_advice(*sample_patient, use_cache=False)))
+            for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert results == ["Shared advice", "Shared advice"]
+    assert len(fake.calls) == 1
+    print("✅ Double click makes one upstream call")
+
+if __name__ == "__main__":
+    test_threads_share_one_stream()
+    test_errors_reach_every_caller()
+    test_async_callers_share_one_request()
+    test_followers_take_over_from_a_cancelled_leader()
+    test_async_followers_take_over_from_a_cancelled_leader()
+    test_double_click_makes_one_upstream_call()
+    print("\n🎉 Single-flight tests complete!")
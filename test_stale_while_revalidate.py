@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Test script for serving saved advice at once and refreshing it in the background
+"""
+
+import asyncio
+import time
+from datetime import date, timedelta
+
+import advice_sections
+import app
+import testkit
+from testkit import asked_sections
+
+today = date.today()
+
+sample_patient = (
+    "Male",
+    66,
+    "Knee osteoarthritis",
+    "Total knee replacement",
+    (today - timedelta(days=12)).isoformat(),
+    "Physiotherapy, anticoagulants",
+    (today - timedelta(days=10)).isoformat(),
+)
+
+def numbered():
+    """Numbers each reply; for section prompts, writes whichever sections are asked for"""
+    return testkit.sections_reply("{key} v{number}", "Advice v{number}")
+
+def backdate(days):
+    """Make everything in the response cache look `days` old"""
+    with app.advice_cache._lock:
+        for key, (value, created_at) in list(app.advice_cache._memory.items()):
+            app.advice_cache._memory[key] = (value, created_at - days * 86400)
+
+def wait_for_refreshes():
+    deadline = time.time() + 5
+    while app._revalidating and time.time() < deadline:
+        time.sleep(0.01)
+    assert not app._revalidating
+
+def stale_after_a_day(fake, sections=False):
+    """Stale-while-revalidate on, with a one-day window and a fake client"""
+    return testkit.patched(fake, STALE_WHILE_REVALIDATE=True, RESPONSE_CACHE_ENABLED=True, STALE_AFTER_SECONDS=86400,
+                           STALE_AFTER_SECTION={}, SECTION_CACHE_ENABLED=sections)
+
+def test_windows():
+    """Per-section windows override the default, and warning signs never get one"""
+    windows = advice_sections.stale_windows(86400, advice_sections.parse_windows("recovery_timeline=3600"))
+    assert windows["recovery_timeline"] == 3600
+    assert windows["caring_guidance"] == 86400
+    assert "warning_signs" not in windows
+    for text in ("bedside_manner=60", "warning_signs=60"):
+        try:
+            advice_sections.parse_windows(text)
+        except ValueError as e:
+            print(f"   Rejected: {e}")
+        else:
+            raise AssertionError(f"{text} should be rejected")
+    assert app._format_age(3 * 86400 + 5) == "3 days" and app._format_age(3600) == "1 hour"
+    print("✅ Staleness windows are configurable per section")
+
+def test_fresh_reply_is_served_from_cache():
+    """Advice inside its window comes straight from the cache with no refresh"""
+    fake = testkit.FakeCompletions(numbered())
+    with stale_after_a_day(fake):
+        first = app.get_patient_focused_advice(*sample_patient)
+        second = app.get_patient_focused_advice(*sample_patient)
+    assert first == second == "Advice v1"
+    assert len(fake.calls) == 1
+    print("✅ Fresh saved advice is served as it is")
+
+def test_stale_reply_is_served_and_refreshed_in_background():
+    """Old advice comes back at once, marked with its age, and the next visit gets the new text"""
+    print("🕒 Testing stale-while-revalidate...")
+    fake = testkit.FakeCompletions(numbered())
+    with stale_after_a_day(fake):
+        app.get_patient_focused_advice(*sample_patient)
+        backdate(3)
+        stale = app.get_patient_focused_advice(*sample_patient)
+        wait_for_refreshes()
+        refreshed = app.get_patient_focused_advice(*sample_patient)
+
+    print(f"   Stale: {stale.splitlines()[0]}")
+    assert "3 days ago" in stale and stale.endswith("Advice v1")
+    assert refreshed == "Advice v2"
+    assert len(fake.calls) == 2
+    print("✅ Stale advice was shown at once and refreshed for next time")
+
+def test_stream_swaps_in_new_text():
+    """Streaming shows the stale advice first, then swaps in the refreshed reply"""
+    with stale_after_a_day(testkit.FakeCompletions(numbered())):
+        app.get_carer_focused_advice(*sample_patient)
+        backdate(2)
+        updates = list(app.stream_carer_focused_advice(*sample_patient))
+
+    assert len(updates) == 2
+    assert "2 days ago" in updates[0] and updates[0].endswith("Advice v1")
+    assert updates[-1] == "Advice v2"
+    print("✅ Streamed stale advice is replaced when the new reply is ready")
+
+def test_failed_refresh_keeps_stale_text():
+    """If the refresh fails, the saved advice stays on show with a notice"""
+    fake = testkit.FakeCompletions(numbered())
+    with stale_after_a_day(fake):
+        app.get_carer_focused_advice(*sample_patient)
+        backdate(2)
+        fake.error = ConnectionError("upstream unavailable")
+        updates = list(app.stream_carer_focused_advice(*sample_patient))
+
+    assert "couldn't be refreshed" in updates[-1] and updates[-1].endswith("Advice v1")
+    print("✅ Failed refreshes keep the saved advice")
+
+def test_async_stale_reply():
+    """Async handlers serve stale advice too and refresh it in a task"""
+    async def run():
+        await app.aget_patient_focused_advice(*sample_patient)
+        backdate(4)
+        stale = await app.aget_patient_focused_advice(*sample_patient)
+        await asyncio.gather(*app._revalidation_tasks)
+        return stale, await app.aget_patient_focused_advice(*sample_patient)
+
+    with stale_after_a_day(testkit.AsyncFakeCompletions(numbered())):
+        stale, refreshed = asyncio.run(run())
+    assert "4 days ago" in stale
+    assert refreshed == "Advice v2"
+    print("✅ Async handlers refresh stale advice in the background")
+
+def test_warning_signs_always_refreshed():
+    """With section caching, fresh sections are shown at once and the warning signs are generated again first"""
+    fake = testkit.FakeCompletions(numbered())
+    with stale_after_a_day(fake, sections=True):
+        app.get_nursing_advice(*sample_patient)
+        updates = list(app.stream_nursing_advice(*sample_patient))
+        blocking = app.get_nursing_advice(*sample_patient)
+
+    assert len(fake.calls) == 3
+    assert asked_sections(fake.calls[1]["messages"][-1]["content"]) == ["warning_signs"]
+    assert not updates[0].startswith("🕒") and "warning_signs" not in advice_sections.split(updates[0])
+    final = advice_sections.split(updates[-1])
+    assert final["warning_signs"] == "warning_signs v2"
+    assert final["caring_guidance"] == "caring_guidance v1"
+    assert advice_sections.split(blocking)["warning_signs"] == "warning_signs v3"
+    print("✅ Warning signs are regenerated every time, other sections only when stale")
+
+def test_stale_sections_are_refreshed_in_background():
+    """Stale sections are shown with their age while a background request refreshes them"""
+    fake = testkit.FakeCompletions(numbered())
+    with stale_after_a_day(fake, sections=True):
+        app.STALE_AFTER_SECTION = {"recovery_timeline": 3600}
+        app.get_nursing_advice(*sample_patient)
+        backdate(1 / 12)
+        updates = list(app.stream_nursing_advice(*sample_patient))
+        wait_for_refreshes()
+        refreshed = app.get_nursing_advice(*sample_patient)
+
+    asked = sorted(asked_sections(call["messages"][-1]["content"]) for call in fake.calls[1:3])
+    assert asked == [["recovery_timeline"], ["warning_signs"]]
+    assert updates[0].startswith("🕒 Showing saved advice from 2 hours ago")
+    assert "warning_signs" not in advice_sections.split(updates[0])
+    assert updates[-1].startswith("🕒") and "warning_signs" in advice_sections.split(updates[-1])
+    sections = advice_sections.split(refreshed)
+    assert not refreshed.startswith("🕒")
+    assert sections["recovery_timeline"] != "recovery_timeline v1" and sections["caring_guidance"] == "caring_guidance v1"
+    assert len(fake.calls) == 4
+    print("✅ Stale sections are refreshed in the background")
+
+def test_async_stale_sections_are_refreshed_in_background():
+    """Async handlers refresh stale sections in a task while the warning signs are generated"""
+    async def run():
+        await app.aget_nursing_advice(*sample_patient)
+        backdate(1 / 12)
+        stale = await app.aget_nursing_advice(*sample_patient)
+        await asyncio.gather(*app._revalidation_tasks)
+        return stale, await app.aget_nursing_advice(*sample_patient)
+
+    fake = testkit.AsyncFakeCompletions(numbered())
+    with stale_after_a_day(fake, sections=True):
+        app.STALE_AFTER_SECTION = {"recovery_timeline": 3600}
+        stale, refreshed = asyncio.run(run())
+
+    assert stale.startswith("🕒") and advice_sections.split(stale)["recovery_timeline"] == "recovery_timeline v1"
+    assert not refreshed.startswith("🕒") and advice_sections.split(refreshed)["recovery_timeline"] != "recovery_timeline v1"
+    print("✅ Async handlers refresh stale sections in the background")
+
+def test_stale_nursing_reply_is_regenerated_first():
+    """Without section caching, a stale general nursing reply isn't shown: its warning signs are out of date"""
+    fake = testkit.FakeCompletions(numbered())
+    with stale_after_a_day(fake):
+        app.get_nursing_advice(*sample_patient)
+        fresh = app.get_nursing_advice(*sample_patient)
+        backdate(2)
+        regenerated = app.get_nursing_advice(*sample_patient)
+
+    assert not regenerated.startswith("🕒")
+    assert "v1" in fresh and "v2" in regenerated and "v1" not in regenerated
+    assert len(fake.calls) == 2
+    print("✅ Stale nursing advice is regenerated before it is shown")
+
+if __name__ == "__main__":
+    test_windows()
+    test_fresh_reply_is_served_from_cache()
+    test_stale_reply_is_served_and_refreshed_in_background()
+    test_stream_swaps_in_new_text()
+    test_failed_refresh_keeps_stale_text()
+    test_async_stale_reply()
+    test_warning_signs_always_refreshed()
+    test_stale_sections_are_refreshed_in_background()
+    test_async_stale_sections_are_refreshed_in_background()
+    test_stale_nursing_reply_is_regenerated_first()
+    print("\n🎉 Stale-while-revalidate tests complete!")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test script for fast startup: a light core import and a lazily built UI
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+import app
+import prompts
+import startup_benchmark
+
+sample_patient = (
+    "Male",
+    70,
+    "Hip fracture",
+    "Hemiarthroplasty (left hip)",
+    "2024-03-01",
+    "Walking frame, physiotherapy daily",
+    "2024-03-02",
+)
+
+def test_core_import_skips_gradio_and_openai():
+    """Importing app doesn't load gradio, openai or httpx"""
+    print("⏱️  Measuring cold imports...")
+    results = startup_benchmark.run_benchmark(runs=1)
+    startup_benchmark.print_report(results)
+    assert results["core"]["loaded"] == []
+    assert "gradio" in results["ui"]["loaded"]
+    assert results["core"]["median"] < results["ui"]["median"]
+    print("✅ The core imports without the UI or the OpenAI client")
+
+def test_prompts_build_without_client():
+    """Prompt builders work on their own"""
+    messages = prompts.carer_question_messages(*sample_patient, "Can he climb stairs yet?")
+    assert messages[0]["role"] == "system"
+    assert "Can he climb stairs yet?" in messages[1]["content"]
+    assert "Hemiarthroplasty (left hip)" in prompts.nursing_advice_messages(*sample_patient)[1]["content"]
+    print("✅ Prompts build without the OpenAI client")
+
+def test_client_is_created_on_first_use():
+    """get_client() creates the client once and keeps any client already set"""
+    original = app.client
+    try:
+        app.client = None
+        created = app.get_client()
+        assert created is app.get_client() is app.client
+        fake = object()
+        app.client = fake
+        assert app.get_client() is fake
+    finally:
+        app.client = original
+    print("✅ The OpenAI client is created lazily")
+
+def test_store_is_opened_on_first_use():
+    """Importing app leaves the patient folder alone until get_store() is called"""
+    with tempfile.TemporaryDirectory() as directory:
+        data_dir = os.path.join(directory, "saved_data")
+        code = ("import os, app; assert app.store is None; assert not os.path.exists(os.environ['PATIENT_DATA_DIR']); "
+                "assert app.get_store() is app.get_store() is app.store; assert os.path.isdir(os.environ['PATIENT_DATA_DIR'])")
+        env = dict(os.environ, PATIENT_DATA_DIR=data_dir)
+        subprocess.run([sys.executable, "-c", code], env=env, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    print("✅ The patient store is opened lazily")
+
+def test_ui_is_still_reachable_from_app():
+    """app.app and the form handlers still work for existing callers"""
+    import gradio as gr
+    assert isinstance(app.app, gr.Blocks)
+    assert app.app is app.app
+    assert app.clear_form()[0] is None
+    print("✅ app.app builds the interface on first use")
+
+if __name__ == "__main__":
+    test_core_import_skips_gradio_and_openai()
+    test_prompts_build_without_client()
+    test_client_is_created_on_first_use()
+    test_store_is_opened_on_first_use()
+    test_ui_is_still_reachable_from_app()
+    print("\n🎉 Startup tests complete!")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Test script for streaming AI replies into the Gradio outputs
+"""
+
+import app
+import testkit
+from testkit import sample_patient
+
+class DroppedStream(testkit.FakeCompletions):
+    """Streams two words of the reply, then loses the connection"""
+
+    def chunks(self, text):
+        for i, chunk in enumerate(super().chunks(text)):
+            if i == 2:
+                raise RuntimeError("connection dropped")
+            yield chunk
+
+def test_streaming_yields_growing_text():
+    """Each yield should contain everything received so far"""
+    print("🌊 Testing streamed patient advice...")
+    fake = testkit.FakeCompletions("Rest and hydrate.")
+    with testkit.patched(fake):
+        updates = list(app.stream_patient_focused_advice(*sample_patient))
+
+    print(f"   Updates: {updates}")
+    assert updates == ["Rest ", "Rest and ", "Rest and hydrate."]
+    assert fake.calls[0]["stream"] is True
+    assert fake.calls[0]["max_tokens"] == 1500
+    print("✅ Streaming yields partial text as tokens arrive")
+
+def test_streaming_reports_errors():
+    """A dropped stream keeps the partial text and appends the error"""
+    print("🌊 Testing streamed carer answer with a failure...")
+    with testkit.patched(DroppedStream("Check the wound.")):
+        updates = list(app.stream_carer_question_answer(*sample_patient, "How do I check the wound?"))
+
+    print(f"   Last update: {updates[-1]!r}")
+    assert updates[-1].startswith("Check the \n\n❌ Error getting carer answer: connection dropped")
+    print("✅ Streaming errors are reported")
+
+def test_invalid_date_is_reported_when_streaming():
+    """Bad dates surface as an error message rather than an exception"""
+    bad_patient = sample_patient[:4] + ("not-a-date",) + sample_patient[5:]
+    updates = list(app.stream_nursing_advice(*bad_patient))
+    assert len(updates) == 1
+    assert updates[0].startswith("❌ Error getting AI advice:")
+    print("✅ Prompt errors are reported by the stream")
+
+def test_blocking_mode_returns_full_text():
+    """The get_* functions still return the whole reply in one go"""
+    fake = testkit.FakeCompletions("Rest and hydrate.")
+    with testkit.patched(fake):
+        advice = app.get_carer_focused_advice(*sample_patient)
+
+    assert advice == "Rest and hydrate."
+    assert "stream" not in fake.calls[0]
+    print("✅ Blocking mode returns the full reply")
+
+if __name__ == "__main__":
+    test_streaming_yields_growing_text()
+    test_streaming_reports_errors()
+    test_invalid_date_is_reported_when_streaming()
+    test_blocking_mode_returns_full_text()
+    print("\n🎉 Streaming tests complete!")
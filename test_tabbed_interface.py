@@ -3,20 +3,17 @@
 Test script demonstrating the new tabbed interface functionality
 """
 
-import os
-from dotenv import load_dotenv
-from openai import OpenAI
 from datetime import datetime, date
 
-# Load environment variables
-load_dotenv()
-
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+import testkit
 
 def test_tabbed_interface():
     """Test the new tabbed interface with sample data"""
-    
+    # Canned replies, so the demo never reaches a real endpoint
+    with testkit.patched(testkit.FakeCompletions("Rest, keep the knee moving gently and follow the physiotherapy plan.")):
+        show_tabbed_interface()
+
+def show_tabbed_interface():
     print("🏥 Tabbed Interface Test")
     print("=" * 50)
     
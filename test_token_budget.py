@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test script for prompt token budgets and dynamic max_tokens
+"""
+
+import app
+import testkit
+import token_budget
+from testkit import sample_patient
+
+discharge_letter = (
+    "Discharge summary. Patient admitted for elective right total hip arthroplasty. "
+    + "Observations stable throughout the stay and mobilising with a frame. " * 300
+    + "Follow up in fracture clinic in six weeks."
+)
+
+def test_short_text_is_left_alone():
+    """Text inside its budget only has its whitespace tidied"""
+    assert token_budget.trim_text("Hip  replacement \n\n  surgery ", 300) == "Hip replacement\nsurgery"
+    assert token_budget.trim_text(None, 10) is None
+    print("✅ Short text is unchanged")
+
+def test_long_text_keeps_start_and_end():
+    """An oversized field is cut to budget, keeping its opening and closing sentences"""
+    print("✂️  Testing trimming of a pasted discharge letter...")
+    trimmed = token_budget.trim_text(discharge_letter, 300)
+    tokens = token_budget.count_tokens(trimmed)
+    print(f"   {token_budget.count_tokens(discharge_letter)} tokens -> {tokens} tokens")
+    assert tokens <= 300
+    assert trimmed.startswith("Discharge summary.")
+    assert trimmed.endswith("Follow up in fracture clinic in six weeks.")
+    assert token_budget.TRIM_MARKER in trimmed
+
+    one_long_sentence = "word " * 5000
+    assert token_budget.count_tokens(token_budget.trim_text(one_long_sentence, 100)) <= 100
+    print("✅ Oversized fields are trimmed to budget")
+
+def test_completion_budget_respects_context_window():
+    """max_tokens shrinks when the prompt leaves less room, but never below the minimum"""
+    assert token_budget.context_window("gpt-4") == 8192
+    assert token_budget.context_window("gpt-4o-mini") == 128000
+    assert token_budget.completion_budget(1500, 1000, "gpt-4") == 1500
+    assert token_budget.completion_budget(1500, 7500, "gpt-4") == 8192 - 7500 - 16
+    assert token_budget.completion_budget(1500, 9000, "gpt-4") == token_budget.MIN_COMPLETION_TOKENS
+    print("✅ max_tokens fits the context window")
+
+def test_app_trims_prompt_and_sizes_replies():
+    """Advice calls send a bounded prompt, short answers for questions and log usage"""
+    print("📏 Testing token budgets in the advice calls...")
+    fake = testkit.FakeCompletions("Keep the wound dry.")
+    with testkit.patched(fake):
+        patient = sample_patient[:5] + (discharge_letter,) + sample_patient[6:]
+        app.get_nursing_advice(*patient, use_cache=False)
+        app.get_carer_question_answer(*sample_patient, "Can she shower yet?", use_cache=False)
+        usage = app.token_usage.stats()
+
+    assessment, answer = fake.calls
+    prompt_tokens = token_budget.count_message_tokens(assessment["messages"])
+    print(f"   Assessment prompt: {prompt_tokens} tokens, max_tokens {assessment['max_tokens']}")
+    assert prompt_tokens < token_budget.count_tokens(discharge_letter) // 4
+    assert assessment["max_tokens"] == app.ASSESSMENT_MAX_TOKENS
+    assert answer["max_tokens"] == app.ANSWER_MAX_TOKENS < app.ASSESSMENT_MAX_TOKENS
+
+    assert usage["nursing"]["calls"] == 1 and usage["nursing"]["prompt_tokens"] > 0
+    assert usage["carer_question"]["completion_tokens"] == token_budget.count_tokens("Keep the wound dry.")
+    print("✅ Prompts are bounded and token usage is recorded")
+
+if __name__ == "__main__":
+    test_short_text_is_left_alone()
+    test_long_text_keeps_start_and_end()
+    test_completion_budget_respects_context_window()
+    test_app_trims_prompt_and_sizes_replies()
+    print("\n🎉 Token budget tests complete!")
@@ -3,16 +3,12 @@
 Test script demonstrating the fixed treatment timeline logic
 """
 
-import os
-from dotenv import load_dotenv
-from openai import OpenAI
 from datetime import datetime, date, timedelta
 
-# Load environment variables
-load_dotenv()
+import testkit
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# A canned client, so the demo never reaches a real endpoint
+client = testkit.fake_client(testkit.FakeCompletions("Focus on the current phase: rest, gentle movement and watching the wound."))
 
 def test_treatment_timeline():
     """Test the treatment timeline logic with different scenarios"""
@@ -0,0 +1,196 @@
+"""
+Fake OpenAI completions and app state helpers shared by the test scripts
+
+The tests run both as scripts (python test_x.py) and under pytest, so nothing here
+needs pytest: conftest.py applies clean_settings() and reset_state() around every
+test, and each test swaps in its fake and settings with patched(). Tests that change
+environment variables take pytest's monkeypatch fixture, and get environment() in its
+place when run as scripts.
+"""
+
+import asyncio
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import advice_sections
+import app
+import rate_limiter
+
+# The hip replacement patient most of the advice tests use
+sample_patient = (
+    "Female",
+    65,
+    "Hip replacement surgery",
+    "Total hip arthroplasty (right hip) due to severe osteoarthritis",
+    "2024-01-10",
+    "Physical therapy 3x weekly, pain management with prescribed medications",
+    "2024-01-12",
+)
+
+def completion(text, usage=None):
+    """A non-streamed reply as the OpenAI client returns it"""
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=usage)
+
+class FakeCompletions:
+    """
+    Stands in for client.chat.completions and remembers each request in `calls`.
+    `reply` is a format string given the call number, or a function of the request
+    and call number; streamed replies come back a word at a time. Set `error` to make
+    calls fail, and `delay` to hold each call open (`max_active` counts the overlap).
+    """
+
+    def __init__(self, reply="Advice from call {number}", delay=0, usage=None, error=None):
+        self.reply = reply
+        self.delay = delay
+        self.usage = usage
+        self.error = error
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        number = self._start(kwargs)
+        try:
+            time.sleep(self.delay)
+        finally:
+            self._finish()
+        return self._respond(kwargs, number)
+
+    def chunks(self, text):
+        """The streamed reply, one word per chunk"""
+        for word in re.findall(r"\S+\s*", text):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))])
+
+    def _start(self, kwargs):
+        with self._lock:
+            self.calls.append(kwargs)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            return len(self.calls)
+
+    def _finish(self):
+        with self._lock:
+            self.active -= 1
+
+    def _respond(self, kwargs, number):
+        if self.error is not None:
+            raise self.error
+        text = self.reply(kwargs, number) if callable(self.reply) else self.reply.format(number=number)
+        if kwargs.get("stream"):
+            return self.chunks(text)
+        return completion(text, self.usage)
+
+class AsyncFakeCompletions(FakeCompletions):
+    """The same fake for async_client; delays wait on the event loop so calls overlap"""
+
+    async def create(self, **kwargs):
+        number = self._start(kwargs)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self._finish()
+        response = self._respond(kwargs, number)
+        return self._astream(response) if kwargs.get("stream") else response
+
+    async def _astream(self, chunks):
+        for chunk in chunks:
+            yield chunk
+
+def asked_sections(prompt):
+    """Keys of the nursing advice sections a prompt asks for, in order"""
+    return [section.key for section in advice_sections.SECTIONS if f"**{section.heading}**: {section.guidance}" in prompt]
+
+def sections_reply(section="{key} from call {number}", other="Advice from call {number}"):
+    """A reply writing whichever nursing advice sections the prompt asks for, or `other` for any other prompt"""
+    def reply(kwargs, number):
+        keys = asked_sections(kwargs["messages"][-1]["content"])
+        if not keys:
+            return other.format(number=number)
+        asked = [item for item in advice_sections.SECTIONS if item.key in keys]
+        return "\n\n".join(f"{n}. **{item.heading}**: {section.format(key=item.key, number=number)}"
+                           for n, item in enumerate(asked, 1))
+    return reply
+
+def fake_client(completions):
+    return SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+def offline_error():
+    return ConnectionError("tests never reach a real endpoint; patch in a fake client")
+
+def clean_settings():
+    """
+    The app settings every test starts from: clients that fail instead of calling a
+    real endpoint, and no shared rate limit
+    """
+    return {
+        "client": fake_client(FakeCompletions(error=offline_error())),
+        "async_client": fake_client(AsyncFakeCompletions(error=offline_error())),
+        "rate_limit": rate_limiter.RateLimiter(""),
+    }
+
+def reset_state():
+    """Close the circuit breaker and empty the caches so no test sees another's replies"""
+    app.upstream.reset()
+    app.advice_cache.clear()
+    app.question_cache.clear()
+    app.token_usage.clear()
+
+@contextmanager
+def patched(fake=None, **settings):
+    """
+    Run with clean app state, `fake` as both the sync and async completions and any
+    other app attributes set, then put everything back
+    """
+    changes = clean_settings()
+    if fake is not None:
+        changes["client"] = changes["async_client"] = fake_client(fake)
+    changes.update(settings)
+    original = {name: getattr(app, name) for name in changes}
+    for name, value in changes.items():
+        setattr(app, name, value)
+    reset_state()
+    try:
+        yield fake
+    finally:
+        for name, value in original.items():
+            setattr(app, name, value)
+        reset_state()
+
+class Environment:
+    """The setenv/delenv half of pytest's monkeypatch, for running tests as scripts"""
+
+    def __init__(self):
+        self._original = {}
+
+    def setenv(self, name, value):
+        self._original.setdefault(name, os.environ.get(name))
+        os.environ[name] = str(value)
+
+    def delenv(self, name, raising=True):
+        self._original.setdefault(name, os.environ.get(name))
+        if name in os.environ:
+            del os.environ[name]
+        elif raising:
+            raise KeyError(name)
+
+    def undo(self):
+        for name, value in self._original.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        self._original.clear()
+
+@contextmanager
+def environment():
+    """An Environment whose changes are undone on exit"""
+    changes = Environment()
+    try:
+        yield changes
+    finally:
+        changes.undo()
@@ -0,0 +1,174 @@
+"""
+Token budgets for advice prompts
+
+Counts prompt tokens locally before each call, trims oversized free-text
+fields (a pasted discharge letter, say) down to a configurable budget, and
+sizes max_tokens per call type so the prompt and reply always fit in the
+model's context window. Prompt and completion token counts are logged and
+totalled per persona.
+
+Counting uses tiktoken when it is installed and a characters-per-token
+estimate otherwise.
+"""
+
+import logging
+import math
+import os
+import re
+import threading
+
+try:
+    import tiktoken
+except ImportError:  # fall back to an estimate of about four characters per token
+    tiktoken = None
+
+logger = logging.getLogger("carer.tokens")
+
+# Context window of each model family (longest matching prefix wins)
+CONTEXT_WINDOWS = {
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4-1106": 128000,
+    "gpt-4-0125": 128000,
+    "gpt-4o": 128000,
+    "gpt-3.5-turbo": 16385,
+}
+DEFAULT_CONTEXT_WINDOW = int(os.getenv("MODEL_CONTEXT_TOKENS", "8192"))
+
+# Reply length per call type: full assessments get room, questions get short answers,
+# and the combined reply holds three assessments' worth of advice
+COMPLETION_TOKENS = {
+    "assessment": int(os.getenv("MAX_TOKENS_ASSESSMENT", "1500")),
+    "answer": int(os.getenv("MAX_TOKENS_ANSWER", "600")),
+    "combined": int(os.getenv("MAX_TOKENS_COMBINED", "3500")),
+}
+MIN_COMPLETION_TOKENS = 64
+
+# Budget for each free-text form field and for a typed question
+FIELD_TOKENS = int(os.getenv("PROMPT_FIELD_TOKENS", "300"))
+QUESTION_TOKENS = int(os.getenv("PROMPT_QUESTION_TOKENS", "200"))
+
+# Positions of the free-text fields in the advice functions' arguments
+FREE_TEXT_FIELDS = (2, 3, 5)
+QUESTION_FIELD = 7
+
+TRIM_MARKER = " [...] "
+
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?;])\s+|\n+")
+_encodings = {}
+
+def _encoding(model):
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("cl100k_base")
+    return _encodings[model]
+
+def count_tokens(text, model="gpt-4"):
+    """Number of tokens in a piece of text"""
+    if not text:
+        return 0
+    if tiktoken is None:
+        return math.ceil(len(text) / 4)
+    return len(_encoding(model).encode(text))
+
+def count_message_tokens(messages, model="gpt-4"):
+    """
+    Prompt tokens for a list of chat messages, including the per-message overhead
+    """
+    return sum(count_tokens(message.get("content", ""), model) + 4 for message in messages) + 3
+
+def context_window(model):
+    """Context window for a model name"""
+    matches = [name for name in CONTEXT_WINDOWS if model.startswith(name)]
+    return CONTEXT_WINDOWS[max(matches, key=len)] if matches else DEFAULT_CONTEXT_WINDOW
+
+def completion_budget(max_tokens, prompt_tokens, model="gpt-4"):
+    """
+    max_tokens for a call: the configured value, reduced if the prompt leaves less room
+    """
+    room = context_window(model) - prompt_tokens - 16
+    return max(MIN_COMPLETION_TOKENS, min(max_tokens, room))
+
+def _truncate(text, max_tokens, model):
+    """Cut text to at most max_tokens tokens"""
+    if tiktoken is None:
+        return text[:max_tokens * 4]
+    encoding = _encoding(model)
+    return encoding.decode(encoding.encode(text)[:max_tokens])
+
+def trim_text(text, max_tokens, model="gpt-4"):
+    """
+    Shrink text to fit in max_tokens
+
+    Whitespace is tidied first. If it is still too long, whole sentences are kept
+    from the start (about two thirds of the budget) and the end, with a marker
+    where the middle was left out.
+    """
+    if not isinstance(text, str):
+        return text
+    text = re.sub(r"[ \t]+", " ", text)
+    text = re.sub(r"\s*\n\s*", "\n", text).strip()
+    if count_tokens(text, model) <= max_tokens:
+        return text
+
+    sentences = [sentence for sentence in _SENTENCE_BREAK.split(text) if sentence.strip()]
+    budget = max_tokens - count_tokens(TRIM_MARKER, model)
+    head, tail = [], []
+    used = 0
+    for sentence in sentences:
+        cost = count_tokens(sentence, model) + 1
+        if used + cost > budget * 2 // 3:
+            break
+        head.append(sentence)
+        used += cost
+    for sentence in reversed(sentences[len(head):]):
+        cost = count_tokens(sentence, model) + 1
+        if used + cost > budget:
+            break
+        tail.insert(0, sentence)
+        used += cost
+
+    if not head:
+        # The opening sentence alone is over budget: keep as much of it as fits
+        return _truncate(text, budget, model) + TRIM_MARKER.rstrip()
+    return " ".join(head) + TRIM_MARKER + " ".join(tail) if tail else " ".join(head) + TRIM_MARKER.rstrip()
+
+def fit_fields(patient_args, model="gpt-4"):
+    """
+    Trim the free-text fields (and question, if any) of an advice call's arguments to their budgets
+    """
+    fitted = list(patient_args)
+    for index in FREE_TEXT_FIELDS:
+        fitted[index] = trim_text(fitted[index], FIELD_TOKENS, model)
+    if len(fitted) > QUESTION_FIELD:
+        fitted[QUESTION_FIELD] = trim_text(fitted[QUESTION_FIELD], QUESTION_TOKENS, model)
+    return tuple(fitted)
+
+class TokenUsage:
+    """
+    Running totals of prompt and completion tokens per persona
+    """
+
+    def __init__(self):
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, persona, prompt_tokens, completion_tokens, max_tokens=None):
+        with self._lock:
+            totals = self._totals.setdefault(persona, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            totals["calls"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+        logger.info("%s: %d prompt + %d completion tokens (max_tokens %s)", persona, prompt_tokens, completion_tokens, max_tokens)
+
+    def stats(self):
+        """Totals per persona"""
+        with self._lock:
+            return {persona: dict(totals) for persona, totals in self._totals.items()}
+
+    def clear(self):
+        with self._lock:
+            self._totals.clear()
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+Gradio interface for the patient care system
+
+Importing gradio and building the Blocks tree is the slow part of startup, so
+it only happens here, when the app is launched or app.app is first used. The
+advice, caching and persistence logic the handlers call lives in app.py.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+from datetime import date
+
+import gradio as gr
+
+import app
+import metrics
+import patient_store
+import phase_scheduler
+
+def _env_limit(name, default):
+    """A limit from the environment: a number, or "none" for no limit"""
+    value = os.getenv(name, "").strip().lower()
+    if not value:
+        return default
+    return None if value == "none" else int(value)
+
+# Queue lanes. Each AI-backed event has its own concurrency ID, so a burst of one kind of
+# request can't starve the others; async handlers don't hold a worker thread, so they get a
+# wider lane, but still a bounded one. Save, load, search and clear share a separate lane and
+# never wait behind AI calls
+LLM_CONCURRENCY_LIMIT = _env_limit("LLM_CONCURRENCY_LIMIT", 16 if app.ASYNC_HANDLERS else 4)
+LOCAL_CONCURRENCY_LIMIT = _env_limit("LOCAL_CONCURRENCY_LIMIT", 8)
+
+# Requests waiting across all lanes; beyond this new ones get a "queue is full, try again" reply
+QUEUE_MAX_SIZE = _env_limit("QUEUE_MAX_SIZE", 200)
+
+def save_patient_form(gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, filename, record_versions):
+    """
+    Save from the form, checking against the version this session last loaded or saved
+
+    A file this session hasn't loaded or saved can only be created, never overwritten.
+    """
+    expected_version = (record_versions or {}).get(patient_store.normalize_filename(filename), 0) if filename else None
+    status, saved_files, saved_name, version = app._save_patient_record(
+        gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date,
+        filename, expected_version
+    )
+    if version is not None:
+        record_versions = dict(record_versions or {}, **{saved_name: version})
+    return status, gr.update(choices=saved_files), record_versions
+
+def load_patient_form(filename, record_versions):
+    """
+    Load into the form, bring back the patient's latest saved advice, and remember
+    which version of the record this session is editing
+    """
+    outputs, version = app._load_patient_record(filename)
+    advice = ("",) * len(app.HISTORY_VIEWS)
+    if version is not None:
+        record_versions = dict(record_versions or {}, **{patient_store.normalize_filename(filename): version})
+        advice = app.saved_advice(filename, *outputs[1:8])
+    return (*outputs, *advice, record_versions)
+
+def search_saved_files(search):
+    """Update the load dropdown with the files matching a search"""
+    return gr.update(choices=app.get_saved_files(search))
+
+def clear_form():
+    """Clear all form fields"""
+    return None, None, None, None, None, None, None, "", "", "", "", "", ""
+
+@functools.lru_cache(maxsize=None)
+def build_app():
+    """
+    Create the Gradio interface (once) and return it
+    """
+    # Gradio makes its queue locks while building and needs a current event loop for that,
+    # which the main thread no longer has once asyncio.run() has been used
+    try:
+        asyncio.get_event_loop()
+    except RuntimeError:
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+    with gr.Blocks(title="AI-Powered Patient Care System", theme=gr.themes.Soft()) as blocks:
+        gr.Markdown("# 🏥 AI-Powered Patient Care System")
+        gr.Markdown("Comprehensive patient care management with AI-powered nursing advice")
+    
+        # Create tabs
+        with gr.Tabs():
+        
+            # Tab 1: Patient Information & Save/Load
+            with gr.Tab("📋 Patient Info & Save/Load"):
+                gr.Markdown("## Patient Information Collection")
+                gr.Markdown("Enter patient details and manage saved data")
+            
+                with gr.Row():
+                    with gr.Column(scale=1):
+                        gender = gr.Dropdown(
+                            choices=["Male", "Female", "Other", "Prefer not to say"],
+                            label="Gender",
+                            info="Select patient's gender"
+                        )
+                    
+                        age = gr.Number(
+                            label="Age",
+                            info="Patient's age in years",
+                            minimum=0,
+                            maximum=150,
+                            step=1
+                        )
+                    
+                        diagnosis = gr.Textbox(
+                            label="Diagnosis",
+                            info="Primary medical diagnosis",
+                            placeholder="Enter the main diagnosis..."
+                        )
+                    
+                        operation_description = gr.Textbox(
+                            label="Operation Description",
+                            info="Description of the surgical procedure",
+                            placeholder="Describe the operation performed...",
+                            lines=3
+                        )
+                    
+                        operation_date = gr.Textbox(
+                            label="Operation Date",
+                            info="Date when the operation was performed (YYYY-MM-DD)",
+                            placeholder="2024-01-15",
+                            value=date.today().strftime("%Y-%m-%d")
+                        )
+                    
+                        treatment_details = gr.Textbox(
+                            label="Treatment Details",
+                            info="Details about ongoing treatment",
+                            placeholder="Describe the treatment plan...",
+                            lines=3
+                        )
+                    
+                        treatment_start_date = gr.Textbox(
+                            label="Treatment Start Date",
+                            info="Date when treatment began (YYYY-MM-DD)",
+                            placeholder="2024-01-15",
+                            value=date.today().strftime("%Y-%m-%d")
+                        )
+                
+                    with gr.Column(scale=1):
+                        gr.Markdown("## 💾 Save & Load Patient Data")
+                    
+                        with gr.Row():
+                            with gr.Column(scale=2):
+                                save_filename = gr.Textbox(
+                                    label="Save As",
+                                    info="Enter filename to save patient data",
+                                    placeholder="patient_john_doe",
+                                    lines=1
+                                )
+                                save_btn = gr.Button("💾 Save Patient Data", variant="secondary")
+                        
+                            with gr.Column(scale=2):
+                                load_search = gr.Textbox(
+                                    label="Find Patient",
+                                    info="Type the start of a filename or diagnosis",
+                                    placeholder="patient_j",
+                                    lines=1
+                                )
+                                load_file_dropdown = gr.Dropdown(
+                                    choices=app.get_saved_files(),
+                                    label="Load Patient Data",
+                                    info="Select a saved patient file to load",
+                                    value=None
+                                )
+                                load_btn = gr.Button("📂 Load Patient Data", variant="secondary")
+                    
+                        # Version of each record this session last loaded or saved, to catch conflicting saves
+                        record_versions = gr.State({})
+                    
+                        save_load_status = gr.Textbox(
+                            label="Save/Load Status",
+                            interactive=False,
+                            lines=2,
+                            placeholder="Save/load status will appear here..."
+                        )
+                    
+                        gr.Markdown("## 📊 Patient Record")
+                    
+                        json_output = gr.JSON(
+                            label="Patient Record (JSON)"
+                        )
+                    
+                        nursing_advice_output = gr.Textbox(
+                            label="AI Nursing Advice",
+                            interactive=False,
+                            lines=12,
+                            placeholder="General nursing advice will appear here after submitting patient information..."
+                        )
+                    
+                        # Advice generated in parallel on submit, picked up by the advice tabs
+                        advice_fan_out = gr.State(None)
+            
+                with gr.Row():
+                    submit_btn = gr.Button("Submit Patient Info", variant="primary", size="lg")
+                    clear_btn = gr.Button("Clear Form", variant="secondary")
+        
+            # Tab 2: Patient Advice
+            with gr.Tab("👤 Patient Advice"):
+                gr.Markdown("## AI-Powered Patient Guidance")
+                gr.Markdown("Get personalized advice and answers for the patient")
+            
+                with gr.Row():
+                    with gr.Column(scale=1):
+                        gr.Markdown("### 🤖 General Patient Advice")
+                    
+                        patient_advice_output = gr.Textbox(
+                            label="Patient-Focused Nursing Advice",
+                            interactive=False,
+                            lines=20,
+                            placeholder="Patient-focused advice will appear here after submitting patient information..."
+                        )
+                    
+                        get_patient_advice_btn = gr.Button("Get Patient Advice", variant="primary", size="lg")
+                
+                    with gr.Column(scale=1):
+                        gr.Markdown("### 💬 Patient Questions")
+                        gr.Markdown("Ask questions from the patient's perspective")
+                    
+                        patient_question = gr.Textbox(
+                            label="Patient's Question",
+                            info="Ask questions about recovery, what to expect, or concerns",
+                            placeholder="e.g., 'How long will my recovery take?', 'What can I do to help myself heal?', 'When can I return to normal activities?'",
+                            lines=3
+                        )
+                    
+                        ask_patient_question_btn = gr.Button("Ask AI Nurse (Patient View)", variant="primary", size="lg")
+                    
+                        patient_question_output = gr.Textbox(
+                            label="AI Nurse's Answer (Patient-Focused)",
+                            interactive=False,
+                            lines=15,
+                            placeholder="Patient-focused answers will appear here..."
+                        )
+        
+            # Tab 3: Carer Advice
+            with gr.Tab("👥 Carer Advice"):
+                gr.Markdown("## AI-Powered Carer Guidance")
+                gr.Markdown("Get expert advice and answers for carers")
+            
+                with gr.Row():
+                    with gr.Column(scale=1):
+                        gr.Markdown("### 🤖 General Carer Advice")
+                    
+                        carer_advice_output = gr.Textbox(
+                            label="Carer-Focused Nursing Advice",
+                            interactive=False,
+                            lines=20,
+                            placeholder="Carer-focused advice will appear here after submitting patient information..."
+                        )
+                    
+                        get_carer_advice_btn = gr.Button("Get Carer Advice", variant="primary", size="lg")
+                
+                    with gr.Column(scale=1):
+                        gr.Markdown("### 💬 Carer Questions")
+                        gr.Markdown("Ask questions from the carer's perspective")
+                    
+                        carer_question = gr.Textbox(
+                            label="Carer's Question",
+                            info="Ask questions about caregiving, monitoring, or support",
+                            placeholder="e.g., 'How can I help with pain management?', 'What signs should I watch for?', 'How can I provide emotional support?'",
+                            lines=3
+                        )
+                    
+                        ask_carer_question_btn = gr.Button("Ask AI Nurse (Carer View)", variant="primary", size="lg")
+                    
+                        carer_question_output = gr.Textbox(
+                            label="AI Nurse's Answer (Carer-Focused)",
+                            interactive=False,
+                            lines=15,
+                            placeholder="Carer-focused answers will appear here..."
+                        )
+    
+        # Event handlers
+        submit_btn.click(
+            fn=metrics.instrument("submit", app.submit_patient_info),
+            inputs=[gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, advice_fan_out],
+            outputs=[save_load_status, json_output, nursing_advice_output, advice_fan_out],
+            concurrency_limit=LLM_CONCURRENCY_LIMIT,
+            concurrency_id="submit",
+            api_name="submit"
+        )
+    
+        # Patient Advice Tab
+        get_patient_advice_btn.click(
+            fn=metrics.instrument("patient_advice", app._prefetched_handler("patient_focused_advice")),
+            inputs=[gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, advice_fan_out],
+            outputs=[patient_advice_output],
+            concurrency_limit=LLM_CONCURRENCY_LIMIT,
+            concurrency_id="patient_advice",
+            api_name="patient_advice"
+        )
+    
+        ask_patient_question_btn.click(
+            fn=metrics.instrument("patient_question", app._advice_handler("patient_question_answer")),
+            inputs=[gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, patient_question],
+            outputs=[patient_question_output],
+            concurrency_limit=LLM_CONCURRENCY_LIMIT,
+            concurrency_id="patient_question",
+            api_name="patient_question"
+        )
+    
+        # Carer Advice Tab
+        get_carer_advice_btn.click(
+            fn=metrics.instrument("carer_advice", app._prefetched_handler("carer_focused_advice")),
+            inputs=[gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, advice_fan_out],
+            outputs=[carer_advice_output],
+            concurrency_limit=LLM_CONCURRENCY_LIMIT,
+            concurrency_id="carer_advice",
+            api_name="carer_advice"
+        )
+    
+        ask_carer_question_btn.click(
+            fn=metrics.instrument("carer_question", app._advice_handler("carer_question_answer")),
+            inputs=[gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, carer_question],
+            outputs=[carer_question_output],
+            concurrency_limit=LLM_CONCURRENCY_LIMIT,
+            concurrency_id="carer_question",
+            api_name="carer_question"
+        )
+    
+        # Save/Load functionality
+        save_btn.click(
+            fn=metrics.instrument("save", save_patient_form),
+            inputs=[gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, save_filename, record_versions],
+            outputs=[save_load_status, load_file_dropdown, record_versions],
+            concurrency_limit=LOCAL_CONCURRENCY_LIMIT,
+            concurrency_id="local",
+            api_name="save"
+        )
+    
+        load_search.change(
+            fn=metrics.instrument("search", search_saved_files),
+            inputs=[load_search],
+            outputs=[load_file_dropdown],
+            concurrency_limit=LOCAL_CONCURRENCY_LIMIT,
+            concurrency_id="local"
+        )
+    
+        load_btn.click(
+            fn=metrics.instrument("load", load_patient_form),
+            inputs=[load_file_dropdown, record_versions],
+            outputs=[save_load_status, gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date,
+                     nursing_advice_output, patient_advice_output, carer_advice_output, record_versions],
+            concurrency_limit=LOCAL_CONCURRENCY_LIMIT,
+            concurrency_id="local",
+            api_name="load"
+        )
+    
+        clear_btn.click(
+            fn=metrics.instrument("clear", clear_form),
+            outputs=[gender, age, diagnosis, operation_description, operation_date, treatment_details, treatment_start_date, save_load_status, patient_advice_output, patient_question_output, carer_advice_output, carer_question_output, nursing_advice_output],
+            concurrency_limit=LOCAL_CONCURRENCY_LIMIT,
+            concurrency_id="local"
+        )
+
+    blocks.queue(max_size=QUEUE_MAX_SIZE, default_concurrency_limit=LOCAL_CONCURRENCY_LIMIT)
+    return blocks
+
+def main():
+    """Launch the interface on port 7860"""
+    blocks = build_app()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    # Precompute advice each night for patients moving into a new recovery phase
+    phase_scheduler.start_from_env()
+    if metrics.ENABLED:
+        # Serve /metrics for Prometheus next to the Gradio app
+        import uvicorn
+        from fastapi import FastAPI
+
+        server = metrics.add_route(FastAPI())
+        server = gr.mount_gradio_app(server, blocks, path="/", show_error=True)
+        uvicorn.run(server, host="0.0.0.0", port=7860)
+    else:
+        blocks.launch(
+            server_name="0.0.0.0",
+            server_port=7860,
+            share=False,
+            show_error=True
+        )
+
+if __name__ == "__main__":
+    main()